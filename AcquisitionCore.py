@@ -0,0 +1,549 @@
+import json
+import threading
+import time
+from time import perf_counter_ns
+
+import numpy as np
+
+from CRC16 import crc16_ccitt, crc16_check_batch
+from Capture import CaptureWriter
+from Correlator import AckCorrelator, CommandPipeline, CommandError, DEFAULT_POLICY
+from Instrumentation import Instrumentation, SPAN_DECODE, SPAN_CRC, SPAN_SAVE, COUNT_CRC_ERROR
+from DataExport import SCurveStreamWriter, finalize_scurve_stream, export_columns_to_xlsx
+from ReceiveEngine import UDPReceiveEngine
+from RunJournal import RunJournal
+from ScanEngine import SCurveScanEngine
+from SpectrumModel import HistogramModel
+from SpectrumStore import SpectrumStore
+from TrimTable import trim_commands
+from Protocol import (decode_frame, build_instruction, ctrl_reg_param, channel_threshold_param, CRC_OFFSET, INSTRUCTION_LENGTH,
+                      SYNC_TRIGGER, FRAME_ACK, FRAME_SHORT, FRAME_LONG, FRAME_CLUSTER, FRAME_HIT, FRAME_SYNC, FRAME_SYNC_ERROR,
+                      ERROR_LENGTH, ERROR_HEADER, ERROR_SHORT_VERIFY, ACK_OK, ACK_SN_GAP, ACK_BUSY, ACK_CRC_ERROR,
+                      MODE_SHORT, MODE_LONG, MODE_CLUSTER, MODE_HIT, CMD_SYSTEM, CMD_ACQUIRE, CMD_RESET_COUNTS, CMD_CTRL_REG,
+                      CMD_THRESHOLD, CMD_ACQUIRE_TIME, CMD_SCALE_THRESHOLD, CMD_SCALE_INTERVAL, CMD_CHANNEL_THRESHOLD, PARAM_FPGA_RESET,
+                      PARAM_READ_CTRL_REG, PARAM_READ_THRESHOLD, PARAM_READ_ACQUIRE_TIME, PARAM_ACQUIRE, PARAM_RESET_COUNTS,
+                      THRESHOLD_MAX)
+
+DATA_KINDS = (FRAME_SHORT, FRAME_LONG, FRAME_CLUSTER, FRAME_HIT)
+ACCEPTED_ACK_CODES = (ACK_OK, ACK_SN_GAP, ACK_BUSY, ACK_CRC_ERROR)  # 与 AckCodeVerify 返回 0000 的应答码一致，其余表示指令未执行
+SN_MAX = 0XFFFF  # 指令帧序号回绕到1，0留给同步触发
+CRC_BATCH_MIN = 16  # 一批中带CRC的数据包不少于此数时按批向量化校验，更少时逐包查表更快
+
+# 接收端的错误提示
+ERROR_MESSAGES = {
+    ERROR_LENGTH: "数据长度不正确",
+    ERROR_HEADER: "应答包头错误",
+    ERROR_SHORT_VERIFY: "短包校验失败",
+}
+
+# SaveConfig 配置文件中控制寄存器各字段的文本与取值，与界面下拉框中的文本一致
+TEST_CHANNELS = {"ch1": 0B00, "ch9": 0B01, "ch17": 0B10, "ch25": 0B11}
+FORMING_TIMES = {"40ns": 0B00, "80ns": 0B01, "120ns": 0B10, "160ns": 0B11}
+SERIAL_PORT_RATES = {"Debug模式": 0B00_00, "正常": 0B00_01}
+ENABLE_MODES = {"禁止使能": 0B0, "使能": 0B1}
+DATA_MODES = {MODE_SHORT: 0B00, MODE_LONG: 0B01, MODE_CLUSTER: 0B10, MODE_HIT: 0B11}
+WORKING_MODES = {"正常取数": 0B0, "电子学刻度": 0B1}
+
+
+def ack_accepted(ack_code):  # 应答码表示指令已执行
+    return ack_code in ACCEPTED_ACK_CODES
+
+
+def ctrl_reg_from_settings(settings):   # 由 SaveConfig 格式的配置得到控制寄存器的命令参数
+    working_mode = (WORKING_MODES.get(settings.get("WorkingMode"), 0) << 1) | ENABLE_MODES.get(settings.get("TriggerReceiveEnable"), 0)
+    return ctrl_reg_param(TEST_CHANNELS.get(settings.get("TestChannel"), 0),
+                          FORMING_TIMES.get(settings.get("FormingTime"), 0),
+                          SERIAL_PORT_RATES.get(settings.get("SerialPortRate"), 0),
+                          ENABLE_MODES.get(settings.get("TestSignalEnableMode"), 0),
+                          DATA_MODES.get(settings.get("AcquireMode"), 0),
+                          working_mode)
+
+
+def load_settings(path):    # 读取 SaveConfig 保存的配置文件
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)
+
+
+def period_block(all_data):  # 周期采集的结果，每个周期一行，保存时转置为每个周期一列
+    block = np.array(all_data, dtype=np.uint32)
+    titles = [f"周期 {i + 1}" for i in range(len(all_data))]
+    return block, titles
+
+
+class AcquisitionError(Exception):  # 同步触发或采集未完成
+    pass
+
+
+class ScanSession:  # S曲线扫描中状态机调用的各步操作，每个DAC步的能谱逐步写入中间文件，结束后生成Excel
+    def __init__(self, core, xlsx_path, adaptive=None, log=None, on_step=None):
+        self.core = core
+        self.xlsx_path = xlsx_path
+        self.adaptive = adaptive  # 自适应扫描时为 AdaptiveSteps，记录已测数据以决定下一步DAC
+        self.log = log if log is not None else (lambda message: None)
+        self.on_step = on_step  # 每保存一步调用 on_step(dac, counts)
+        self.writer = None
+        self.engine = None
+        self.recovered = 0  # 上次异常中断遗留、已转为Excel的步数
+        self.steps = 0  # 生成Excel时写入的步数
+        self.error = None  # 生成Excel失败的原因，数据保留在中间文件中
+
+    @property
+    def stream_path(self):
+        return self.writer.stream_path if self.writer is not None else None
+
+    def open(self):  # 打开中间文件，上次异常中断遗留的数据先转为Excel
+        self.recovered = finalize_scurve_stream(self.xlsx_path)
+        self.writer = SCurveStreamWriter(self.xlsx_path).open()
+        return self
+
+    def configure_threshold(self, dac_value):
+        self.log(f"当前DAC阈值： {dac_value}")
+        return self.core.set_threshold(dac_value)
+
+    def reset_counts(self):
+        return self.core.reset_counts()
+
+    def trigger(self):
+        self.core.trigger()
+
+    def read_data(self):
+        return self.core.read_data()
+
+    def persist(self, dac_value):   # 将当前DAC步的能谱追加到中间文件
+        last_spectrum = self.core.store.last()  # 最近一次采集的各通道计数
+        if last_spectrum is None or self.writer is None:
+            self.log("没有可保存的能谱数据")
+            return
+        self.writer.append_step(dac_value, last_spectrum.tolist())
+        if self.core.journal is not None:
+            self.core.journal.step(self.writer.steps, dac_value, last_spectrum)
+        if self.adaptive is not None:
+            self.adaptive.record(dac_value, last_spectrum)
+        if self.on_step is not None:
+            self.on_step(dac_value, last_spectrum)
+
+    def finalize(self):  # 扫描结束（包括中途停止）后一次性生成Excel，返回写入的步数
+        if self.writer is None:
+            return self.steps
+        stream_path = self.writer.stream_path
+        try:
+            with self.core.instruments.span(SPAN_SAVE):
+                self.steps = self.writer.finalize(sort_by_dac=self.adaptive is not None)  # 自适应扫描的步骤不按顺序，按DAC排列后与均匀扫描的列布局一致
+        except Exception as e:
+            self.error = "Excel生成失败，数据保留在 %s：%s" % (stream_path, e)
+        finally:
+            self.writer = None
+        return self.steps
+
+
+class AcquisitionCore:  # 不依赖界面和Qt的采集核心：连接、指令组合与发送、应答匹配、数据包解码、S曲线扫描和保存，界面和命令行共用
+    # 回调均在调用 handle_frame/process/poll 的线程中执行，未设置时忽略：
+    # log(message)、on_send(data)、on_ack(frame, instruction)、on_data(frame)、on_sync(flag)、on_retry(future)、on_failed(future)
+    def __init__(self, mode=MODE_SHORT, policy=DEFAULT_POLICY, crc_check=True, retain_rows=100_000, spill_path=None,
+                 clock=time.monotonic):
+        self.mode = mode  # 采集模式，决定数据包的解码方式
+        self.crc_check = crc_check  # 数据包CRC校验使能
+        self.clock = clock
+        self.sn = 1  # 下一条指令的指令帧序号
+        self.server_addr = None
+        self.engine = None
+        self.capture = None
+        self.journal = None  # 运行日志，记录每条指令、应答、数据包和扫描步
+        self.instruments = Instrumentation()  # 热路径耗时与数据包计数，默认关闭
+        self.model = HistogramModel()  # 最新一次的能谱
+        self.store = SpectrumStore(max_rows=retain_rows, spill_path=spill_path)  # 全部能谱及元数据
+        self.store.on_drop = self._on_store_drop
+        self.correlator = AckCorrelator(self._resend, policy, on_retry=self._on_retry, on_failed=self._on_failed, clock=clock)
+        self.pipeline = None  # 正在进行的通道阈值批量配置
+        self.scan = None  # 正在运行的扫描状态机
+        self.current_dac = -1  # 最近一次配置的DAC阈值，记录到能谱存储的元数据中
+        self.sync_flag = 0  # 最近一次同步触发的应答：0 未应答或异常，1 探测器工作异常，2 成功
+        self.last_instruction = None  # 上一条发送的指令，应答没有匹配指令时按它区分
+        self.device_id = None
+        self.ack_sn = None
+        self.crc_errors = 0
+        self.log = None
+        self.on_send = None
+        self.on_ack = None
+        self.on_data = None
+        self.on_sync = None
+        self.on_retry = None
+        self.on_failed = None
+        self._wake = threading.Event()
+
+    # 连接
+    def connect(self, server_addr, local_port=8081, host='0.0.0.0', capture_path=None, notify=None, on_error=None,
+                on_batch=None, batch_window=0.01, batch_frames=256, start=True, journal_path=None):
+        # 绑定本地端口，返回接收引擎；start 为 False 时由调用者在自己的线程中运行 engine.serve_forever
+        # journal_path 为运行日志文件，已存在时抛出 FileExistsError
+        self.close()
+        capture = CaptureWriter(capture_path).open() if capture_path else None
+        engine = UDPReceiveEngine(local_port, host, notify=notify or self._wake.set, on_error=on_error or self._log,
+                                  on_batch=on_batch, batch_window=batch_window, batch_frames=batch_frames, capture=capture,
+                                  instruments=self.instruments)
+        journal = None
+        try:
+            engine.open()
+            journal = RunJournal(journal_path).open() if journal_path else None
+        except OSError:
+            engine.close()
+            if capture is not None:
+                capture.close()
+            raise
+        self.engine = engine
+        self.capture = capture
+        self.journal = journal
+        self.server_addr = server_addr
+        if start:
+            engine.start()
+        return engine
+
+    def close(self):    # 停止接收，关闭原始数据包记录，取消等待中的指令，返回接收统计，未连接时返回None
+        if self.pipeline is not None:
+            self.pipeline.cancel()
+        if self.scan is not None:
+            self.scan.stop()
+        stats = None
+        if self.engine is not None:
+            stats = self.engine.stats()
+            self.engine.close()
+            self.engine = None
+        if self.capture is not None:
+            self.capture.close()
+            self.capture = None
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+        self.correlator.clear()  # 连接断开后不再等待应答
+        return stats
+
+    @property
+    def connected(self):
+        return self.engine is not None
+
+    def set_mode(self, mode):
+        self.mode = mode
+
+    # 发送
+    def instruction(self, command, param):  # 用当前指令帧序号组合指令帧
+        return build_instruction(self.sn, command, param)
+
+    def send(self, data, policy=None, expect_ack=True):  # 发送指令，返回等待应答的 CommandFuture；不需要应答时返回None，未连接时抛出 OSError
+        self._transmit(data)
+        self.sn = self.sn + 1 if self.sn < SN_MAX else 1
+        if expect_ack and len(data) == INSTRUCTION_LENGTH:  # 完整的指令帧，按指令帧序号等待应答
+            return self.correlator.register(data, policy)
+        return None
+
+    def command(self, command, param, policy=None):  # 组合并发送一条指令
+        return self.send(self.instruction(command, param), policy)
+
+    def _transmit(self, data):
+        if self.engine is None:
+            raise OSError("套接字未绑定")
+        self.engine.sendto(data, self.server_addr)
+        self.last_instruction = bytes(data)
+        if self.journal is not None:
+            self.journal.send(data)
+        if self.on_send is not None:
+            self.on_send(data)
+
+    def _resend(self, data):    # 超时重发，指令帧序号不变
+        try:
+            self.engine.sendto(data, self.server_addr)
+        except (OSError, AttributeError) as e:
+            self._log("重发失败，套接字未绑定: %s" % e)
+            return
+        if self.journal is not None:
+            self.journal.send(data, resend=True)
+
+    # 指令
+    def loop_test(self, value):  # 指令回环测试，应答参数的低字节为 value
+        return self.command(CMD_SYSTEM, value & 0XFF)
+
+    def fpga_reset(self):
+        return self.command(CMD_SYSTEM, PARAM_FPGA_RESET)
+
+    def read_ctrl_reg(self):    # 应答参数为控制寄存器的值
+        return self.command(CMD_SYSTEM, PARAM_READ_CTRL_REG)
+
+    def read_threshold(self):
+        return self.command(CMD_SYSTEM, PARAM_READ_THRESHOLD)
+
+    def read_acquire_time(self):
+        return self.command(CMD_SYSTEM, PARAM_READ_ACQUIRE_TIME)
+
+    def configure_ctrl_reg(self, param):    # param 由 ctrl_reg_param 或 ctrl_reg_from_settings 得到
+        return self.command(CMD_CTRL_REG, param)
+
+    def set_threshold(self, dac_value):
+        if not 0 <= dac_value <= THRESHOLD_MAX:
+            raise ValueError("阈值超出范围")
+        self.current_dac = dac_value
+        return self.command(CMD_THRESHOLD, dac_value)
+
+    def set_acquire_time(self, acquire_time):   # 单位0.1ms
+        if not 0 <= acquire_time <= 0XFFFF:
+            raise ValueError("采集时间超出范围")
+        return self.command(CMD_ACQUIRE_TIME, acquire_time)
+
+    def set_scale_threshold(self, value):   # 刻度DAC
+        if not 0 <= value <= THRESHOLD_MAX:
+            raise ValueError("刻度超出范围")
+        return self.command(CMD_SCALE_THRESHOLD, value)
+
+    def set_scale_interval(self, value):
+        if not 0 <= value <= 0XFFFF:
+            raise ValueError("刻度时间间隔超出范围")
+        return self.command(CMD_SCALE_INTERVAL, value)
+
+    def reset_counts(self):
+        return self.command(CMD_RESET_COUNTS, PARAM_RESET_COUNTS)
+
+    def read_data(self):    # 应答为数据包
+        return self.command(CMD_ACQUIRE, PARAM_ACQUIRE)
+
+    def channel_threshold(self, channel, value):    # 单通道阈值微调，通道号1-64，阈值0-31
+        return self.command(CMD_CHANNEL_THRESHOLD, channel_threshold_param(channel, value))
+
+    def trigger(self):  # 同步控制触发，不占用指令帧序号，中间板以同步应答回复
+        self.sync_flag = 0
+        self._transmit(SYNC_TRIGGER)
+
+    def apply_trims(self, table, channels=None, window=8, on_finished=None):    # 滑动窗口批量下发通道阈值，channels 为None时全部下发
+        if self.pipeline is not None and self.pipeline.running:
+            raise RuntimeError("通道阈值正在配置中")
+        commands = trim_commands(table, channels)  # 一次算出全部指令参数，超出范围时抛出 ValueError
+        self.pipeline = CommandPipeline(self._pipeline_send, window, on_finished, clock=self.clock)
+        return self.pipeline.submit(commands)
+
+    def _pipeline_send(self, command):  # command 为命令码与命令参数组成的六位十六进制字符串
+        value = int(command, 16)
+        try:
+            return self.command(value >> 16, value & 0XFFFF)
+        except OSError as e:
+            self._log("套接字未绑定，请检查连接: %s" % e)
+            return None
+
+    # 接收
+    def decode(self, data):
+        if not self.instruments.enabled:
+            return decode_frame(data, self.mode)
+        started = perf_counter_ns()
+        frame = decode_frame(data, self.mode)
+        self.instruments.record(SPAN_DECODE, perf_counter_ns() - started)
+        return frame
+
+    def verify_batch(self, frames, decoded):    # 按批校验已解码的一批数据包的CRC，返回与 frames 对应的结果，None 表示交给 handle_frame 逐包校验
+        results = [None] * len(frames)
+        if not self.crc_check:
+            return results
+        indices = [i for i, frame in enumerate(decoded) if frame.kind in DATA_KINDS and frame.crc is not None]
+        if len(indices) < CRC_BATCH_MIN:
+            return results
+        started = perf_counter_ns() if self.instruments.enabled else 0
+        checked = crc16_check_batch([frames[i] for i in indices], CRC_OFFSET[decoded[indices[0]].kind])  # 同一采集模式的数据包长度和CRC位置相同
+        for i, ok in zip(indices, checked):
+            results[i] = bool(ok)
+        if started:
+            self.instruments.record(SPAN_CRC, (perf_counter_ns() - started) // len(indices), len(indices))  # 按每个数据包平均
+        return results
+
+    def handle_frames(self, frames):    # 处理一批数据包：逐个解码，数据包的CRC按批校验，再逐个分发，返回处理的数据包数
+        decoded = [self.decode(data) for data in frames]
+        for data, frame, crc_ok in zip(frames, decoded, self.verify_batch(frames, decoded)):
+            self.handle_frame(data, frame, crc_ok)
+        return len(frames)
+
+    def handle_frame(self, data, frame=None, crc_ok=None):   # 解码一个数据包并分发，返回解码结果；调用者已解码或已校验CRC时传入 frame、crc_ok
+        instruments = self.instruments
+        started = perf_counter_ns() if instruments.enabled else 0  # 未启用性能统计时为0，以下不计时
+        frame = self.decode(data) if frame is None else frame
+        decoded = perf_counter_ns() if started else 0
+        kind = frame.kind
+        journal = self.journal
+        if kind == FRAME_ACK:
+            if journal is not None:
+                journal.ack(frame)
+            self._handle_ack(frame)
+        elif kind in DATA_KINDS:
+            if crc_ok is None:
+                crc_ok = True
+                if self.crc_check and frame.crc is not None:    # 全零数据包不带CRC，不做校验
+                    crc_ok = crc16_ccitt(data[2:CRC_OFFSET[kind]]) == frame.crc
+                    if started:
+                        instruments.record(SPAN_CRC, perf_counter_ns() - decoded)
+            if journal is not None:
+                journal.data(data, kind, crc_ok)
+            if crc_ok:
+                self._handle_data(frame)
+            else:
+                self.crc_errors += 1
+                if started:
+                    instruments.count(COUNT_CRC_ERROR)
+                self._log("CRC校验失败")
+        elif kind == FRAME_SYNC:
+            if journal is not None:
+                journal.sync(frame)
+            self.sync_flag = frame.flag  # 1 为 00 00 00 00 00，2 为 22 22 22 22 22
+            if frame.flag == 0:
+                self._log("同步触发指令应答异常")
+            if self.scan is not None:
+                self.scan.on_sync(frame.flag)
+            if self.on_sync is not None:
+                self.on_sync(frame.flag)
+        elif kind == FRAME_SYNC_ERROR:
+            if journal is not None:
+                journal.sync(frame)
+            self._log("中间板未能收到正确的同步触发应答信号，请再次触发或停机检查")
+        else:
+            if journal is not None:
+                journal.error(frame.reason)
+            if frame.reason in ERROR_MESSAGES:
+                self._log(ERROR_MESSAGES[frame.reason])
+        if started:
+            instruments.frame(frame, started, decoded)
+        return frame
+
+    def _handle_ack(self, frame):   # 应答序号与指令序号匹配，应答码表示未执行时判为失败
+        pending = self.correlator.pending.get(frame.sn)  # 与应答序号匹配的指令，没有时按上一条发送的指令区分
+        instruction = pending.data if pending is not None else self.last_instruction
+        self.device_id = frame.device_id
+        self.ack_sn = frame.sn
+        if self.on_ack is not None:
+            self.on_ack(frame, instruction)
+        if ack_accepted(frame.ack_code):
+            self.correlator.resolve(frame.sn, frame)
+        else:
+            self.correlator.reject(frame.sn, frame, "指令 %d 未执行，应答码 %02X" % (frame.sn, frame.ack_code))
+
+    def _handle_data(self, frame):  # 数据包写入能谱存储并更新能谱模型，读数指令的应答为数据包
+        self.device_id = frame.device_id
+        self.ack_sn = frame.sn
+        accepted = ack_accepted(frame.ack_code)
+        if accepted:
+            self.store.append(frame.counts, self.current_dac, frame.kind, frame.sn)
+            self.model.update(frame.counts)
+        if self.on_data is not None:
+            self.on_data(frame)
+        if accepted:
+            self.correlator.resolve(frame.sn, frame)
+
+    def poll(self):  # 定时调用，处理指令超时重发和扫描状态机的等待
+        self.correlator.poll()
+        if self.scan is not None:
+            self.scan.poll()
+
+    # 不使用界面时的事件循环
+    def process(self, timeout=0.0):  # 等待新数据包或超时，处理接收到的全部数据包并检查超时，返回处理的数据包数
+        if self._wake.wait(timeout):
+            self._wake.clear()
+        handled = self.engine.consume_batch(self.handle_frames) if self.engine is not None else 0
+        self.poll()
+        return handled
+
+    def wait(self, future, timeout=None, interval=0.005):   # 处理数据包直到指令完成，返回是否成功应答
+        if future is None:
+            return False
+        deadline = None if timeout is None else self.clock() + timeout
+        while not future.done() and (deadline is None or self.clock() < deadline):
+            self.process(interval)
+        return future.succeeded
+
+    def sleep(self, seconds, interval=0.005):   # 等待期间继续处理数据包
+        deadline = self.clock() + seconds
+        while self.clock() < deadline:
+            self.process(min(interval, max(0.0, deadline - self.clock())))
+
+    def call(self, future, timeout=None):  # 等待指令应答并返回应答包，失败时抛出 CommandError
+        if not self.wait(future, timeout):
+            raise CommandError(getattr(future, 'error', None) or "指令未收到应答")
+        return future.frame
+
+    def acquire_once(self, acquire_ms, slack_ms=2000, max_retriggers=1):    # 清零、同步触发、等待采集完成后读数，返回各通道计数
+        self.call(self.reset_counts())
+        for _ in range(max_retriggers + 1):
+            self.trigger()
+            triggered_at = self.clock()
+            deadline = triggered_at + (acquire_ms + slack_ms) / 1000
+            while self.sync_flag == 0 and self.clock() < deadline:
+                self.process(0.005)
+            if self.sync_flag == 1:
+                raise AcquisitionError("探测器能谱采集工作异常，建议检查")
+            if self.sync_flag == 2:
+                break
+        else:
+            raise AcquisitionError("中间板未能收到正确应答信号，建议检查")
+        self.sleep(triggered_at + acquire_ms / 1000 - self.clock())  # 采集完成后立即读数
+        self.call(self.read_data())
+        return self.store.last().copy()
+
+    def apply_settings(self, settings, timeout=None):  # 按 SaveConfig 格式的配置切换采集模式，依次下发控制寄存器、阈值、采集时间和刻度参数，失败时抛出 CommandError
+        self.set_mode(settings.get("AcquireMode") or self.mode)
+        self.call(self.configure_ctrl_reg(ctrl_reg_from_settings(settings)), timeout)
+        for key, action in (("Threshold", self.set_threshold), ("AcquireTime", self.set_acquire_time),
+                            ("ScaleThresholdStr", self.set_scale_threshold), ("ScaleTimeInterval", self.set_scale_interval)):
+            value = str(settings.get(key, "")).strip()  # 界面中未填写的参数不下发
+            if value:
+                self.call(action(int(value)), timeout)
+
+    # 扫描
+    def start_scan(self, steps, acquire_ms, xlsx_path, adaptive=None, log=None, on_step=None, on_finished=None, **engine_options):
+        # 开始S曲线扫描，返回 ScanSession；steps 依次给出DAC值，自适应扫描时与 adaptive 为同一个 AdaptiveSteps
+        # 扫描结束后生成Excel，再调用 on_finished(state, session)
+        if self.scan is not None and self.scan.running:
+            raise RuntimeError("S曲线正在测量中")
+        session = ScanSession(self, xlsx_path, adaptive, log, on_step).open()
+
+        def finished(state):
+            self.scan = None
+            session.finalize()
+            if on_finished is not None:
+                on_finished(state, session)
+
+        session.engine = SCurveScanEngine(session, steps, acquire_ms, log=log, on_finished=finished, clock=self.clock,
+                                          **engine_options)
+        self.scan = session.engine
+        session.engine.start()
+        return session
+
+    def stop_scan(self):
+        if self.scan is not None:
+            self.scan.stop()
+
+    def run_scan(self, steps, acquire_ms, xlsx_path, adaptive=None, log=None, on_step=None, **engine_options):   # 阻塞运行S曲线扫描直到结束
+        result = {}
+        session = self.start_scan(steps, acquire_ms, xlsx_path, adaptive, log, on_step,
+                                  lambda state, session: result.setdefault("state", state), **engine_options)
+        while "state" not in result:
+            self.process(0.005)
+        return result["state"], session
+
+    # 保存
+    def export_periods(self, xlsx_path, all_data):  # 周期采集的结果保存为Excel，每个周期一列，返回 (写入行数, 耗时)
+        block, titles = period_block(all_data)
+        with self.instruments.span(SPAN_SAVE):
+            return export_columns_to_xlsx(xlsx_path, block, titles)
+
+    def perf_stats(self):   # 性能统计，附带接收引擎、指令应答和运行日志的统计，可直接保存为JSON
+        extra = {"commands": self.correlator.stats(), "crc_errors": {"total": self.crc_errors}}
+        if self.engine is not None:
+            extra["receive"] = self.engine.stats()
+        if self.journal is not None:
+            extra["journal"] = self.journal.stats()
+        return self.instruments.snapshot(extra)
+
+    def _on_store_drop(self, max_rows):
+        self._log("能谱存储已超过保留的 %d 行，未设置溢出文件，开始丢弃最早的数据" % max_rows)
+
+    def _on_retry(self, future):
+        if self.on_retry is not None:
+            self.on_retry(future)
+
+    def _on_failed(self, future):
+        if self.on_failed is not None:
+            self.on_failed(future)
+
+    def _log(self, message):
+        if self.log is not None:
+            self.log(message)
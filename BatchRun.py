@@ -0,0 +1,222 @@
+import argparse
+import datetime
+import json
+import os
+import sys
+import time
+
+from AcquisitionCore import AcquisitionCore, AcquisitionError, load_settings
+from Correlator import CommandError, RetryPolicy
+from DataExport import PeriodStreamWriter, finalize_period_stream
+from Profiling import RunProfiler, PROFILE_MODES
+from Protocol import MODE_SHORT
+from ScanEngine import AdaptiveSteps, STATE_DONE
+
+# 无界面批量运行：读取界面 SaveConfig 保存的配置文件，下发配置后进行S曲线扫描或周期采集，结果逐步写入磁盘
+# python BatchRun.py 配置.json --board 192.168.1.10:8080 scan --step 2 --length 200
+# python BatchRun.py 配置.json --board 192.168.1.10:8080 --local-port 8082 period --count 100 --interval 1
+# 多块开发板可以各自用不同的 --local-port 在独立进程中运行
+
+
+class ProgressReporter:     # 在标准输出打印进度、速率和接收吞吐量
+    def __init__(self, core, label, total=None, unit="步", stream=None, clock=time.monotonic):
+        self.core = core
+        self.label = label
+        self.total = total  # 总步数，未知时为None
+        self.unit = unit
+        self.stream = stream if stream is not None else sys.stdout
+        self.clock = clock
+        self.started_at = clock()
+        self.done = 0
+
+    def step(self, detail=""):
+        self.done += 1
+        elapsed = max(self.clock() - self.started_at, 1e-9)
+        received = self.core.engine.stats()["received"] if self.core.engine is not None else 0
+        line = "[%s] %d" % (self.label, self.done)
+        if self.total:
+            remaining = (self.total - self.done) * elapsed / self.done
+            line += "/%d %s (%.0f%%)，预计剩余 %.0f s" % (self.total, self.unit, 100 * self.done / self.total, remaining)
+        else:
+            line += " %s" % self.unit
+        line += "，%.2f %s/s，接收 %d 包 (%.0f 包/s)" % (self.done / elapsed, self.unit, received, received / elapsed)
+        if detail:
+            line += "，" + detail
+        print(line, file=self.stream, flush=True)
+
+    def summary(self):
+        elapsed = self.clock() - self.started_at
+        stats = self.core.correlator.stats()
+        print("[%s] 完成 %d %s，耗时 %.1f s；指令发送 %d 条，应答 %d 条，重发 %d 次，超时 %d 条"
+              % (self.label, self.done, self.unit, elapsed, stats["sent"], stats["acked"], stats["retries"], stats["timeouts"]),
+              file=self.stream, flush=True)
+
+
+def parse_address(text):    # host:port
+    host, port = text.rsplit(":", 1)
+    return host, int(port)
+
+
+def output_path(settings, args, prefix):    # 默认保存到配置文件中的 FilePath，文件名带时间
+    if args.output:
+        path = args.output
+    else:
+        name = "%s_%s.xlsx" % (prefix, datetime.datetime.now().strftime("%Y%m%d_%H%M%S"))
+        path = os.path.join(settings.get("FilePath") or os.getcwd(), name)
+    return path if path.endswith('.xlsx') else path + '.xlsx'
+
+
+def acquire_ms(settings):   # 采集时间单位为0.1ms
+    return int(settings.get("AcquireTime") or 0) / 10
+
+
+def run_scan(core, settings, args):
+    start = args.start if args.start is not None else int(settings.get("Threshold") or 0)
+    stop = start + args.length
+    if args.adaptive:   # 先粗扫，再在计数变化快的区间加密到 --step
+        adaptive = AdaptiveSteps(start, stop, args.step, args.step * args.coarse_factor)
+        steps, total = adaptive, None
+    else:
+        adaptive = None
+        steps = range(start, stop, args.step)
+        total = len(steps)
+    path = output_path(settings, args, "SCurve")
+    progress = ProgressReporter(core, "S曲线", total)
+    log = (lambda message: print(message, flush=True)) if args.verbose else None  # 每个状态的提示，结束状态和原因总是打印到标准错误
+
+    def on_step(dac_value, counts):
+        progress.step("DAC %d，总计数 %d" % (dac_value, int(counts.sum())))
+
+    result = {}
+    session = core.start_scan(steps, acquire_ms(settings), path, adaptive, log=log, on_step=on_step,
+                              on_finished=lambda state, session: result.setdefault("state", state))
+    if session.recovered:
+        print("已恢复上次中断的 %d 步S曲线数据到 %s" % (session.recovered, path), flush=True)
+    print("S曲线数据逐步写入 %s" % session.stream_path, flush=True)
+    try:
+        while "state" not in result:
+            core.process(0.005)
+    except KeyboardInterrupt:   # 停止后仍生成Excel
+        core.stop_scan()
+        while "state" not in result:
+            core.process(0.005)
+
+    progress.summary()
+    engine = session.engine
+    detail = "" if result["state"] == STATE_DONE else "，停在第 %d 步 DAC %s" % (engine.steps_done + 1, engine.dac)
+    print("S曲线扫描结束（%s）：%s%s" % (result["state"], engine.message, detail), file=sys.stderr, flush=True)
+    if adaptive is not None:
+        print("自适应扫描，均匀扫描需 %d 步" % adaptive.uniform_steps())
+    if session.error is not None:
+        print(session.error, file=sys.stderr)
+        return 1
+    print("%d 步能谱数据已保存到 %s" % (session.steps, path), flush=True)
+    return 0 if result["state"] == STATE_DONE else 1
+
+
+def run_period(core, settings, args):
+    path = output_path(settings, args, "Period")
+    recovered = finalize_period_stream(path)  # 上次异常中断遗留的数据先转为Excel
+    if recovered:
+        print("已恢复上次中断的 %d 个周期数据到 %s" % (recovered, path), flush=True)
+    writer = PeriodStreamWriter(path).open()
+    print("周期数据逐个写入 %s" % writer.stream_path, flush=True)
+    progress = ProgressReporter(core, "周期采集", args.count, "周期")
+    status = 0
+    try:
+        for i in range(args.count):
+            counts = core.acquire_once(acquire_ms(settings), args.slack_ms)
+            writer.append_step(i + 1, counts.tolist())
+            progress.step("总计数 %d" % int(counts.sum()))
+            if i + 1 < args.count:
+                core.sleep(args.interval)
+    except (CommandError, AcquisitionError) as e:
+        print("第 %d 个周期失败，停止周期采集：%s" % (progress.done + 1, e), file=sys.stderr)
+        status = 1
+    except KeyboardInterrupt:
+        status = 130
+    finally:
+        periods = writer.finalize()
+    progress.summary()
+    print("%d 个周期数据已保存到 %s" % (periods, path), flush=True)
+    return status
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="无界面批量S曲线扫描与周期采集")
+    parser.add_argument("config", help="界面 SaveConfig 保存的配置文件")
+    parser.add_argument("--board", required=True, help="开发板地址 host:port，对应界面中的IP地址和UDP服务端端口")
+    parser.add_argument("--local-port", type=int, default=8081, help="本地端口，同时运行多块开发板时各用一个")
+    parser.add_argument("--capture", default=None, help="同时记录原始数据包，可用 Capture.py 离线回放")
+    parser.add_argument("--journal", default=None, help="同时记录运行日志：每条指令、应答、数据包和扫描步，可用 RunJournal.py 按时间查询")
+    parser.add_argument("--timeout-ms", type=int, default=1000, help="指令应答超时")
+    parser.add_argument("--retries", type=int, default=5, help="超时后最多重发的次数")
+    parser.add_argument("--stats-json", default=None, help="启用性能统计，结束时将各阶段耗时直方图和数据包计数保存为JSON")
+    parser.add_argument("--profile", choices=PROFILE_MODES, default=None,
+                        help="剖析本次扫描或周期采集：cprofile 输出 .prof，sample 输出 speedscope 格式，与Excel文件放在同一目录")
+    parser.add_argument("--profile-interval", type=float, default=5.0, help="采样剖析的采样间隔，ms")
+    parser.add_argument("--no-configure", action="store_true", help="不下发配置文件中的控制寄存器、阈值和采集时间")
+    parser.add_argument("--output", default=None, help="Excel文件路径，默认保存到配置文件中的 FilePath")
+    parser.add_argument("--verbose", action="store_true", help="打印每个状态的提示")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    scan = commands.add_parser("scan", help="S曲线扫描")
+    scan.add_argument("--step", type=int, required=True, help="采集步长")
+    scan.add_argument("--length", type=int, required=True, help="采集总长度")
+    scan.add_argument("--start", type=int, default=None, help="阈值初值，默认为配置文件中的 Threshold")
+    scan.add_argument("--adaptive", action="store_true", help="先粗扫，再在计数变化快的区间加密到采集步长")
+    scan.add_argument("--coarse-factor", type=int, default=8, help="粗扫步长为采集步长的倍数")
+
+    period = commands.add_parser("period", help="周期同步触发和读数")
+    period.add_argument("--count", type=int, required=True, help="周期数")
+    period.add_argument("--interval", type=float, default=1.0, help="周期间隔，s")
+    period.add_argument("--slack-ms", type=int, default=2000, help="同步触发应答在采集时间之外的等待时间")
+    args = parser.parse_args(argv)
+
+    settings = load_settings(args.config)
+    core = AcquisitionCore(settings.get("AcquireMode") or MODE_SHORT, RetryPolicy(args.timeout_ms, args.retries))
+    core.instruments.set_enabled(args.stats_json is not None)
+    core.log = lambda message: print(message, file=sys.stderr, flush=True)
+    core.on_failed = lambda future: print(future.error, file=sys.stderr, flush=True)
+    try:
+        core.connect(parse_address(args.board), args.local_port, capture_path=args.capture, journal_path=args.journal)
+    except OSError as e:
+        print("UDP 绑定失败: %s" % e, file=sys.stderr)
+        return 2
+
+    if core.journal is not None:
+        core.journal.note(json.dumps({"config": args.config, "settings": settings}, ensure_ascii=False))
+    try:
+        if not args.no_configure:
+            try:
+                core.apply_settings(settings)
+            except (CommandError, ValueError) as e:
+                print("配置下发失败：%s" % e, file=sys.stderr)
+                return 1
+            print("已下发配置 %s" % args.config, flush=True)
+        run = run_scan if args.command == "scan" else run_period
+        if not args.profile:
+            return run(core, settings, args)
+        args.output = output_path(settings, args, "SCurve" if args.command == "scan" else "Period")  # 剖析结果与数据文件同名
+        profiler = RunProfiler(args.output, args.profile, settings, "S曲线" if args.command == "scan" else "周期采集",
+                               args.profile_interval / 1000).start()
+        try:
+            return run(core, settings, args)
+        finally:
+            for path in profiler.stop():
+                print("剖析结果已保存到 %s" % path, flush=True)
+    finally:
+        if args.stats_json:
+            with open(args.stats_json, 'w', encoding='utf-8') as file:
+                json.dump(core.perf_stats(), file, ensure_ascii=False, indent=2)
+            print("性能统计已保存到 %s" % args.stats_json, flush=True)
+        journal = core.journal
+        stats = core.close()
+        if journal is not None:
+            print("运行日志已记录到 %s，共 %d 条，丢弃 %d 条" % (journal.path, journal.records, journal.dropped), flush=True)
+        if stats is not None:
+            print("共接收 %d 包，丢弃 %d 包，缓冲区最高占用 %d" % (stats["received"], stats["drops"], stats["high_water"]), flush=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,349 @@
+import argparse
+import heapq
+import itertools
+import math
+import random
+import select
+import socket
+import struct
+import sys
+import threading
+import time
+
+from CRC16 import crc16_ccitt
+from Protocol import (FRAME_LENGTH, PACKET_START, ACK_OK, ACK_SN_GAP, ACK_BUSY, ACK_CRC_ERROR, ACK_INVALID,
+                      FRAME_SHORT, FRAME_LONG, FRAME_CLUSTER, FRAME_HIT, CRC_OFFSET, CHANNELS, THRESHOLD_CHANNELS,
+                      SYNC_TRIGGER)
+
+# 模拟开发板：按 InstrCombination 的指令格式解析指令，回复应答包、数据包和同步触发应答，用于无硬件时的测试和压力测试
+_INSTRUCTION = struct.Struct('>HHBBHH')  # 包头，指令帧序号，保留，命令码，命令参数，CRC
+_HEAD = struct.Struct('>HHBBH')  # 包头，序号，设备ID，应答码，应答参数
+DEVICE_ID = 0X01
+TRIM_CENTER = 16
+
+
+def build_ack_frame(sn, ack_code, param=0, device_id=DEVICE_ID):  # 应答包，CRC之后的字节与CRC低字节相同
+    head = _HEAD.pack(PACKET_START, sn, device_id, ack_code, param)
+    crc = crc16_ccitt(head[2:8]).to_bytes(2, 'big')
+    return head + crc + crc[1:] * (FRAME_LENGTH - 10)
+
+
+_COUNTS = {
+    FRAME_SHORT: struct.Struct('>32H'),
+    FRAME_LONG: struct.Struct('>32I'),
+    FRAME_CLUSTER: struct.Struct('>63H'),
+    FRAME_HIT: struct.Struct('>16I'),
+}
+_COUNT_MAX = {FRAME_SHORT: 0XFFFF, FRAME_LONG: 0XFFFFFFFF, FRAME_CLUSTER: 0XFFFF, FRAME_HIT: 0XFFFFFFFF}
+
+
+def build_data_frame(kind, sn, values, ack_code=ACK_OK, device_id=DEVICE_ID):    # 数据包，values 为各通道计数，事例击中为16个32位击中位图
+    body = bytearray(_HEAD.pack(PACKET_START, sn, device_id, ack_code, 0))
+    limit = _COUNT_MAX[kind]
+    body += _COUNTS[kind].pack(*(min(int(v), limit) for v in values))
+    offset = CRC_OFFSET[kind]
+    body += bytes(offset - len(body))
+    body += crc16_ccitt(body[2:offset]).to_bytes(2, 'big')
+    body += body[-1:] * (FRAME_LENGTH - len(body))  # 短包第74位开始与第73位相同
+    return bytes(body)
+
+
+def build_sync_frame(flag):  # 同步触发应答：11×5 之后 22×5 为成功，00×5 为探测器工作异常
+    tail = b'\x22' * 5 if flag == 2 else b'\x00' * 5
+    return (b'\x11' * 5 + tail).ljust(FRAME_LENGTH, b'\x00')
+
+
+def hit_words(counts):  # 将每个通道的击中次数（不超过16）转为16个32位击中位图
+    words = [0] * 16
+    for channel, n in enumerate(counts[:32]):
+        byte, bit = 3 - channel // 8, channel % 8  # 大端字节序，第3字节为通道0-7
+        for w in range(min(int(n), 16)):
+            words[w] |= 1 << (8 * byte + bit)
+    return words
+
+
+class BoardModel:   # 开发板的寄存器与探测器响应，handle 处理一条指令并返回要发送的数据包，不涉及网络
+    def __init__(self, mode=None, seed=0, pulse_rate=1000.0, mu=300.0, mu_spread=20.0, sigma=5.0,
+                 dac_per_trim=1.0, busy_rate=0.0, sync_fail_rate=0.0, frames_per_read=1):
+        self.mode = mode  # None 时按控制寄存器的数据模式回复短包或长包
+        self.rng = random.Random(seed)
+        self.pulse_rate = pulse_rate  # 每个通道每秒的测试脉冲数
+        self.channel_mu = [mu + self.rng.gauss(0, mu_spread) for _ in range(THRESHOLD_CHANNELS)]  # 微调值为中间值时各通道的50%点
+        self.sigma = sigma  # 噪声宽度（DAC）
+        self.dac_per_trim = dac_per_trim
+        self.busy_rate = busy_rate  # 回复 F3 的概率
+        self.sync_fail_rate = sync_fail_rate  # 同步触发回复异常的概率
+        self.frames_per_read = frames_per_read  # 每次读数回复的数据包数
+        self.reset()
+        self.instructions = 0
+        self.acks = {code: 0 for code in (ACK_OK, ACK_SN_GAP, ACK_BUSY, ACK_CRC_ERROR, ACK_INVALID)}
+
+    def reset(self):    # 寄存器恢复上电状态
+        self.ctrl_reg = 0
+        self.threshold = 0
+        self.acquire_time = 10000  # 采集时间，AcquireTime/10 ms
+        self.scale_threshold = 0
+        self.scale_interval = 0
+        self.trims = [TRIM_CENTER] * THRESHOLD_CHANNELS
+        self.expected_sn = None  # 下一条指令应有的序号
+        self.last_sn = None
+        self.counts = [0] * THRESHOLD_CHANNELS
+
+    @property
+    def data_kind(self):
+        if self.mode is not None:
+            return self.mode
+        return FRAME_LONG if (self.ctrl_reg >> 2) & 0b11 == 0b01 else FRAME_SHORT
+
+    def channel_mean(self, channel):    # 当前阈值下一次采集的期望计数
+        mu = self.channel_mu[channel] + self.dac_per_trim * (self.trims[channel] - TRIM_CENTER)
+        pulses = self.pulse_rate * self.acquire_time / 10 / 1000
+        return pulses * 0.5 * math.erfc((self.threshold - mu) / (math.sqrt(2) * self.sigma))
+
+    def acquire(self):  # 同步触发后完成一次采集，计数带泊松涨落（正态近似）
+        for channel in range(THRESHOLD_CHANNELS):
+            mean = self.channel_mean(channel)
+            self.counts[channel] += max(0, round(self.rng.gauss(mean, math.sqrt(mean)))) if mean > 0 else 0
+
+    def data_frames(self, sn):
+        kind = self.data_kind
+        channels = CHANNELS[kind]
+        counts = (self.counts * 2)[:channels]
+        values = hit_words(counts) if kind == FRAME_HIT else counts
+        return [build_data_frame(kind, sn, values) for _ in range(self.frames_per_read)]
+
+    def handle(self, data):  # 处理一条指令，返回要回复的数据包列表
+        if bytes(data[:10]) == SYNC_TRIGGER:
+            if self.rng.random() < self.sync_fail_rate:
+                return [build_sync_frame(1)]
+            self.acquire()
+            return [build_sync_frame(2)]
+        if len(data) != 10:
+            return []
+        start, sn, _, command, param, crc = _INSTRUCTION.unpack(bytes(data))
+        if start != PACKET_START:
+            return []
+        self.instructions += 1
+        if crc16_ccitt(data[2:8]) != crc:
+            return [self._ack(sn, ACK_CRC_ERROR, param)]
+        if self.busy_rate and self.rng.random() < self.busy_rate:
+            return [self._ack(sn, ACK_BUSY, param)]
+
+        code = ACK_OK
+        if self.expected_sn is not None and sn not in (self.expected_sn, self.last_sn):  # 重发的指令序号与上一条相同
+            code = ACK_SN_GAP
+        self.last_sn = sn
+        self.expected_sn = sn + 1 if sn < 0XFFFF else 1
+
+        reply = self.execute(sn, command, param, code)
+        if reply is None:
+            return [self._ack(sn, ACK_INVALID, param)]
+        return reply
+
+    def execute(self, sn, command, param, code):     # 执行指令，无法识别时返回None
+        if command == 0X01:
+            sub = param >> 8
+            if sub == 0X00:  # 指令回环测试
+                return [self._ack(sn, code, param & 0XFF)]
+            if sub == 0X01:  # FPGA复位
+                self.reset()
+                return [self._ack(sn, code, param)]
+            if sub == 0X02:
+                return [self._ack(sn, code, self.ctrl_reg)]
+            if sub == 0X04:
+                return [self._ack(sn, code, self.threshold)]
+            if sub == 0X06:
+                return [self._ack(sn, code, self.acquire_time)]
+            return None
+        if command == 0X02:
+            if param >> 14 == 0b11:  # 单通道阈值微调
+                self.trims[(param >> 8) & 0X3F] = param & 0X1F
+                return [self._ack(sn, code, param)]
+            if param == 0X0100:  # 采集数据，以数据包应答
+                return self.data_frames(sn)
+            return None
+        if command == 0X03:  # 计数复位
+            self.counts = [0] * THRESHOLD_CHANNELS
+        elif command == 0X04:
+            self.ctrl_reg = param
+        elif command == 0X05:
+            self.threshold = param
+        elif command == 0X06:
+            self.acquire_time = param
+        elif command == 0X07:
+            self.scale_threshold = param
+        elif command == 0X08:
+            self.scale_interval = param
+        else:
+            return None
+        return [self._ack(sn, code, param)]
+
+    def _ack(self, sn, code, param):
+        self.acks[code] += 1
+        return build_ack_frame(sn, code, param)
+
+
+class SimulatorServer:  # 监听UDP端口，把 BoardModel 的回复按设定的丢包、乱序和延迟发回
+    def __init__(self, board, port=8080, host='0.0.0.0', loss=0.0, reorder=0.0, latency_ms=0.0, jitter_ms=0.0,
+                 stream_rate=0.0, stream_target=None, seed=0):
+        self.board = board
+        self.port = port
+        self.host = host
+        self.loss = loss  # 丢包概率
+        self.reorder = reorder  # 乱序概率：被选中的数据包额外延迟，落在后面的数据包之后
+        self.latency_s = latency_ms / 1000
+        self.jitter_s = jitter_ms / 1000
+        self.stream_rate = stream_rate  # 不经指令持续发送数据包的速率（包/秒），用于接收端压力测试
+        self.stream_target = stream_target  # 持续发送的目标地址，None 时发往最近一次发指令的地址
+        self.rng = random.Random(seed)
+        self.socket = None
+        self.queue = []  # (发送时间, 序号, 数据, 地址)
+        self.sequence = itertools.count()
+        self.sent = 0
+        self.dropped = 0
+        self.streamed = 0
+        self.client = None
+        self.thread = None
+        self._stop_event = threading.Event()
+
+    def open(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind((self.host, self.port))
+        sock.setblocking(False)
+        self.socket = sock
+        return sock
+
+    def schedule(self, data, addr, now):    # 按丢包、延迟和乱序设定排队发送
+        if self.loss and self.rng.random() < self.loss:
+            self.dropped += 1
+            return
+        delay = self.latency_s + (self.rng.uniform(0, self.jitter_s) if self.jitter_s else 0.0)
+        if self.reorder and self.rng.random() < self.reorder:
+            delay += max(self.latency_s, 0.002) * 2
+        heapq.heappush(self.queue, (now + delay, next(self.sequence), data, addr))
+
+    def serve_forever(self):
+        sock = self.socket if self.socket is not None else self.open()
+        stream_interval = 1 / self.stream_rate if self.stream_rate else None
+        next_stream = time.monotonic()
+        stream_sn = 0
+        while not self._stop_event.is_set():
+            now = time.monotonic()
+            timeout = 0.05
+            if self.queue:
+                timeout = min(timeout, max(0.0, self.queue[0][0] - now))
+            if stream_interval is not None:
+                timeout = min(timeout, max(0.0, next_stream - now))
+            try:
+                readable, _, _ = select.select([sock], [], [], timeout)
+            except (OSError, ValueError):
+                break
+
+            while readable:
+                try:
+                    data, addr = sock.recvfrom(2048)
+                except BlockingIOError:
+                    break
+                except OSError:
+                    break
+                self.client = addr
+                now = time.monotonic()
+                for reply in self.board.handle(data):
+                    self.schedule(reply, addr, now)
+
+            now = time.monotonic()
+            target = self.stream_target or self.client
+            if stream_interval is not None and target is not None:
+                while next_stream <= now:  # 追上落后的发送
+                    stream_sn = stream_sn + 1 if stream_sn < 0XFFFF else 1
+                    self.board.acquire()
+                    for frame in self.board.data_frames(stream_sn):
+                        self.schedule(frame, target, now)
+                        self.streamed += 1
+                    next_stream += stream_interval
+
+            while self.queue and self.queue[0][0] <= now:
+                _, _, data, addr = heapq.heappop(self.queue)
+                try:
+                    sock.sendto(data, addr)
+                    self.sent += 1
+                except BlockingIOError:  # 发送缓冲区满，稍后再发
+                    heapq.heappush(self.queue, (now + 0.001, next(self.sequence), data, addr))
+                    break
+                except OSError:
+                    self.dropped += 1
+
+    def start(self):
+        if self.socket is None:
+            self.open()
+        self.thread = threading.Thread(target=self.serve_forever, name="BoardSimulator", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self, timeout=1.0):
+        self._stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+
+    def stats(self):
+        return {
+            "instructions": self.board.instructions,
+            "acks": {"%02X" % code: n for code, n in self.board.acks.items()},
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "streamed": self.streamed,
+            "queued": len(self.queue),
+        }
+
+
+_MODES = {"auto": None, "short": FRAME_SHORT, "long": FRAME_LONG, "cluster": FRAME_CLUSTER, "hit": FRAME_HIT}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="XPS 开发板模拟器")
+    parser.add_argument("--port", type=int, default=8080, help="监听端口，对应界面中的UDP服务端端口")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--mode", choices=sorted(_MODES), default="auto", help="数据包类型，auto 按控制寄存器选择短包或长包")
+    parser.add_argument("--loss", type=float, default=0.0, help="丢包概率")
+    parser.add_argument("--reorder", type=float, default=0.0, help="乱序概率")
+    parser.add_argument("--latency", type=float, default=0.0, help="回复延迟，ms")
+    parser.add_argument("--jitter", type=float, default=0.0, help="延迟抖动，ms")
+    parser.add_argument("--busy", type=float, default=0.0, help="回复F3的概率")
+    parser.add_argument("--sync-fail", type=float, default=0.0, help="同步触发回复异常的概率")
+    parser.add_argument("--frames-per-read", type=int, default=1, help="每次读数回复的数据包数")
+    parser.add_argument("--stream-rate", type=float, default=0.0, help="持续发送数据包的速率，包/秒，0为不发送")
+    parser.add_argument("--stream-target", default=None, help="持续发送的目标 host:port，默认为最近发指令的地址")
+    parser.add_argument("--pulse-rate", type=float, default=1000.0, help="每通道测试脉冲速率，Hz")
+    parser.add_argument("--mu", type=float, default=300.0, help="各通道50%%点的平均DAC")
+    parser.add_argument("--sigma", type=float, default=5.0, help="噪声宽度，DAC")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    target = None
+    if args.stream_target:
+        host, port = args.stream_target.rsplit(":", 1)
+        target = (host, int(port))
+    board = BoardModel(_MODES[args.mode], args.seed, args.pulse_rate, args.mu, sigma=args.sigma, busy_rate=args.busy,
+                       sync_fail_rate=args.sync_fail, frames_per_read=args.frames_per_read)
+    server = SimulatorServer(board, args.port, args.host, args.loss, args.reorder, args.latency, args.jitter,
+                             args.stream_rate, target, args.seed)
+    server.open()
+    print("模拟开发板监听 %s:%d" % (args.host, args.port))
+    server.start()
+    try:
+        while True:
+            time.sleep(5)
+            print(server.stats())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
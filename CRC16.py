@@ -0,0 +1,108 @@
+try:
+    import numpy as np
+except ImportError:  # 没有numpy时批量校验逐包计算
+    np = None
+
+# CRC-16-CCITT，初值0xFFFF，多项式0x1021，与 DataTransmission.InstrCRCverify 一致
+CRC16_POLY = 0X1021
+CRC16_INIT = 0XFFFF
+
+
+def _make_table(poly):  # 预先计算256个字节对应的CRC值
+    table = []
+    for byte in range(256):
+        crc = byte << 8
+        for _ in range(8):
+            if crc & 0x8000:
+                crc = ((crc << 1) ^ poly) & 0xFFFF
+            else:
+                crc = (crc << 1) & 0xFFFF
+        table.append(crc)
+    return tuple(table)
+
+
+CRC16_TABLE = _make_table(CRC16_POLY)
+
+
+def crc16_bitwise(data_bytes, poly=CRC16_POLY, init_val=CRC16_INIT):  # 逐位计算，作为查表法的参考实现
+    crc = init_val
+    for byte in data_bytes:
+        crc ^= byte << 8
+        for _ in range(8):  # 处理每一位
+            if (crc & 0x8000):  # 判断最高位是否为1
+                crc = (crc << 1) ^ poly
+            else:
+                crc <<= 1
+            crc &= 0xFFFF  # 保证CRC值为16位
+    return crc
+
+
+def crc16_ccitt(data_bytes, init_val=CRC16_INIT):  # 查表法，每个字节一次查表
+    crc = init_val
+    table = CRC16_TABLE
+    for byte in data_bytes:
+        crc = ((crc << 8) & 0xFF00) ^ table[(crc >> 8) ^ byte]
+    return crc
+
+
+def crc16_batch(frames, start, end, init_val=CRC16_INIT):  # 对多个等长数据包的 [start:end] 同时计算CRC
+    # frames 为 (N, 帧长) 的uint8数组，或N个等长数据包首尾相接的bytes
+    if np is None:
+        return [crc16_ccitt(frame[start:end], init_val) for frame in _split(frames)]
+
+    block = _as_block(frames)
+    crc = np.full(block.shape[0], init_val, dtype=np.uint16)
+    if (end - start) % 2:   # 奇数个字节时先按字节处理第一列
+        crc = (crc << 8) ^ _np_table()[(crc >> 8) ^ block[:, start]]
+        start += 1
+    table = _np_word_table()
+    words = np.ascontiguousarray(block[:, start:end]).view('>u2')  # 每两个字节一列，列数减半
+    for column in words.T:  # 按字节位置逐列计算，每一列对所有数据包向量化
+        crc = table[crc ^ column]
+    return crc
+
+
+def crc16_check_batch(frames, crc_offset, start=2):  # 批量校验，CRC码以大端存放在 [crc_offset:crc_offset+2]
+    if np is None:
+        return [crc16_ccitt(frame[start:crc_offset]) == (frame[crc_offset] << 8 | frame[crc_offset + 1])
+                for frame in _split(frames)]
+
+    block = _as_block(frames)
+    expected = (block[:, crc_offset].astype(np.uint16) << 8) | block[:, crc_offset + 1]
+    return crc16_batch(block, start, crc_offset) == expected
+
+
+_NP_TABLE = None
+_NP_WORD_TABLE = None
+
+
+def _split(frames, frame_length=138):  # 将首尾相接的数据包切分为列表
+    if isinstance(frames, (list, tuple)):
+        return frames
+    view = memoryview(frames)
+    return [view[i:i + frame_length] for i in range(0, len(view), frame_length)]
+
+
+def _np_table():
+    global _NP_TABLE
+    if _NP_TABLE is None:
+        _NP_TABLE = np.array(CRC16_TABLE, dtype=np.uint16)
+    return _NP_TABLE
+
+
+def _np_word_table():    # 一次处理两个字节的表：寄存器与两个数据字节异或后移出16位，共65536项
+    global _NP_WORD_TABLE
+    if _NP_WORD_TABLE is None:
+        table = _np_table()
+        value = np.arange(65536, dtype=np.uint32)
+        crc = ((value & 0XFF) << 8) ^ table[value >> 8]
+        _NP_WORD_TABLE = (((crc & 0XFF) << 8) ^ table[crc >> 8]).astype(np.uint16)
+    return _NP_WORD_TABLE
+
+
+def _as_block(frames, frame_length=138):  # 转为 (N, 帧长) 的uint8二维数组，bytes/memoryview 不复制
+    if isinstance(frames, np.ndarray):
+        return frames if frames.ndim == 2 else frames.reshape(-1, frame_length)
+    if isinstance(frames, (list, tuple)):
+        return np.frombuffer(b''.join(frames), dtype=np.uint8).reshape(len(frames), -1)
+    return np.frombuffer(frames, dtype=np.uint8).reshape(-1, frame_length)
@@ -0,0 +1,146 @@
+import argparse
+import os
+import struct
+import sys
+import threading
+import time
+
+from Protocol import MODE_SHORT, MODE_LONG, MODE_CLUSTER, MODE_HIT
+
+# 原始数据包记录文件：文件头 CAPTURE_MAGIC，之后每条记录为 接收时间(ns, int64) + 长度(uint16) + 数据包原文，小端，只追加
+CAPTURE_MAGIC = b'XPSCAP1\n'
+_RECORD = struct.Struct('<qH')
+
+SPEED_MAX = None  # 回放速度：None 为尽快回放，1.0 为按原始时间间隔
+
+
+class CaptureWriter:    # 追加写入原始数据包，可在接收线程中调用
+    def __init__(self, path, flush_every=256):
+        self.path = path
+        self.flush_every = flush_every  # 每写入这么多包刷新一次文件缓冲
+        self.file = None
+        self.frames = 0
+        self.bytes = 0
+        self._lock = threading.Lock()
+
+    def open(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.file = open(self.path, 'ab')
+        if self.file.tell() == 0:
+            self.file.write(CAPTURE_MAGIC)
+        return self
+
+    def write(self, data, timestamp_ns=None):
+        timestamp_ns = time.time_ns() if timestamp_ns is None else timestamp_ns
+        with self._lock:
+            if self.file is None:
+                return
+            self.file.write(_RECORD.pack(timestamp_ns, len(data)))
+            self.file.write(data)
+            self.frames += 1
+            self.bytes += len(data)
+            if self.flush_every and self.frames % self.flush_every == 0:
+                self.file.flush()
+
+    def close(self):
+        with self._lock:
+            if self.file is not None:
+                self.file.flush()
+                self.file.close()
+                self.file = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def read_capture(path):  # 依次返回 (接收时间ns, 数据包)，最后一条不完整时忽略
+    with open(path, 'rb') as file:
+        if file.read(len(CAPTURE_MAGIC)) != CAPTURE_MAGIC:
+            raise ValueError("不是原始数据包记录文件：%s" % path)
+        while True:
+            head = file.read(_RECORD.size)
+            if len(head) < _RECORD.size:
+                return
+            timestamp_ns, length = _RECORD.unpack(head)
+            data = file.read(length)
+            if len(data) < length:  # 记录中断
+                return
+            yield timestamp_ns, data
+
+
+class CaptureReplay:    # 将记录文件中的数据包按原始时间间隔或尽快交给 handler
+    def __init__(self, path, handler, speed=SPEED_MAX, clock=time.perf_counter, sleep=time.sleep):
+        self.path = path
+        self.handler = handler  # handler(data)，例如 AcquisitionCore.handle_frame 或 FrameRingBuffer.push
+        self.speed = speed  # None 为尽快；1.0 为原速，2.0 为两倍速
+        self.clock = clock
+        self.sleep = sleep
+        self.frames = 0
+        self.bytes = 0
+        self.elapsed = 0.0
+        self._stop = threading.Event()
+
+    def run(self, limit=None):  # 回放全部或前 limit 个数据包，返回统计
+        start = self.clock()
+        first_ns = None
+        for timestamp_ns, data in read_capture(self.path):
+            if self._stop.is_set() or (limit is not None and self.frames >= limit):
+                break
+            if self.speed is not None:
+                if first_ns is None:
+                    first_ns = timestamp_ns
+                delay = (timestamp_ns - first_ns) / 1e9 / self.speed - (self.clock() - start)
+                if delay > 0:
+                    self.sleep(delay)
+            self.handler(data)
+            self.frames += 1
+            self.bytes += len(data)
+        self.elapsed = self.clock() - start
+        return self.stats()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        return {
+            "frames": self.frames,
+            "bytes": self.bytes,
+            "elapsed": self.elapsed,
+            "frames_per_s": self.frames / self.elapsed if self.elapsed > 0 else 0.0,
+            "mb_per_s": self.bytes / self.elapsed / 1e6 if self.elapsed > 0 else 0.0,
+        }
+
+
+def parse_speed(text):  # max 为尽快回放，数字为倍速
+    return SPEED_MAX if text == "max" else float(text)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="离线回放原始数据包记录文件，统计解码、校验和存储的速度")
+    parser.add_argument("path", help="原始数据包记录文件")
+    parser.add_argument("--mode", choices=(MODE_SHORT, MODE_LONG, MODE_CLUSTER, MODE_HIT), default=MODE_SHORT, help="采集模式")
+    parser.add_argument("--speed", type=parse_speed, default=SPEED_MAX, help="max 为尽快回放，1.0 为按原始时间间隔，2.0 为两倍速")
+    parser.add_argument("--no-crc", action="store_true", help="不校验数据包CRC")
+    args = parser.parse_args(argv)
+
+    from AcquisitionCore import AcquisitionCore  # 采集核心引用本模块的 CaptureWriter，在此导入以免循环导入
+    core = AcquisitionCore(args.mode, crc_check=not args.no_crc, retain_rows=None)  # 与在线接收相同的解码、校验和存储流程
+    kinds = {}  # 各类数据包的个数
+
+    def handle(data):
+        kind = core.handle_frame(data).kind
+        kinds[kind] = kinds.get(kind, 0) + 1
+
+    stats = CaptureReplay(args.path, handle, args.speed).run()
+    print("回放 %d 包，%.3f s，%.0f 包/秒，%.2f MB/s" % (stats["frames"], stats["elapsed"], stats["frames_per_s"], stats["mb_per_s"]))
+    print("数据包类型：%s，CRC错误 %d，能谱 %d 行" % (kinds, core.crc_errors, core.store.total_rows))
+    if core.model.counts:
+        print("能谱总计数：%d" % core.model.total())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
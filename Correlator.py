@@ -0,0 +1,301 @@
+import threading
+import time
+from collections import deque, namedtuple
+
+from Protocol import ACK_SN_GAP
+
+# 指令的超时与重发策略：超时时间（ms）和超时后最多重发的次数，重发时指令帧序号不变
+RetryPolicy = namedtuple('RetryPolicy', 'timeout_ms max_retries')
+DEFAULT_POLICY = RetryPolicy(1000, 5)
+NO_RETRY = RetryPolicy(1000, 0)
+
+# 指令的状态
+COMMAND_PENDING = 'pending'
+COMMAND_DONE = 'done'  # 收到匹配的应答
+COMMAND_FAILED = 'failed'  # 重发次数用完仍未应答，或应答码表示指令未执行
+COMMAND_CANCELLED = 'cancelled'
+
+
+class CommandError(Exception):  # 指令未得到正确应答
+    pass
+
+
+def instruction_sn(data):   # 指令帧序号，位于包头之后的两个字节
+    return data[2] << 8 | data[3]
+
+
+def instruction_code(data):  # 命令码
+    return data[5]
+
+
+class CommandFuture:    # 一条已发送指令的应答，收到匹配应答时立即完成
+    def __init__(self, sn, command, data, policy, sent_at):
+        self.sn = sn
+        self.command = command
+        self.data = data  # 指令原文，超时后原样重发
+        self.policy = policy
+        self.first_sent_at = sent_at
+        self.sent_at = sent_at  # 最近一次发送的时间
+        self.deadline = sent_at + policy.timeout_ms / 1000
+        self.attempts = 1  # 已发送的次数
+        self.state = COMMAND_PENDING
+        self.frame = None  # 匹配的应答包或数据包
+        self.error = None
+        self.latency = None  # 从最近一次发送到收到应答的时间，单位s
+        self._callbacks = []
+        self._event = threading.Event()
+
+    def done(self):
+        return self.state != COMMAND_PENDING
+
+    @property
+    def succeeded(self):
+        return self.state == COMMAND_DONE
+
+    def add_done_callback(self, callback):  # 完成后调用 callback(future)，已完成时立即调用
+        if self.done():
+            callback(self)
+        else:
+            self._callbacks.append(callback)
+
+    def wait(self, timeout=None):   # 阻塞等待完成，用于不在界面线程中的调用者
+        return self._event.wait(timeout)
+
+    def result(self, timeout=None):  # 返回应答，未完成时等待，失败时抛出 CommandError
+        if not self.wait(timeout):
+            raise TimeoutError("指令 %d 等待应答超时" % self.sn)
+        if self.state != COMMAND_DONE:
+            raise CommandError(self.error)
+        return self.frame
+
+    def cancel(self):
+        return self._finish(COMMAND_CANCELLED, error="指令已取消")
+
+    def _finish(self, state, frame=None, error=None):
+        if self.done():
+            return False
+        self.state = state
+        self.frame = frame
+        self.error = error
+        self._event.set()
+        callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self)
+        return True
+
+
+class LatencyHistogram:  # 以2为底按对数分桶的延迟直方图，第i个桶为 [2^i, 2^(i+1)) us
+    def __init__(self, buckets=32):
+        self.buckets = [0] * buckets
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def record(self, seconds):
+        us = max(1, int(seconds * 1e6))
+        self.buckets[min(us.bit_length() - 1, len(self.buckets) - 1)] += 1
+        self.count += 1
+        self.total += seconds
+        self.min = seconds if self.min is None else min(self.min, seconds)
+        self.max = seconds if self.max is None else max(self.max, seconds)
+
+    def percentile(self, p):    # 第p百分位所在桶的上界，单位s
+        if not self.count:
+            return None
+        target = p / 100 * self.count
+        cumulative = 0
+        for i, n in enumerate(self.buckets):
+            cumulative += n
+            if cumulative >= target:
+                return min(2 ** (i + 1) / 1e6, self.max)
+        return self.max
+
+    def summary(self):  # 单位ms
+        if not self.count:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count * 1e3,
+            "min_ms": self.min * 1e3,
+            "p50_ms": self.percentile(50) * 1e3,
+            "p90_ms": self.percentile(90) * 1e3,
+            "p99_ms": self.percentile(99) * 1e3,
+            "max_ms": self.max * 1e3,
+        }
+
+
+class AckCorrelator:    # 按指令帧序号匹配指令与应答，超时按重发策略原样重发，不依赖界面和Qt
+    # send(data) 用于重发；接收端解码出应答后调用 resolve/reject，定时调用 poll 处理超时
+    def __init__(self, send, policy=DEFAULT_POLICY, on_retry=None, on_failed=None, clock=time.monotonic):
+        self.send = send
+        self.policy = policy
+        self.on_retry = on_retry  # 重发时调用 on_retry(future)
+        self.on_failed = on_failed  # 重发次数用完时调用 on_failed(future)
+        self.clock = clock
+        self.pending = {}  # 指令帧序号 -> 等待应答的 CommandFuture
+        self.histograms = {}  # 命令码 -> 应答延迟直方图
+        self.sent = 0
+        self.acked = 0
+        self.rejected = 0
+        self.retries = 0
+        self.timeouts = 0
+        self.gap_retransmits = 0  # 收到F2后立即重发的指令数
+        self.stray = 0  # 没有匹配指令的应答数
+
+    def register(self, data, policy=None):  # 指令发送后登记，返回等待应答的 CommandFuture
+        sn = instruction_sn(data)
+        previous = self.pending.pop(sn, None)
+        if previous is not None:  # 序号回绕后仍未应答的旧指令
+            previous._finish(COMMAND_FAILED, error="指令 %d 被相同序号的新指令覆盖" % sn)
+        future = CommandFuture(sn, instruction_code(data), bytes(data), policy or self.policy, self.clock())
+        self.pending[sn] = future
+        self.sent += 1
+        return future
+
+    def resolve(self, sn, frame=None):  # 收到应答，完成对应的指令，没有匹配指令时返回None
+        future = self.pending.pop(sn, None)
+        if future is None:
+            self.stray += 1
+            return None
+        future.latency = self.clock() - future.sent_at
+        self.histograms.setdefault(future.command, LatencyHistogram()).record(future.latency)
+        self.acked += 1
+        if getattr(frame, 'ack_code', None) == ACK_SN_GAP:  # 序号不连续，之前发出的指令可能丢失
+            self.retransmit_before(future)
+        future._finish(COMMAND_DONE, frame)
+        return future
+
+    def retransmit_before(self, future):    # 立即重发在 future 之前发送、仍未应答的指令，不等超时
+        now = self.clock()
+        for earlier in list(self.pending.values()):  # 字典按发送顺序排列，序号回绕后也成立
+            if earlier.first_sent_at > future.first_sent_at or earlier.done():
+                continue
+            self._resend(earlier, now)
+            self.gap_retransmits += 1
+
+    def reject(self, sn, frame=None, error="指令未执行"):  # 应答码表示指令未执行
+        future = self.pending.pop(sn, None)
+        if future is None:
+            self.stray += 1
+            return None
+        self.rejected += 1
+        future._finish(COMMAND_FAILED, frame, error)
+        return future
+
+    def cancel(self, sn):
+        future = self.pending.pop(sn, None)
+        if future is not None:
+            future.cancel()
+        return future
+
+    def poll(self, now=None):   # 定时调用，超时的指令重发或判为失败
+        if not self.pending:
+            return
+        now = self.clock() if now is None else now
+        for future in list(self.pending.values()):
+            if future.done():  # 调用者已取消
+                self.pending.pop(future.sn, None)
+                continue
+            if now < future.deadline:
+                continue
+            if future.attempts > future.policy.max_retries:
+                self.pending.pop(future.sn, None)
+                self.timeouts += 1
+                future._finish(COMMAND_FAILED, error="指令 %d 重发 %d 次仍未收到应答" % (future.sn, future.attempts - 1))
+                if self.on_failed is not None:
+                    self.on_failed(future)
+                continue
+            self._resend(future, now)
+
+    def _resend(self, future, now):  # 原样重发，重新计算超时
+        future.attempts += 1
+        future.sent_at = now
+        future.deadline = now + future.policy.timeout_ms / 1000
+        self.retries += 1
+        self.send(future.data)
+        if self.on_retry is not None:
+            self.on_retry(future)
+
+    def clear(self):    # 取消全部等待中的指令，例如断开连接时
+        pending, self.pending = self.pending, {}
+        for future in pending.values():
+            future.cancel()
+
+    def latency_summary(self):  # 各命令码的应答延迟统计
+        return {"%02X" % command: histogram.summary() for command, histogram in sorted(self.histograms.items())}
+
+    def stats(self):
+        return {
+            "sent": self.sent,
+            "acked": self.acked,
+            "rejected": self.rejected,
+            "retries": self.retries,
+            "timeouts": self.timeouts,
+            "gap_retransmits": self.gap_retransmits,
+            "stray": self.stray,
+            "pending": len(self.pending),
+        }
+
+
+class CommandPipeline:  # 滑动窗口发送一批指令，最多 window 条同时等待应答，某条完成后立即补发下一条
+    # send(command) 组合并发送一条指令，返回 CommandFuture，发送失败时返回None；超时和F2的重发由应答关联器处理
+    def __init__(self, send, window=8, on_finished=None, clock=time.monotonic):
+        self.send = send
+        self.window = window
+        self.on_finished = on_finished  # 全部指令完成后调用 on_finished(pipeline)
+        self.clock = clock
+        self.queue = deque()
+        self.in_flight = {}  # 指令帧序号 -> (command, future)
+        self.results = []  # 按完成顺序记录 (command, future)，发送失败时 future 为None
+        self.succeeded = 0
+        self.failed = 0
+        self.started_at = None
+        self.finished_at = None
+
+    @property
+    def running(self):
+        return bool(self.queue or self.in_flight)
+
+    def submit(self, commands):  # 加入一批指令并开始发送
+        if not self.running:
+            self.started_at = self.clock()
+            self.finished_at = None
+        self.queue.extend(commands)
+        self._fill()
+        return self
+
+    def cancel(self):   # 丢弃尚未发送的指令，并取消等待中的指令
+        self.queue.clear()
+        for command, future in list(self.in_flight.values()):
+            future.cancel()
+
+    def elapsed(self):  # 单位s
+        if self.started_at is None:
+            return 0.0
+        end = self.finished_at if self.finished_at is not None else self.clock()
+        return end - self.started_at
+
+    def _fill(self):
+        while self.queue and len(self.in_flight) < self.window:
+            command = self.queue.popleft()
+            future = self.send(command)
+            if future is None:
+                self.failed += 1
+                self.results.append((command, None))
+                continue
+            self.in_flight[future.sn] = (command, future)
+            future.add_done_callback(self._on_done)
+        if not self.running and self.finished_at is None and self.started_at is not None:
+            self.finished_at = self.clock()
+            if self.on_finished is not None:
+                self.on_finished(self)
+
+    def _on_done(self, future):
+        command, _ = self.in_flight.pop(future.sn, (None, future))
+        if future.succeeded:
+            self.succeeded += 1
+        else:
+            self.failed += 1
+        self.results.append((command, future))
+        self._fill()
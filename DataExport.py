@@ -0,0 +1,162 @@
+import csv
+import os
+import time
+from itertools import zip_longest
+
+import numpy as np
+
+
+def scurve_stream_path(xlsx_path):  # S曲线逐步追加的中间文件，与Excel文件放在同一目录
+    return os.path.splitext(xlsx_path)[0] + '.scurve.csv'
+
+
+class SCurveStreamWriter:   # S曲线逐步追加写入，每一步一行：DAC值,各通道计数；扫描结束后一次性转为Excel
+    def __init__(self, xlsx_path, fsync_every=8):
+        self.xlsx_path = xlsx_path
+        self.stream_path = scurve_stream_path(xlsx_path)
+        self.fsync_every = fsync_every  # 每隔多少步调用一次fsync，保证断电后已完成的步骤在磁盘上
+        self.file = None
+        self.writer = None
+        self.steps = 0
+
+    def open(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.xlsx_path)), exist_ok=True)
+        self.file = open(self.stream_path, 'a', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.file)
+        return self
+
+    def append_step(self, dac_value, counts):   # 追加一个DAC步的各通道计数
+        self.writer.writerow([dac_value, *counts])
+        self.file.flush()
+        self.steps += 1
+        if self.fsync_every and self.steps % self.fsync_every == 0:
+            os.fsync(self.file.fileno())
+
+    def close(self):
+        if self.file is not None:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.file.close()
+            self.file = None
+            self.writer = None
+
+    def finalize(self, sort_by_dac=False):  # 关闭中间文件，并转为Excel，返回写入的步数
+        self.close()
+        return finalize_scurve_stream(self.xlsx_path, sort_by_dac)
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def period_stream_path(xlsx_path):  # 周期采集逐周期追加的中间文件，与Excel文件放在同一目录
+    return os.path.splitext(xlsx_path)[0] + '.period.csv'
+
+
+class PeriodStreamWriter(SCurveStreamWriter):   # 周期采集逐周期追加写入，每个周期一行：周期序号,各通道计数；结束后一次性转为Excel
+    def __init__(self, xlsx_path, fsync_every=8):
+        super().__init__(xlsx_path, fsync_every)
+        self.stream_path = period_stream_path(xlsx_path)
+
+    def finalize(self, sort_by_dac=False):
+        self.close()
+        return finalize_period_stream(self.xlsx_path)
+
+
+def read_scurve_stream(stream_path):    # 读出中间文件中已完成的步骤：只接受以换行结束、列数与第一行相同的整数行，写入中断的行忽略
+    steps = []
+    with open(stream_path, newline='', encoding='utf-8') as file:
+        for line in file:
+            if not line.endswith('\n'):  # 最后一行没有写完换行，可能在数字中间截断
+                break
+            line = line.rstrip('\r\n')
+            if not line:
+                continue
+            try:
+                step = [int(value) for value in line.split(',')]
+            except ValueError:  # 写入中断后又追加的行
+                continue
+            if steps and len(step) != len(steps[0]):
+                continue
+            steps.append(step)
+    return steps
+
+
+def _read_xlsx_rows(xlsx_path):   # 只读模式读出已有Excel的全部行
+    from openpyxl import load_workbook
+
+    existing = load_workbook(xlsx_path, read_only=True)
+    rows = [list(row) for row in existing.active.iter_rows(values_only=True)]
+    existing.close()
+    return rows
+
+
+def _write_xlsx_rows(xlsx_path, rows):   # 用只写模式逐行写入，写完后替换原文件
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    for row in rows:
+        sheet.append(row)
+    tmp_path = xlsx_path + '.tmp'
+    workbook.save(tmp_path)
+    os.replace(tmp_path, xlsx_path)  # 写完后再替换，避免中途出错损坏原文件
+
+
+def export_columns_to_xlsx(xlsx_path, block, titles=None):  # block 为 (列数, 通道数) 的数组，每一行写成Excel中的一列
+    # 与逐格写入的结果一致：第一行为标题，新数据从第一列开始覆盖，原文件中超出范围的单元格保留
+    start = time.perf_counter()
+    block = np.asarray(block)
+    rows = block.T.tolist()  # 转置后每个通道一行，直接按行追加
+    if titles is not None:
+        rows.insert(0, list(titles))
+
+    if os.path.exists(xlsx_path):
+        existing = _read_xlsx_rows(xlsx_path)
+        rows = [list(new or ()) + list(old or ())[len(new or ()):] for new, old in zip_longest(rows, existing)]
+
+    _write_xlsx_rows(xlsx_path, rows)
+    elapsed = time.perf_counter() - start
+    return block.shape[0], elapsed  # 写入的记录数（周期数）和耗时
+
+
+def read_scurve_xlsx(xlsx_path):   # 读出S曲线Excel，返回 (DAC值, (步数, 通道数)计数)，第一行不是DAC值的列跳过
+    columns = [column for column in zip_longest(*_read_xlsx_rows(xlsx_path))
+               if isinstance(column[0], (int, float)) and all(isinstance(v, (int, float)) for v in column[1:] if v is not None)]
+    if not columns:
+        return np.zeros(0), np.zeros((0, 0))
+    dac = np.array([column[0] for column in columns], dtype=np.float64)
+    counts = np.array([[0 if v is None else v for v in column[1:]] for column in columns], dtype=np.float64)
+    return dac, counts
+
+
+def finalize_scurve_stream(xlsx_path, sort_by_dac=False):  # 中间文件一次性转为Excel，每一步为一列，第一行为DAC值
+    stream_path = scurve_stream_path(xlsx_path)
+    if not os.path.exists(stream_path):
+        return 0
+    steps = [step for step in read_scurve_stream(stream_path) if step]
+    if sort_by_dac:
+        steps.sort(key=lambda step: step[0])
+
+    columns = []
+    if os.path.exists(xlsx_path):  # Excel已存在时保留原有的列，新数据追加在后面
+        columns = [list(column) for column in zip_longest(*_read_xlsx_rows(xlsx_path))]
+    columns.extend(steps)
+
+    _write_xlsx_rows(xlsx_path, zip_longest(*columns))   # 按行写入
+    os.remove(stream_path)
+    return len(steps)
+
+
+def finalize_period_stream(xlsx_path):  # 中间文件一次性转为Excel，每个周期为一列，第一行为"周期 n"，与界面周期采集保存的格式一致
+    stream_path = period_stream_path(xlsx_path)
+    if not os.path.exists(stream_path):
+        return 0
+    rows = [row for row in read_scurve_stream(stream_path) if row]
+    if rows:
+        block = np.array([row[1:] for row in rows], dtype=np.uint32)
+        export_columns_to_xlsx(xlsx_path, block, [f"周期 {row[0]}" for row in rows])
+    os.remove(stream_path)
+    return len(rows)
@@ -0,0 +1,237 @@
+import json
+import os
+import threading
+import time
+from time import perf_counter_ns
+
+from Protocol import FRAME_ACK, FRAME_SHORT, FRAME_LONG, FRAME_CLUSTER, FRAME_HIT, FRAME_SYNC, FRAME_SYNC_ERROR, FRAME_ERROR
+
+# 热路径各阶段的耗时，单位ns
+SPAN_RECEIVE = 'receive'  # 接收线程从套接字读入环形缓冲区，按每个数据包平均
+SPAN_DECODE = 'decode'  # 按采集模式解码一个数据包
+SPAN_VERIFY = 'verify'  # DataReceiveVerify：校验并分发一个数据包，调用者已解码时不含解码
+SPAN_CRC = 'crc'  # 数据包CRC校验
+SPAN_RENDER = 'render'  # 绘制一帧能谱图
+SPAN_SAVE = 'save'  # 保存文件
+
+# 每类数据包的处理耗时，应答包包括界面的 Insdistinguish/AckInsdistinguish
+HANDLE_SPANS = {kind: 'handle_' + kind for kind in (FRAME_ACK, FRAME_SHORT, FRAME_LONG, FRAME_CLUSTER, FRAME_HIT,
+                                                     FRAME_SYNC, FRAME_SYNC_ERROR, FRAME_ERROR)}
+
+# 计数器：各类数据包个数直接用数据包类型，另外还有
+COUNT_CRC_ERROR = 'crc_error'
+ERROR_COUNTERS = {}  # 错误原因 -> 计数器名，如 header -> error_header
+
+
+def error_counter(reason):
+    name = ERROR_COUNTERS.get(reason)
+    if name is None:
+        name = ERROR_COUNTERS[reason] = 'error_' + str(reason)
+    return name
+
+
+class HdrHistogram:     # HDR风格的直方图：按2的幂分段，每段再线性细分为 2^(sub_bucket_bits-1) 个桶，相对误差不超过 2^-(sub_bucket_bits-1)
+    def __init__(self, sub_bucket_bits=7, max_bits=48):
+        self.sub_bucket_bits = sub_bucket_bits
+        self.sub_bucket_count = 1 << sub_bucket_bits  # 小于此值的数值每个值一个桶
+        self.half_count = self.sub_bucket_count >> 1
+        self.max_value = (1 << max_bits) - 1  # 超出的数值记到最后一个桶
+        self.buckets = [0] * (self.sub_bucket_count + (max_bits - sub_bucket_bits) * self.half_count)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def _index(self, value):
+        if value < self.sub_bucket_count:
+            return value
+        shift = value.bit_length() - self.sub_bucket_bits
+        return self.sub_bucket_count + (shift - 1) * self.half_count + (value >> shift) - self.half_count
+
+    def _bounds(self, index):   # 桶对应的数值范围 [下界, 上界)
+        if index < self.sub_bucket_count:
+            return index, index + 1
+        shift, sub = divmod(index - self.sub_bucket_count, self.half_count)
+        shift += 1
+        low = (sub + self.half_count) << shift
+        return low, low + (1 << shift)
+
+    def record(self, value, count=1):   # value 为非负整数，count 为相同数值的个数
+        value = min(max(0, int(value)), self.max_value)
+        self.buckets[self._index(value)] += count
+        self.count += count
+        self.total += value * count
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, p):    # 第p百分位所在桶的上界，不超过最大值
+        if not self.count:
+            return None
+        target = max(1, p / 100 * self.count)
+        cumulative = 0
+        for index, n in enumerate(self.buckets):
+            if n:
+                cumulative += n
+                if cumulative >= target:
+                    return min(self._bounds(index)[1] - 1, self.max)
+        return self.max
+
+    def percentiles(self, ps):  # 一次遍历得到多个百分位，ps 从小到大
+        result = {}
+        if not self.count:
+            return result
+        targets = [(p, max(1, p / 100 * self.count)) for p in ps]
+        cumulative = 0
+        i = 0
+        for index, n in enumerate(self.buckets):
+            if not n:
+                continue
+            cumulative += n
+            while i < len(targets) and cumulative >= targets[i][1]:
+                result[targets[i][0]] = min(self._bounds(index)[1] - 1, self.max)
+                i += 1
+            if i == len(targets):
+                break
+        return result
+
+    def merge(self, other):
+        for index, n in enumerate(other.buckets):
+            self.buckets[index] += n
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+
+    def summary(self):  # 单位us
+        if not self.count:
+            return {"count": 0}
+        p = self.percentiles((50, 90, 99, 99.9))
+        return {
+            "count": self.count,
+            "mean_us": self.total / self.count / 1e3,
+            "min_us": self.min / 1e3,
+            "p50_us": p[50] / 1e3,
+            "p90_us": p[90] / 1e3,
+            "p99_us": p[99] / 1e3,
+            "p999_us": p[99.9] / 1e3,
+            "max_us": self.max / 1e3,
+            "total_ms": self.total / 1e6,
+        }
+
+
+class _Span:    # with instruments.span(name): 用于保存文件等非热路径
+    __slots__ = ('instruments', 'name', 'started')
+
+    def __init__(self, instruments, name):
+        self.instruments = instruments
+        self.name = name
+
+    def __enter__(self):
+        self.started = perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.instruments.record(self.name, perf_counter_ns() - self.started)
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Instrumentation:  # 各阶段耗时直方图与计数器，enabled 为 False 时热路径只多一次判断，不计时也不计数
+    # 热路径的用法：t0 = perf_counter_ns() if instruments.enabled else 0 ... if t0: instruments.record(name, perf_counter_ns() - t0)
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.histograms = {}  # 阶段名 -> HdrHistogram，单位ns
+        self.counters = {}
+        self.started_at = time.time()  # 开始统计的系统时间
+        self._lock = threading.Lock()  # 只在新建直方图时使用，接收线程与主线程各自写入不同的直方图
+
+    def set_enabled(self, enabled):
+        self.enabled = enabled
+
+    def histogram(self, name):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(name, HdrHistogram())
+        return histogram
+
+    def record(self, name, ns, count=1):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histogram(name)
+        histogram.record(ns, count)
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def span(self, name):   # 未启用时返回空的上下文管理器
+        return _Span(self, name) if self.enabled else _NULL_SPAN
+
+    def frame(self, frame, started, decoded):   # 一个数据包处理完成：按类型计数，记录总耗时和该类数据包的处理耗时
+        now = perf_counter_ns()
+        kind = frame.kind
+        self.count(error_counter(frame.reason) if kind == FRAME_ERROR else kind)
+        self.record(SPAN_VERIFY, now - started)
+        self.record(HANDLE_SPANS[kind], now - decoded)
+
+    def reset(self):
+        with self._lock:
+            self.histograms = {}
+            self.counters = {}
+            self.started_at = time.time()
+
+    def snapshot(self, extra=None):     # 可直接保存为JSON的统计结果，extra 为附加的统计
+        elapsed = time.time() - self.started_at
+        result = {
+            "enabled": self.enabled,
+            "started_at": self.started_at,
+            "elapsed_s": elapsed,
+            "spans": {name: histogram.summary() for name, histogram in sorted(list(self.histograms.items()))},
+            "counters": dict(sorted(list(self.counters.items()))),
+        }
+        if extra:
+            result.update(extra)
+        return result
+
+    def dump_json(self, path, extra=None):  # 保存统计结果，返回写入的内容
+        snapshot = self.snapshot(extra)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(snapshot, file, ensure_ascii=False, indent=2)
+        return snapshot
+
+
+def format_snapshot(snapshot):  # 统计结果转为文本表格，用于统计面板和命令行
+    lines = ["统计时长 %.1f s%s" % (snapshot["elapsed_s"], "" if snapshot["enabled"] else "（已暂停）"),
+             "%-16s %10s %10s %10s %10s %10s %10s %12s" % ("阶段", "次数", "平均us", "P50us", "P99us", "P99.9us", "最大us", "累计ms")]
+    for name, summary in snapshot["spans"].items():
+        if not summary["count"]:
+            continue
+        lines.append("%-16s %10d %10.2f %10.2f %10.2f %10.2f %10.2f %12.2f" % (
+            name, summary["count"], summary["mean_us"], summary["p50_us"], summary["p99_us"], summary["p999_us"],
+            summary["max_us"], summary["total_ms"]))
+    lines.append("")
+    lines.append("计数器")
+    elapsed = max(snapshot["elapsed_s"], 1e-9)
+    for name, value in snapshot["counters"].items():
+        lines.append("%-16s %10d %12.1f /s" % (name, value, value / elapsed))
+    for key, value in snapshot.items():    # 附加的统计，如接收引擎和指令应答
+        if isinstance(value, dict) and key not in ("spans", "counters"):
+            lines.append("")
+            lines.append(key)
+            lines.extend("%-16s %s" % (name, item) for name, item in value.items())
+    return lines
@@ -0,0 +1,124 @@
+import time
+from collections import deque
+
+from Protocol import hex_dump
+
+# 日志显示的位置
+LOG_COMM = 0B01  # 通信界面 CommunicationTextBrowser
+LOG_SPEC = 0B10  # 能谱界面 SpectroscopyTextBrowser
+LOG_BOTH = LOG_COMM | LOG_SPEC
+
+# 日志类别
+LOG_RAW_ACK = 'raw_ack'  # 接收到的应答包、同步应答和错误数据包原文
+LOG_RAW_DATA = 'raw_data'  # 接收到的数据包原文，数据包速率高，默认不显示
+LOG_COMMAND = 'command'  # 发送和重发的指令
+LOG_ACK = 'ack'  # 应答码和应答内容
+LOG_ERROR = 'error'  # 接收、校验和指令失败
+LOG_SCAN = 'scan'  # S曲线扫描和周期采集的进度
+LOG_INFO = 'info'  # 其他提示
+
+CATEGORY_NAMES = {
+    LOG_RAW_ACK: "应答包原文",
+    LOG_RAW_DATA: "数据包原文",
+    LOG_COMMAND: "发送指令",
+    LOG_ACK: "应答内容",
+    LOG_ERROR: "错误",
+    LOG_SCAN: "扫描进度",
+    LOG_INFO: "其他提示",
+}
+
+DEFAULT_ENABLED = {category: category != LOG_RAW_DATA for category in CATEGORY_NAMES}
+
+
+class LogRecord:    # 一条日志，连续重复的消息只保留一条并累加 count
+    __slots__ = ('seq', 'timestamp', 'category', 'targets', 'message', 'count')
+
+    def __init__(self, seq, timestamp, category, targets, message):
+        self.seq = seq
+        self.timestamp = timestamp  # 最近一次出现的时间
+        self.category = category
+        self.targets = targets
+        self.message = message  # 字符串，或接收到的数据包原文（bytes，显示时才转为十六进制）
+        self.count = 1
+
+
+_clock_cache = [None, ""]  # 同一秒内的记录共用格式化后的时间
+
+
+def format_time(timestamp):
+    second = int(timestamp)
+    if _clock_cache[0] != second:
+        _clock_cache[0] = second
+        _clock_cache[1] = time.strftime("%H:%M:%S", time.localtime(second))
+    return _clock_cache[1]
+
+
+def format_record(record):  # 显示时才格式化，数据包原文前加接收时间，重复的消息后加 ×次数
+    message = record.message
+    if isinstance(message, bytes):
+        text = "[%s] : %s" % (format_time(record.timestamp), hex_dump(message))
+    else:
+        text = message
+    if record.count > 1:
+        text = "%s ×%d" % (text, record.count)
+    return text
+
+
+class LogModel:     # 固定容量的日志环形缓冲区，按类别过滤，连续重复的消息合并计数，不依赖界面，由视图定时取出新记录
+    def __init__(self, capacity=5000, enabled=None, clock=time.time):
+        self.records = deque(maxlen=capacity)  # 超出容量时丢弃最早的记录
+        self.enabled = dict(DEFAULT_ENABLED)
+        if enabled:
+            self.enabled.update(enabled)
+        self.clock = clock
+        self.seq = 0  # 已写入的记录数，合并的重复消息不计
+        self.version = 0  # 写入或合并时加1，视图据此判断是否需要刷新
+        self.collapsed = 0  # 合并的重复消息数
+        self.suppressed = {category: 0 for category in CATEGORY_NAMES}  # 因类别关闭而未记录的消息数
+
+    def wants(self, category):  # 类别关闭时调用者可以跳过格式化和复制
+        return self.enabled.get(category, True)
+
+    def set_enabled(self, category, enabled):
+        self.enabled[category] = enabled
+
+    def write(self, message, category=LOG_INFO, targets=LOG_BOTH):  # 写入一条日志，返回记录，类别关闭时返回None
+        if not self.enabled.get(category, True):
+            self.suppressed[category] = self.suppressed.get(category, 0) + 1
+            return None
+        now = self.clock()
+        self.version += 1
+        if self.records:
+            last = self.records[-1]
+            if last.message == message and last.category == category and last.targets == targets:
+                last.count += 1
+                last.timestamp = now
+                self.collapsed += 1
+                return last
+        self.seq += 1
+        record = LogRecord(self.seq, now, category, targets, message)
+        self.records.append(record)
+        return record
+
+    def since(self, seq, targets=LOG_BOTH):  # 序号大于 seq 且显示在 targets 的记录，以及因超出容量而丢失的记录数
+        records = []
+        for record in reversed(self.records):   # 新记录在末尾，只遍历新增的部分
+            if record.seq <= seq:
+                break
+            if record.targets & targets:
+                records.append(record)
+        records.reverse()
+        oldest = self.records[0].seq if self.records else self.seq + 1
+        return records, max(0, oldest - seq - 1)
+
+    def clear(self):
+        self.records.clear()
+        self.version += 1
+
+    def stats(self):
+        return {
+            "records": len(self.records),
+            "written": self.seq,
+            "collapsed": self.collapsed,
+            "suppressed": dict(self.suppressed),
+        }
@@ -0,0 +1,112 @@
+import matplotlib
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_qt5agg import FigureCanvas  # pyqt5的画布
+from matplotlib.font_manager import FontProperties
+from PyQt5.QtWidgets import QApplication
+
+matplotlib.use("Qt5Agg")  # 声明使用pyqt5
+matplotlib.rcParams['font.family'] = 'SimHei'  # 'SimHei' 是一种常用的中文黑体
+matplotlib.rcParams['font.size'] = 10
+matplotlib.rcParams['axes.unicode_minus'] = False  # 正确显示负号
+
+
+class MyMatplotlibFigure(FigureCanvas):  # 创建一个绘图类,主要用于绘制能谱图，只创建一次，之后原地更新柱高
+    def __init__(self, width=7.1, height=5.51, dpi=None):
+        if dpi is None:  # 按屏幕分辨率绘制
+            screen = QApplication.primaryScreen() if QApplication.instance() is not None else None
+            dpi = screen.logicalDotsPerInch() if screen is not None else 100
+        fig = Figure(figsize=(width, height), dpi=dpi)
+        self.axes = fig.add_subplot(111)
+        fig.subplots_adjust(left=0.07, right=0.99, top=1, bottom=0.05)
+        self.font_prop = FontProperties(family='SimHei', size=8)
+        self.axes_channels = 32
+        super(MyMatplotlibFigure, self).__init__(fig)
+
+        self.bars = None  # 柱状图的 BarContainer，通道数改变时重建
+        self.value_texts = []  # x轴刻度下方的计数标签
+        self.total_text = None  # 总计数
+        self.y_max = None  # 当前y轴范围对应的最大计数
+        self.background = None  # 不含动态元素的背景，用于blit
+        self.mpl_connect('draw_event', self._on_draw)
+
+    def _on_draw(self, event):  # 完整重绘后缓存背景，并画上柱子和标签
+        self.background = self.copy_from_bbox(self.figure.bbox)
+        self._draw_animated()
+
+    def _draw_animated(self):
+        if self.bars is None:
+            return
+        for bar in self.bars:
+            self.axes.draw_artist(bar)
+        for text in self.value_texts:
+            self.axes.draw_artist(text)
+        self.figure.draw_artist(self.total_text)
+
+    def _build(self, channels):  # 建立柱子和标签，动态元素不参与完整重绘，只在blit时绘制
+        self.axes.clear()
+        self.axes_channels = channels
+        self.bars = self.axes.bar(range(channels), [0] * channels, color=(29/255, 100/255, 87/255), edgecolor='black', animated=True)
+
+        # 显示总计数
+        self.total_text = self.axes.text(0.98, 0.98, '', ha='right', va='top', transform=self.figure.transFigure, fontsize=12, fontproperties=self.font_prop, bbox=dict(facecolor='white', alpha=0.8), animated=True)
+
+        # 设置x轴标签
+        self.axes.set_xticks(range(channels))  # 设置x轴刻度位置
+        self.axes.set_xticklabels(range(channels), fontproperties=self.font_prop)  # 设置x轴标签
+
+        # 在x轴刻度下方添加计数标签
+        self.value_texts = [self.axes.text(i, 0, '', ha='center', va='top', fontsize=6, fontproperties=self.font_prop, animated=True) for i in range(channels)]
+        self.y_max = None
+
+    def _rescale(self, y_max):  # 计数超出当前范围或明显变小时才调整y轴，需要完整重绘
+        self.y_max = y_max
+        self.axes.set_ylim(-0.1 * y_max, y_max * 1.1)  # 设置y轴范围
+        for text in self.value_texts:
+            text.set_y(-0.05 * y_max)
+
+        # 设置y轴标签的字体属性
+        for label in self.axes.get_yticklabels():
+            label.set_fontproperties(self.font_prop)
+
+    def draw_bar_chart(self, data):
+        channel_values = list(data.values())
+        channels = len(channel_values)
+        full_redraw = False
+        if self.bars is None or len(self.bars) != channels:
+            self._build(channels)
+            full_redraw = True
+
+        y_max = max(channel_values) if max(channel_values) > 0 else 1
+        if self.y_max is None or y_max > self.y_max or y_max < self.y_max / 2:
+            self._rescale(y_max)
+            full_redraw = True
+
+        for bar, text, value in zip(self.bars, self.value_texts, channel_values):
+            bar.set_height(value)
+            text.set_text(f'{value}')
+        self.total_text.set_text(f'总计数: {sum(channel_values)}')
+
+        if full_redraw or self.background is None:
+            self.draw()  # 完整重绘，draw_event 中会重新缓存背景
+        else:
+            self.restore_region(self.background)  # 只重绘柱子和标签
+            self._draw_animated()
+            self.blit(self.figure.bbox)
+
+    def clear_plot(self):
+        self.axes.clear()
+        self.bars = None
+        self.value_texts = []
+        self.total_text = None
+        self.y_max = None
+        self.draw()
+
+    def save_figure(self, path, dpi=None):  # 导出图片，savefig 不绘制动态元素，导出时临时取消
+        artists = list(self.bars or []) + self.value_texts + ([self.total_text] if self.total_text is not None else [])
+        for artist in artists:
+            artist.set_animated(False)
+        try:
+            self.figure.savefig(path, dpi=dpi)
+        finally:
+            for artist in artists:
+                artist.set_animated(True)
@@ -0,0 +1,215 @@
+import argparse
+import cProfile
+import datetime
+import io
+import json
+import os
+import platform
+import pstats
+import sys
+import threading
+import time
+
+# 剖析方式
+PROFILE_CPROFILE = 'cprofile'  # 确定性剖析，记录每次函数调用，输出 .prof，可用 snakeviz 或 pstats 查看
+PROFILE_SAMPLE = 'sample'  # 采样剖析，定时记录调用栈，开销小，输出 speedscope 格式，可在 https://www.speedscope.app 打开
+
+PROFILE_MODES = (PROFILE_CPROFILE, PROFILE_SAMPLE)
+
+
+def profile_base(data_path):    # 剖析结果与数据文件放在同一目录，文件名相同，扩展名不同
+    return os.path.splitext(data_path)[0]
+
+
+class SamplingProfiler:     # 在后台线程中定时读取目标线程的调用栈，统计每个调用栈占用的时间
+    def __init__(self, interval=0.005, thread_id=None):
+        self.interval = interval  # 采样间隔，单位s
+        self.thread_id = thread_id  # 被采样的线程，None 为调用 start 的线程
+        self.stacks = {}  # 调用栈（从外到内的帧序号） -> 累计时间，单位s
+        self.frames = {}  # (函数名, 文件, 行号) -> 帧序号
+        self.samples = 0
+        self.started_at = None
+        self.elapsed = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.thread_id is None:
+            self.thread_id = threading.get_ident()
+        self._stop.clear()
+        self.started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="SamplingProfiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.elapsed = time.perf_counter() - self.started_at
+
+    def _run(self):
+        frames = self.frames
+        stacks = self.stacks
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:   # 目标线程已结束
+                break
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                key = (code.co_name, code.co_filename, code.co_firstlineno)
+                index = frames.get(key)
+                if index is None:
+                    index = frames[key] = len(frames)
+                stack.append(index)
+                frame = frame.f_back
+            stack.reverse()
+            stack = tuple(stack)
+            stacks[stack] = stacks.get(stack, 0.0) + (now - last)  # 按实际间隔计时，睡眠不准时也不失真
+            last = now
+            self.samples += 1
+
+    def speedscope(self, name):     # speedscope 文件格式的 sampled 剖析
+        frames = [None] * len(self.frames)
+        for (function, filename, line), index in self.frames.items():
+            frames[index] = {"name": function, "file": filename, "line": line}
+        samples = list(self.stacks)
+        weights = [self.stacks[stack] for stack in samples]
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": name,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": [list(stack) for stack in samples],
+                "weights": weights,
+            }],
+            "name": name,
+            "exporter": "XPS_GUI Profiling.py",
+        }
+
+
+class RunProfiler:  # 剖析一次采集：start/stop 之间的全部调用，结果与元数据（配置快照等）写到数据文件旁边
+    def __init__(self, data_path, mode=PROFILE_CPROFILE, config=None, label="", interval=0.005):
+        if mode not in PROFILE_MODES:
+            raise ValueError("未知剖析方式：%s" % mode)
+        self.data_path = data_path
+        self.base = profile_base(data_path)
+        self.mode = mode
+        self.config = config  # SaveConfig 格式的配置快照
+        self.label = label  # 剖析的内容，如 S曲线、周期采集
+        self.interval = interval  # 采样剖析的采样间隔，单位s
+        self.profiler = None
+        self.started_at = None  # 开始时的系统时间
+        self.elapsed = 0.0
+        self._started = None
+        self.outputs = []  # 写入的文件
+
+    @property
+    def running(self):
+        return self.profiler is not None
+
+    def start(self):    # 已有其他剖析工具在运行时 cProfile 抛出 ValueError
+        if self.mode == PROFILE_CPROFILE:
+            profiler = cProfile.Profile()
+            profiler.enable()
+        else:
+            profiler = SamplingProfiler(self.interval).start()
+        self.profiler = profiler
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        return self
+
+    def stop(self):     # 停止剖析并写入结果，返回写入的文件列表
+        if self.profiler is None:
+            return self.outputs
+        profiler, self.profiler = self.profiler, None
+        if self.mode == PROFILE_CPROFILE:
+            profiler.disable()
+        else:
+            profiler.stop()
+        self.elapsed = time.perf_counter() - self._started
+        os.makedirs(os.path.dirname(os.path.abspath(self.base)), exist_ok=True)
+        meta = self.metadata()
+        if self.mode == PROFILE_CPROFILE:
+            prof_path = self.base + '.prof'
+            profiler.dump_stats(prof_path)
+            summary_path = self.base + '.prof.txt'
+            with open(summary_path, 'w', encoding='utf-8') as file:
+                file.write(self.header_text(meta))
+                file.write(format_stats(pstats.Stats(profiler)))
+            self.outputs = [prof_path, summary_path]
+        else:
+            speedscope_path = self.base + '.speedscope.json'
+            meta["samples"] = profiler.samples
+            document = profiler.speedscope("%s %s" % (self.label, os.path.basename(self.data_path)))
+            document["xps_metadata"] = meta     # speedscope 忽略多余的字段
+            with open(speedscope_path, 'w', encoding='utf-8') as file:
+                json.dump(document, file, ensure_ascii=False)
+            self.outputs = [speedscope_path]
+        meta_path = self.base + '.profile.json'
+        meta["outputs"] = [os.path.basename(path) for path in self.outputs]
+        with open(meta_path, 'w', encoding='utf-8') as file:
+            json.dump(meta, file, ensure_ascii=False, indent=2)
+        self.outputs.append(meta_path)
+        return self.outputs
+
+    def metadata(self):
+        return {
+            "label": self.label,
+            "mode": self.mode,
+            "data_path": self.data_path,
+            "started_at": datetime.datetime.fromtimestamp(self.started_at).isoformat(timespec='seconds'),
+            "elapsed_s": self.elapsed,
+            "interval_s": self.interval if self.mode == PROFILE_SAMPLE else None,
+            "python": sys.version,
+            "platform": platform.platform(),
+            "config": self.config,
+        }
+
+    def header_text(self, meta):
+        lines = ["%s 剖析，开始于 %s，耗时 %.2f s" % (meta["label"], meta["started_at"], meta["elapsed_s"]),
+                 "数据文件：%s" % meta["data_path"]]
+        if meta["config"]:
+            lines.append("配置：%s" % json.dumps(meta["config"], ensure_ascii=False))
+        return '\n'.join(lines) + '\n\n'
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+def format_stats(stats, sort='cumulative', limit=60):    # pstats 的文本报告
+    stream = io.StringIO()
+    stats.stream = stream
+    stats.sort_stats(sort).print_stats(limit)
+    return stream.getvalue()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="查看 cProfile 剖析结果")
+    parser.add_argument("path", help="剖析结果 .prof")
+    parser.add_argument("--sort", choices=("cumulative", "tottime", "calls"), default="cumulative", help="排序方式")
+    parser.add_argument("--limit", type=int, default=60, help="显示的函数个数")
+    args = parser.parse_args(argv)
+    meta_path = os.path.splitext(args.path)[0] + '.profile.json'
+    if os.path.exists(meta_path):
+        with open(meta_path, encoding='utf-8') as file:
+            meta = json.load(file)
+        print("%s 剖析，开始于 %s，耗时 %.2f s" % (meta["label"], meta["started_at"], meta["elapsed_s"]))
+    print(format_stats(pstats.Stats(args.path), args.sort, args.limit))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
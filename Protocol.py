@@ -0,0 +1,201 @@
+import struct
+from collections import namedtuple
+
+from CRC16 import crc16_ccitt
+
+# 数据包协议常量，所有多字节字段均为大端
+FRAME_LENGTH = 138  # 应答包/数据包固定长度
+PACKET_START = 0XEB90  # 包头
+
+# 采集模式，与界面 AcquireModeBox 中的文本保持一致
+MODE_SHORT = "短包"
+MODE_LONG = "长包"
+MODE_CLUSTER = "簇团计数"
+MODE_HIT = "事例击中"
+
+# 应答码
+ACK_OK = 0XF1  # 工作正常
+ACK_SN_GAP = 0XF2  # 指令帧序号不连续
+ACK_BUSY = 0XF3  # 探测器Busy
+ACK_CRC_ERROR = 0XF4  # 指令CRC校验出错
+ACK_INVALID = 0XF5  # 无效指令
+
+# 指令帧：包头(2) + 指令帧序号(2) + 保留(1) + 命令码(1) + 命令参数(2) + CRC(2)，CRC校验范围为 [2:8]
+INSTRUCTION_LENGTH = 10
+SYNC_TRIGGER = bytes.fromhex('EB900000000CAE000000')  # 同步控制触发，指令帧序号固定为0，中间板以同步应答回复
+
+# 命令码
+CMD_SYSTEM = 0X01  # 命令参数 00xx 为指令回环测试，其余见下
+CMD_ACQUIRE = 0X02  # 读数，应答为数据包
+CMD_RESET_COUNTS = 0X03  # 计数复位
+CMD_CTRL_REG = 0X04  # 配置控制寄存器
+CMD_THRESHOLD = 0X05  # 阈值配置
+CMD_ACQUIRE_TIME = 0X06  # 采集时间配置
+CMD_SCALE_THRESHOLD = 0X07  # 刻度阈值
+CMD_SCALE_INTERVAL = 0X08  # 刻度时间间隔
+
+# 命令参数
+PARAM_FPGA_RESET = 0X0100
+PARAM_READ_CTRL_REG = 0X0200
+PARAM_READ_THRESHOLD = 0X0400
+PARAM_READ_ACQUIRE_TIME = 0X0600
+PARAM_ACQUIRE = 0X0100
+PARAM_RESET_COUNTS = 0X0100
+
+THRESHOLD_MAX = 4095  # 阈值与刻度阈值为12位
+
+# 单通道阈值微调，命令参数为 (0b11 << 14) | (通道号-1 << 8) | 阈值
+CMD_CHANNEL_THRESHOLD = 0X02
+THRESHOLD_CHANNELS = 64  # 可微调阈值的通道数，通道号从1开始
+CHANNEL_THRESHOLD_MAX = 31  # 微调阈值为5位
+
+# 解码结果类型
+FRAME_ACK = 'ack'  # 指令应答包
+FRAME_SHORT = 'short'  # 短包数据，32个通道，每通道2字节
+FRAME_LONG = 'long'  # 长包数据，32个通道，每通道4字节
+FRAME_CLUSTER = 'cluster'  # 簇团计数，63个通道，每通道2字节
+FRAME_HIT = 'hit'  # 事例击中，16个32位击中位图
+FRAME_SYNC = 'sync'  # 同步触发应答 11 11 11 11 11
+FRAME_SYNC_ERROR = 'sync_error'  # 中间板同步触发应答异常 00 00 00 00 00
+FRAME_ERROR = 'error'  # 无法识别的数据包
+
+# 错误原因
+ERROR_LENGTH = 'length'  # 数据长度不正确
+ERROR_HEADER = 'header'  # 应答包头错误
+ERROR_SHORT_VERIFY = 'short_verify'  # 短包校验失败
+ERROR_MODE = 'mode'  # 未知采集模式，不做处理
+
+AckFrame = namedtuple('AckFrame', 'kind sn device_id ack_code param crc')
+DataFrame = namedtuple('DataFrame', 'kind sn device_id ack_code counts crc')  # crc为None表示全零数据包，不带CRC
+SyncFrame = namedtuple('SyncFrame', 'kind flag')  # flag: 0 应答异常，1 探测器工作异常，2 触发成功
+ErrorFrame = namedtuple('ErrorFrame', 'kind reason')
+
+# CRC所在的偏移量，校验范围为 [2:偏移量]
+CRC_OFFSET = {
+    FRAME_ACK: 8,
+    FRAME_SHORT: 72,
+    FRAME_LONG: 136,
+    FRAME_CLUSTER: 136,
+    FRAME_HIT: 72,
+}
+
+CHANNELS = {
+    FRAME_SHORT: 32,
+    FRAME_LONG: 32,
+    FRAME_CLUSTER: 63,
+    FRAME_HIT: 32,
+}
+
+# 预编译的结构体，直接在 bytes/memoryview 上解码，避免十六进制字符串转换
+_HEAD = struct.Struct('>HHBB')  # 包头，序号，设备ID，应答码
+_ACK_BODY = struct.Struct('>HH')  # 应答参数，CRC
+_U16 = struct.Struct('>H')
+_SHORT = struct.Struct('>32H')
+_LONG = struct.Struct('>32I')
+_CLUSTER = struct.Struct('>63H')
+_HIT = struct.Struct('>16I')
+_SYNC = struct.Struct('>5s5s')
+_INSTRUCTION_HEAD = struct.Struct('>HHBBH')  # 包头，指令帧序号，保留，命令码，命令参数
+
+_ZERO_TAIL = bytes(FRAME_LENGTH - 9)  # 第9位开始全为0
+_ACK_FILL = [bytes([v]) * (FRAME_LENGTH - 10) for v in range(256)]  # 应答包第10位开始与第9位相同
+_SHORT_FILL = [bytes([v]) * (FRAME_LENGTH - 74) for v in range(256)]  # 短包第74位开始与第73位相同
+_SYNC_HEAD = b'\x11' * 5
+_SYNC_FAIL = b'\x00' * 5
+_SYNC_FLAGS = {b'\x00' * 5: 1, b'\x22' * 5: 2}
+
+# 将一个字节的8个位分散到8个字节通道中，16个位图逐字节累加后不会溢出
+_SPREAD = [sum(((b >> i) & 1) << (8 * i) for i in range(8)) for b in range(256)]
+_HIT_WORDS = 16
+
+
+def hit_counts(data, offset=8):  # 统计16个32位击中位图中每个通道的击中次数
+    counts = []
+    for k in (3, 2, 1, 0):  # 大端字节序，第3字节为通道0-7
+        acc = 0
+        for w in range(_HIT_WORDS):
+            acc += _SPREAD[data[offset + w * 4 + k]]
+        counts.extend(acc.to_bytes(8, 'little'))
+    return tuple(counts)
+
+
+def decode_hit_words(data):  # 取出16个32位击中位图
+    return _HIT.unpack_from(data, 8)
+
+
+def _decode_data(kind, data, sn, device_id, ack_code, has_crc):
+    if kind == FRAME_SHORT:
+        counts = _SHORT.unpack_from(data, 8)
+    elif kind == FRAME_LONG:
+        counts = _LONG.unpack_from(data, 8)
+    elif kind == FRAME_CLUSTER:
+        counts = _CLUSTER.unpack_from(data, 8)
+    else:
+        counts = hit_counts(data)
+    crc = _U16.unpack_from(data, CRC_OFFSET[kind])[0] if has_crc else None
+    return DataFrame(kind, sn, device_id, ack_code, counts, crc)
+
+
+_MODE_KIND = {
+    MODE_SHORT: FRAME_SHORT,
+    MODE_LONG: FRAME_LONG,
+    MODE_CLUSTER: FRAME_CLUSTER,
+    MODE_HIT: FRAME_HIT,
+}
+
+
+def decode_frame(data, mode):  # 按采集模式解码一个数据包，data 可以是 bytes/bytearray/memoryview
+    if len(data) != FRAME_LENGTH:
+        return ErrorFrame(FRAME_ERROR, ERROR_LENGTH)
+
+    view = memoryview(data)
+    start, sn, device_id, ack_code = _HEAD.unpack_from(view, 0)
+
+    if start == PACKET_START:
+        kind = _MODE_KIND.get(mode)
+        if kind is None:
+            return ErrorFrame(FRAME_ERROR, ERROR_MODE)
+
+        if view[9:] == _ZERO_TAIL:  # 第9位开始全为0，判定为数据包
+            return _decode_data(kind, view, sn, device_id, ack_code, False)
+
+        if view[10:] == _ACK_FILL[view[9]]:  # 应答包
+            param, crc = _ACK_BODY.unpack_from(view, 6)
+            return AckFrame(FRAME_ACK, sn, device_id, ack_code, param, crc)
+
+        if kind == FRAME_SHORT and view[74:] != _SHORT_FILL[view[73]]:  # 短包数据应答包长度为74
+            return ErrorFrame(FRAME_ERROR, ERROR_SHORT_VERIFY)
+
+        return _decode_data(kind, view, sn, device_id, ack_code, True)
+
+    head, tail = _SYNC.unpack_from(view, 0)
+    if head == _SYNC_HEAD:
+        return SyncFrame(FRAME_SYNC, _SYNC_FLAGS.get(tail, 0))
+    if head == _SYNC_FAIL:
+        return SyncFrame(FRAME_SYNC_ERROR, 0)
+    return ErrorFrame(FRAME_ERROR, ERROR_HEADER)
+
+
+def hex_dump(data):  # 每个字节转为两位大写十六进制，以空格分隔
+    return data.hex(' ').upper()
+
+
+def channel_threshold_param(channel, value):  # 单通道阈值微调的命令参数
+    if not 1 <= channel <= THRESHOLD_CHANNELS:
+        raise ValueError("通道号超出范围")
+    if not 0 <= value <= CHANNEL_THRESHOLD_MAX:
+        raise ValueError("阈值超出范围")
+    return (0b11 << 14) | (channel - 1 << 8) | (0b000 << 5) | value
+
+
+def channel_threshold_command(channel, value):  # 命令码与命令参数组成的六位十六进制字符串，用于 InstrCombination
+    return "%02X%04X" % (CMD_CHANNEL_THRESHOLD, channel_threshold_param(channel, value))
+
+
+def build_instruction(sn, command, param):  # 组合指令帧，与界面 InstrCombination 的结果相同
+    head = _INSTRUCTION_HEAD.pack(PACKET_START, sn, 0, command, param)
+    return head + crc16_ccitt(head[2:8]).to_bytes(2, 'big')
+
+
+def ctrl_reg_param(test_channel=0, forming_time=0, serial_rate=0, test_signal=0, data_mode=0, working_mode=0):  # 控制寄存器各字段组合为命令参数
+    return (test_channel << 14) | (forming_time << 12) | (serial_rate << 8) | (test_signal << 4) | (data_mode << 2) | working_mode
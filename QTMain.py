@@ -1,94 +1,165 @@
 import sys
 import os
-import matplotlib
 import json
-import pandas as pd
-import openpyxl
-from openpyxl import load_workbook
-# import matplotlib.pyplot as plt
-from matplotlib.figure import Figure
-from matplotlib.backends.backend_qt5agg import FigureCanvas  # pyqt5的画布
-from matplotlib.font_manager import FontProperties
 import datetime
+import numpy as np
+# import matplotlib.pyplot as plt
+from functools import partial
 # from PyQt5 import QtWidgets
-from PyQt5.QtGui import QPixmap, QImage
-from PyQt5.QtWidgets import QMainWindow, QApplication, QFileDialog, QGraphicsScene, QVBoxLayout, QWidget, QPushButton, QLineEdit, QLabel, QDialog, QDialogButtonBox, QFormLayout
+from PyQt5.QtWidgets import QMainWindow, QApplication, QFileDialog, QMessageBox, QGraphicsScene, QVBoxLayout, QWidget, QPushButton, QLineEdit, QLabel, QDialog, QDialogButtonBox, QFormLayout, QCheckBox, QTextBrowser, QInputDialog
 from Ui_DataTransmission import Ui_DataTransmisson
-from PyQt5.QtCore import QThread, pyqtSignal, Qt, QTimer,QEventLoop
-from PyQt5.QtNetwork import QUdpSocket, QHostAddress
-
-matplotlib.use("Qt5Agg")  # 声明使用pyqt5
-matplotlib.rcParams['font.family'] = 'SimHei'  # 'SimHei' 是一种常用的中文黑体
-matplotlib.rcParams['font.size'] = 10
-matplotlib.rcParams['axes.unicode_minus'] = False  # 正确显示负号
-
-
-class MyMatplotlibFigure(FigureCanvas):  # 创建一个绘图类,主要用于绘制能谱图
-    def __init__(self, width=7.1, height=5.51, dpi=1200):
-        fig = Figure(figsize=(width, height), dpi=dpi)
-        self.axes = fig.add_subplot(111)
-        fig.subplots_adjust(left=0.07, right=0.99, top=1, bottom=0.05)
-        self.font_prop = FontProperties(family='SimHei', size=8)
-        self.axes_channels = 32
-        super(MyMatplotlibFigure, self).__init__(fig)
-
-    def draw_bar_chart(self, data):
-        self.axes.clear()  # 清除之前的绘图
-
-        channel_names = list(data.keys())
-        channel_values = list(data.values())
-        bars = self.axes.bar(channel_names, channel_values, color=(29/255, 100/255, 87/255), edgecolor='black')
-
-        # 显示总计数
-        total_counts = sum(channel_values)
-        self.axes.text(0.98, 0.98, f'总计数: {total_counts}', ha='right', va='top', transform=self.figure.transFigure, fontsize=12, fontproperties=self.font_prop, bbox=dict(facecolor='white', alpha=0.8))
-
-        # 设置x轴标签
-        self.axes.set_xticks(range(len(channel_names)))  # 设置x轴刻度位置
-        self.axes.set_xticklabels(range(self.axes_channels), fontproperties=self.font_prop)  # 设置x轴标签
-
-        # 在x轴刻度下方添加计数标签
-        for i, value in enumerate(channel_values):
-            self.axes.text(i, -0.05 * max(channel_values), f'{value}', ha='center', va='top', fontsize=6, fontproperties=self.font_prop)
+from PyQt5.QtCore import QObject, QThread, pyqtSignal, Qt, QTimer,QEventLoop
+from PyQt5.QtGui import QTextCursor, QFontDatabase
+from time import perf_counter_ns
+from CRC16 import crc16_ccitt, crc16_bitwise, CRC16_POLY
+from AcquisitionCore import AcquisitionCore, period_block, DATA_KINDS, TEST_CHANNELS, FORMING_TIMES, SERIAL_PORT_RATES, ENABLE_MODES, DATA_MODES, WORKING_MODES
+from ScanEngine import AdaptiveSteps, STATE_DONE
+from Correlator import DEFAULT_POLICY
+from TrimTable import load_trim_table, save_trim_table, changed_channels, command_channel, TRIM_UNKNOWN
+from DataExport import export_columns_to_xlsx, read_scurve_xlsx
+from SCurveFit import fit_scurves, compute_trims, trims_to_table, fit_report_path, save_fit_report
+from SpectrumView import create_spectrum_canvas, export_bar_chart, CHANNEL_NAMES
+from Protocol import hex_dump, ctrl_reg_param, ACK_OK, ACK_SN_GAP, ACK_BUSY, ACK_CRC_ERROR, ACK_INVALID
+from Profiling import RunProfiler, PROFILE_CPROFILE, PROFILE_SAMPLE
+from Instrumentation import format_snapshot, SPAN_RENDER, SPAN_SAVE
+from LogModel import (LogModel, format_record, LOG_COMM, LOG_SPEC, LOG_BOTH, LOG_RAW_ACK, LOG_RAW_DATA, LOG_COMMAND,
+                      LOG_ACK, LOG_ERROR, LOG_SCAN, LOG_INFO, CATEGORY_NAMES)
+
+
+class SpectrumRenderer(QObject):  # 按固定帧率刷新能谱图，与数据包速率解耦，数据没有变化时跳过
+    def __init__(self, model, canvas, max_fps=20, parent=None, instruments=None):
+        super().__init__(parent)
+        self.model = model
+        self.canvas = canvas
+        self.instruments = instruments  # Instrumentation，启用时记录每帧的绘制耗时
+        self.rendered_version = model.version  # 上一次绘制时模型的版本号
+        self.frames_rendered = 0  # 实际绘制的帧数
+        self.frames_skipped = 0  # 数据没有变化而跳过的帧数
+        self.updates_coalesced = 0  # 两帧之间被合并掉的模型更新次数
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.render_frame)
+        self.set_max_fps(max_fps)
+
+    def set_max_fps(self, max_fps):  # 设置最大刷新帧率
+        self.max_fps = max_fps
+        self.timer.setInterval(max(1, int(1000 / max_fps)))
+
+    def start(self):
+        self.timer.start()
+
+    def stop(self):
+        self.timer.stop()
+
+    def render_frame(self):  # 定时器触发，模型有更新时才重绘
+        version = self.model.version
+        if version == self.rendered_version:
+            self.frames_skipped += 1
+            return
 
-        # 设置y轴标签的字体属性
-        for label in self.axes.get_yticklabels():
-            label.set_fontproperties(self.font_prop)
+        self.updates_coalesced += version - self.rendered_version - 1
+        self.rendered_version = version
+        started = perf_counter_ns() if self.instruments is not None and self.instruments.enabled else 0
+        if self.model.counts:
+            self.canvas.draw_bar_chart(self.model.as_dict(CHANNEL_NAMES))
+        else:
+            self.canvas.clear_plot()
+        if started:
+            self.instruments.record(SPAN_RENDER, perf_counter_ns() - started)
+        self.frames_rendered += 1
+
+    def stats(self):
+        return {
+            "max_fps": self.max_fps,
+            "frames_rendered": self.frames_rendered,
+            "frames_skipped": self.frames_skipped,
+            "updates_coalesced": self.updates_coalesced,
+        }
 
-        y_max = max(channel_values) if max(channel_values) > 0 else 1
-        self.axes.set_ylim(-0.1 * y_max, y_max * 1.1)  # 设置y轴范围
+class LogView(QObject):  # 定时从日志模型取出新记录，一次追加到文本框，文本框最多保留 max_blocks 行
+    def __init__(self, model, browser, targets, interval_ms=100, max_blocks=5000, parent=None):
+        super().__init__(parent)
+        self.model = model
+        self.browser = browser
+        self.targets = targets  # LOG_COMM 或 LOG_SPEC
+        self.browser.document().setMaximumBlockCount(max_blocks)
+        self.shown_version = model.version
+        self.last_seq = model.seq  # 已显示的最后一条记录序号
+        self.last_record = None  # 已显示的最后一条记录，重复消息合并时改写该行
+        self.last_count = 0
+        self.timer = QTimer(self)
+        self.timer.setInterval(interval_ms)
+        self.timer.timeout.connect(self.flush)
+        self.timer.start()
+
+    def flush(self):
+        if self.model.version == self.shown_version:
+            return
+        self.shown_version = self.model.version
+        records, lost = self.model.since(self.last_seq, self.targets)
+        last = self.last_record
+        if last is not None and last.count != self.last_count:  # 最后一行的重复次数变化，改写该行
+            cursor = self.browser.textCursor()
+            cursor.movePosition(QTextCursor.End)
+            cursor.movePosition(QTextCursor.StartOfBlock, QTextCursor.KeepAnchor)
+            cursor.insertText(format_record(last))
+            self.last_count = last.count
+        lines = []
+        if lost:
+            lines.append("…… 省略 %d 条日志" % lost)
+        lines.extend(format_record(record) for record in records)
+        if lines:
+            self.browser.append('\n'.join(lines))
+            self.last_record = records[-1] if records else None
+            self.last_count = self.last_record.count if records else 0
+        self.last_seq = self.model.seq
+
+    def clear(self):
+        self.browser.clear()
+        self.shown_version = self.model.version
+        self.last_seq = self.model.seq
+        self.last_record = None
+
+class ReceiverThread(QThread):  # 定义一个接收数据的线程类，在子线程中运行采集核心的接收引擎，独占UDP套接字读取数据
+    framesReady = pyqtSignal()  # 定义一个信号，环形缓冲区中有新数据时通知主线程取数
+    batchReceived = pyqtSignal(bytes, list)  # 定义一个信号，批量模式下发送合并后的数据包和每个包的偏移量
+    ReceivedError = pyqtSignal(str)  # 定义一个信号，用于发送错误信息
 
-        self.draw()
+    def __init__(self, core, server_addr, local_port, batch_window_ms=10, batch_frames=256, capture_path=None, journal_path=None):  # 初始化函数，batch_window_ms 为0时逐次通知主线程取数，capture_path 为原始数据包记录文件，journal_path 为运行日志
+        super().__init__()
+        self.core = core
+        on_batch = self.batchReceived.emit if batch_window_ms > 0 else None
+        self.engine = core.connect(server_addr, local_port, capture_path=capture_path, notify=self.framesReady.emit,
+                                   on_error=self.ReceivedError.emit, on_batch=on_batch, batch_window=batch_window_ms / 1000,
+                                   batch_frames=batch_frames, start=False, journal_path=journal_path)  # 在主线程中绑定，绑定失败时直接抛出异常
 
-        width, height = self.get_width_height()
-        buf = self.buffer_rgba()
-        qimage = QImage(buf, width, height, QImage.Format_RGBA8888)
-        pixmap = QPixmap.fromImage(qimage)
+    def run(self):  # 线程运行函数
+        self.engine.serve_forever()  # 将数据包读入环形缓冲区，直到 stop 被调用
 
-        return pixmap
+    def consume(self, handler):  # 在主线程中将缓冲区中的数据包一次作为列表交给 handler 处理
+        return self.engine.consume_batch(handler)
 
-    def clear_plot(self):
-        self.axes.clear()
-        # self.draw()
+    def stop(self):  # 停止接收线程，再由采集核心关闭套接字和原始数据包记录，返回接收统计
+        self.engine.stop()
+        self.wait(1000)
+        return self.core.close()
 
-class ReceiverThread(QThread):  # 定义一个接收数据的线程类
-    dataReceived = pyqtSignal(bytes, str, int)  # 定义一个信号，用于发送接收到的数据
-    ReceivedError = pyqtSignal(str)  # 定义一个信号，用于发送错误信息
+class ExportWorker(QThread):  # 在后台线程中保存Excel，保存期间界面不卡顿
+    exportFinished = pyqtSignal(str, int, float)  # 文件路径，写入的周期数（Excel中的列数），耗时
+    exportFailed = pyqtSignal(str)
 
-    def __init__(self, socket):  # 初始化函数
+    def __init__(self, full_path, block, titles):
         super().__init__()
-        self.socket = socket  # 传入一个socket对象
-
-    def run(self):  # 线程运行函数
-        self.socket.readyRead.connect(self.readData)  # 连接信号readyRead到槽函数readData，当缓冲区有数据时，触发readyRead信号
+        self.full_path = full_path
+        self.block = block
+        self.titles = titles
 
-    def readData(self):  # 读取数据
-        while self.socket.hasPendingDatagrams():  # 当缓冲区有数据时
-            datagram, host, port = self.socket.readDatagram(self.socket.pendingDatagramSize())  # 读取数据
-            try:
-                self.dataReceived.emit(datagram, host.toString(), port)  # 发送接收到的数据，发送信号，等待主线程处理，保证线程安全通信
-            except Exception as e:
-                self.ReceivedError.emit('开发板未在监听，请检查开发板的UDP连接: %s' % e)  # 发送错误信息，发送信号，等待主线程处理，保证线程安全通信
+    def run(self):
+        try:
+            periods, elapsed = export_columns_to_xlsx(self.full_path, self.block, self.titles)
+        except Exception as e:
+            self.exportFailed.emit("文件保存失败：%s" % e)
+            return
+        self.exportFinished.emit(self.full_path, periods, elapsed)
 
 class SampStepTotalLengthDialog(QDialog):   # 创建一个图窗用来输入采集步长和总长度
     def __init__(self):
@@ -103,6 +174,8 @@ class SampStepTotalLengthDialog(QDialog):   # 创建一个图窗用来输入采
         
         self.layout.addRow('采集步长:', self.stepInput)
         self.layout.addRow('采集总长度:', self.lengthInput)
+        self.adaptiveInput = QCheckBox('先粗扫，再在计数变化快的区间加密到采集步长', self)
+        self.layout.addRow('自适应扫描:', self.adaptiveInput)
         
         self.buttonBox = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel, self)
         self.buttonBox.accepted.connect(self.accept)
@@ -113,166 +186,173 @@ class SampStepTotalLengthDialog(QDialog):   # 创建一个图窗用来输入采
     def getInputs(self):
         return float(self.stepInput.text()), float(self.lengthInput.text())
 
-class SCurveHandler:    # 用于一键生成S曲线
+    def isAdaptive(self):
+        return self.adaptiveInput.isChecked()
+
+class PerfStatsDialog(QDialog):  # 性能统计面板，每秒刷新一次
+    def __init__(self, Data_transmission, interval_ms=1000):
+        super().__init__(Data_transmission)
+        self.Data_transmission = Data_transmission
+        self.setWindowTitle('性能统计')
+        self.resize(760, 520)
+        self.layout = QVBoxLayout(self)
+        self.browser = QTextBrowser(self)
+        self.browser.setFont(QFontDatabase.systemFont(QFontDatabase.FixedFont))
+        self.layout.addWidget(self.browser)
+        self.buttonBox = QDialogButtonBox(self)
+        self.buttonBox.addButton("清零", QDialogButtonBox.ResetRole).clicked.connect(Data_transmission.PerfStatsReset)
+        self.buttonBox.addButton("导出JSON", QDialogButtonBox.ActionRole).clicked.connect(Data_transmission.PerfStatsDump)
+        self.buttonBox.addButton(QDialogButtonBox.Close).clicked.connect(self.close)
+        self.layout.addWidget(self.buttonBox)
+        self.timer = QTimer(self)
+        self.timer.setInterval(interval_ms)
+        self.timer.timeout.connect(self.refresh)
+
+    def showEvent(self, event):
+        self.refresh()
+        self.timer.start()
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        self.timer.stop()
+        super().hideEvent(event)
+
+    def refresh(self):
+        bar = self.browser.verticalScrollBar()
+        position = bar.value()
+        self.browser.setPlainText('\n'.join(format_snapshot(self.Data_transmission.PerfStats())))
+        bar.setValue(position)
+
+class SCurveHandler:    # 用于一键生成S曲线，界面只读取参数和显示进度，扫描由采集核心中的 SCurveScanEngine 状态机驱动
     def __init__(self, Data_transmission):
         self.Data_transmission = Data_transmission
-        self.current_dac_value = 0
-        self.initial_dac_value = 0
-        self.stop_flag = False  # 初始化标志位
+        self.session = None  # 当前扫描的 ScanSession
+        self.last_xlsx_path = None  # 最近一次生成的S曲线Excel，用于拟合
                 
     def measure_s_curve(self, sampling_step, total_length):
-        self.stop_flag = False  # 每次开始测量前重置标志位
+        core = self.Data_transmission.Core
+        if core.scan is not None and core.scan.running:
+            self.log("S曲线正在测量中")
+            return
         initial_dac_value_str = self.Data_transmission.ThresholdLineEdit.text()  # 获取阈值初值
-        self.initial_dac_value = int(initial_dac_value_str)  # 将阈值初值转化为整数
+        initial_dac_value = int(initial_dac_value_str)  # 将阈值初值转化为整数
         
         AcquireTime = self.Data_transmission.AcquireTimeLineEdit.text()  # 获取采集时长
         AcquireTimeValue = int(AcquireTime)  # 将阈值转化为整数
-        Delay = int(AcquireTimeValue/10 +2000) # 1倍采集时长+2s，定时器的单位是1ms
-        
-        for step in range(0, int(total_length), int(sampling_step)):
-            if self.stop_flag:  # 检查标志位，如果被设置为停止则退出流程
-                self.Data_transmission.SpectroscopyTextBrowser.append("S曲线生成已停止")
-                self.Data_transmission.CommunicationTextBrowser.append("S曲线生成已停止")
-                break
-            
-            self.current_dac_value = self.initial_dac_value + step    # 当前阈值
-            
-            self.Data_transmission.SpectroscopyTextBrowser.append(f"当前DAC阈值： {self.current_dac_value}")
-            self.Data_transmission.CommunicationTextBrowser.append(f"当前DAC阈值： {self.current_dac_value}")
-
-            self.retry_loop(lambda: self.Data_transmission.ThresholdConfig(self.current_dac_value), 
-                    "阈值配置成功", 
-                    "阈值配置信号未接收到应答包，重新发送")
-            
-            self.retry_loop(self.Data_transmission.CountsRest, 
-                    "清零成功", 
-                    "清零信号未接收到应答包，重新发送")
-            
-            self.Data_transmission.ifSynCtrlTriggerSuccess = 0
-            self.Data_transmission.SynCtrlTrigger()
-            
-            loop = QEventLoop()
-            QTimer.singleShot(Delay, loop.quit)
-            loop.exec_()
-            
-            if self.Data_transmission.ifSynCtrlTriggerSuccess == 2:
-                self.retry_loop(self.Data_transmission.AcquireData, 
-                    "读数成功", 
-                    "读数信号未接收到应答包，重新发送")
-            elif self.Data_transmission.ifSynCtrlTriggerSuccess == 1:
-                self.Data_transmission.CommunicationTextBrowser.append("探测器能谱采集工作异常，建议检查")
-                self.Data_transmission.SpectroscopyTextBrowser.append("探测器能谱采集工作异常，建议检查")
-                break
-            elif self.Data_transmission.ifSynCtrlTriggerSuccess == 0:
-                self.Data_transmission.SynCtrlTrigger()
-                QTimer.singleShot(Delay, loop.quit)  # 设置1s的定时器，触发时退出循环
-                loop.exec_()    # 开始循环并等待直到定时器触发退出循环
-                if self.Data_transmission.ifSynCtrlTriggerSuccess == 0:
-                    self.Data_transmission.CommunicationTextBrowser.append("中间板未能收到正确应答信号，建议检查")
-                    self.Data_transmission.SpectroscopyTextBrowser.append("中间板未能收到正确应答信号，建议检查")
-                    break
-                elif self.Data_transmission.ifSynCtrlTriggerSuccess == 2:
-                    self.retry_loop(self.Data_transmission.AcquireData, 
-                    "读数成功", 
-                    "读数信号未接收到应答包，重新发送")
-            
-            self.FileSaveToExcel()  # 保存到excel文件中
-                    
-    def FileSaveToExcel(self):  # 文件保存
-        FilePath = self.Data_transmission.FilePathLineEdit.text()
-        FileName = self.Data_transmission.FileNameLineEdit.text()
+        AcquireMs = AcquireTimeValue / 10  # 硬件采集时长，单位ms
 
-        if not FileName.endswith('.xlsx'):
-            FileName += '.xlsx'
+        full_path = self.Data_transmission.ExcelFilePath()
 
-        full_path = os.path.join(FilePath, FileName)
+        if self.Data_transmission.AdaptiveSCurve:  # 先以 AdaptiveCoarseFactor 倍步长粗扫，再在变化快的区间加密到采集步长
+            adaptive = AdaptiveSteps(initial_dac_value, initial_dac_value + int(total_length), int(sampling_step),
+                                     int(sampling_step) * self.Data_transmission.AdaptiveCoarseFactor)
+            steps = adaptive
+        else:
+            adaptive = None
+            steps = (initial_dac_value + step for step in range(0, int(total_length), int(sampling_step)))
 
-        # 将数据转换为 DataFrame
-        df = pd.DataFrame(self.Data_transmission.spectrum_data_list).T  # 转置使每一步的数据为一列
-     
+        self.Data_transmission.StartRunProfile(full_path, "S曲线")  # 开启剖析时从此处剖析到扫描结束
         try:
-            # 检查并创建文件所在的目录
-            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            self.session = core.start_scan(steps, AcquireMs, full_path, adaptive, log=self.log, on_step=self.on_step,
+                                           on_finished=self.on_scan_finished)  # 上次异常中断遗留的数据先转为Excel
         except Exception as e:
-            self.Data_transmission.SpectroscopyTextBrowser.append("文件路径错误,无法创建：%s" % e)
-            self.Data_transmission.CommunicationTextBrowser.append("文件路径错误,无法创建：%s" % e)
+            self.Data_transmission.StopRunProfile()
+            self.log("文件路径错误,无法创建：%s" % e)
             return
-        
-        # 打开或创建一个新的 Excel 文件
-        new_file = False
-        try:
-            workbook = load_workbook(full_path)
-            sheet = workbook.active
-        except FileNotFoundError:
-            workbook = openpyxl.Workbook()
-            sheet = workbook.active
-            new_file = True
-
-        # 找到下一个空列
-        if new_file:
-            next_col = 1
-        else:
-            next_col = sheet.max_column + 1
-
-        # 写入 DAC 值到第一行
-        sheet.cell(row=1, column=next_col, value=self.current_dac_value)
-
-        # 写入通道数据到后续行
-        for i, value in enumerate(df.iloc[:, -1]):
-            sheet.cell(row=i + 2, column=next_col, value=value)
-
-        # 保存文件
-        workbook.save(full_path)
+        if self.session.recovered:
+            self.log(f"已恢复上次中断的 {self.session.recovered} 步S曲线数据到 {full_path}")
+
+    def on_step(self, dac_value, counts):   # 当前DAC步的能谱已追加到中间文件，扫描结束后统一转为Excel
+        self.log(f"DAC {dac_value} 能谱数据已写入 {self.session.stream_path}")
+
+    def on_scan_finished(self, state, session):  # 扫描完成、失败或停止后已生成Excel
+        self.Data_transmission.StopRunProfile()
+        self.log("S曲线共测量 %d 步，耗时 %.1f s" % (session.engine.steps_done, session.engine.elapsed()))
+        if session.adaptive is not None:
+            self.log("自适应扫描，均匀扫描需 %d 步" % session.adaptive.uniform_steps())
+        if session.error is not None:
+            self.log(session.error)
+            return
+        self.last_xlsx_path = session.xlsx_path
+        self.log(f"{session.steps} 步能谱数据已保存到 {session.xlsx_path}")
+        if state == STATE_DONE and self.Data_transmission.AutoEqualize:  # 扫描完成后自动拟合并计算微调值
+            self.Data_transmission.SCurveEqualize(self.last_xlsx_path, push=self.Data_transmission.AutoPushTrims)
 
-        self.Data_transmission.SpectroscopyTextBrowser.append(f"能谱数据已保存到 {full_path}")
-        self.Data_transmission.CommunicationTextBrowser.append(f"能谱数据已保存到 {full_path}")           
+    def log(self, message):
+        self.Data_transmission.log(message, LOG_SCAN)
             
-    def retry_loop(self, action, success_message, fail_message):
-        success = False
-        while not success:
-            action()
-            if self.Data_transmission.Loop() == 1:
-                success = True
-                self.Data_transmission.SpectroscopyTextBrowser.append(success_message)
-                self.Data_transmission.CommunicationTextBrowser.append(success_message)
-            else:
-                self.Data_transmission.SpectroscopyTextBrowser.append(fail_message)
-                self.Data_transmission.CommunicationTextBrowser.append(fail_message)                   
-        
     def stop_s_curve(self):
-        self.stop_flag = True  # 设置标志位为停止    
+        self.Data_transmission.Core.stop_scan()
         
 class DataTransmission(QMainWindow, Ui_DataTransmisson):
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, spectrum_backend=None):
         super(DataTransmission, self).__init__(parent)
         self.setupUi(self)  # 设置UI界面
 
-        self.plotCanvas = MyMatplotlibFigure(width=7.1, height=5.51, dpi=1200)  # 创建一个绘图类
+        self.plotCanvas = create_spectrum_canvas(spectrum_backend, width=7.1, height=5.51)  # 创建能谱图，qpainter/pyqtgraph/matplotlib 三种后端可选，所有数据包共用
         self.initUI()  # 初始化能谱图窗口
-        self.spectrum_data_list = []
+        self.SpectrumRetainRows = 100_000  # 内存中最多保留的能谱行数，约25MB
+        self.SpectrumSpillPath = None  # 超出保留行数时溢出的文件路径，None 则丢弃最早的数据
+        self.CommandPolicy = DEFAULT_POLICY  # 指令应答超时与重发策略
+        self.LogCapacity = 5000  # 日志缓冲区和每个文本框最多保留的行数
+        self.LogFlushMs = 100  # 文本框刷新日志的间隔
+        self.Core = AcquisitionCore(self.AcquireModeBox.currentText(), self.CommandPolicy, retain_rows=self.SpectrumRetainRows,
+                                    spill_path=self.SpectrumSpillPath)  # 采集核心：指令收发、应答匹配、解码、扫描与保存，界面只负责参数与显示
+        self.LogModel = LogModel(self.LogCapacity)  # 日志先写入固定容量的环形缓冲区，由两个文本框定时批量取出显示
+        self.CommunicationLog = LogView(self.LogModel, self.CommunicationTextBrowser, LOG_COMM, self.LogFlushMs, self.LogCapacity, self)
+        self.SpectroscopyLog = LogView(self.LogModel, self.SpectroscopyTextBrowser, LOG_SPEC, self.LogFlushMs, self.LogCapacity, self)
+        self.Core.log = self.logError
+        self.Core.on_send = self.onInstructionSent
+        self.Core.on_ack = self.Insdistinguish
+        self.Core.on_data = self.onDataFrame
+        self.Core.on_retry = self.onCommandRetry
+        self.Core.on_failed = self.onCommandFailed
+        self.SpectrumModel = self.Core.model  # 能谱数据模型，数据包只更新模型
+        self.SpectrumStore = self.Core.store  # 按块预分配的能谱存储，超出保留行数后溢出到磁盘或丢弃
+        self.Correlator = self.Core.correlator  # 按指令帧序号匹配应答
+        self.MaxFPS = 20  # 能谱图最大刷新帧率
+        self.SpectrumRenderer = SpectrumRenderer(self.SpectrumModel, self.plotCanvas, self.MaxFPS, self, self.Core.instruments)
+        self.SpectrumRenderer.start()
         self.SCurveHandler = SCurveHandler(self)
+        self.ChannelLongDATA = {}  # 最近一次数据包的 {通道名: 计数}
         
-        self.InsSN = 1  # 初始化指令帧序号为1
-        self.InstrSN = format(self.InsSN, '04X')
-        self.InstrReserve = 0X00  # 初始化保留字段为0
-        self.str_InstrReserve = f"{self.InstrReserve:02X}"
-        self.InstrPacketStart = 0XEB90  # 初始化包头为0xEB90
-        self.str_InstrPacketStart = f"{self.InstrPacketStart:04X}"
         self.CtrlRegTestChannel = 0B00  # 初始化控制寄存器15-14选择测试通道，默认00为ch1，01为ch9，10为ch17，11为ch25
         self.CtrlRegFormingTime = 0B00  # 初始化控制寄存器13-12成形时间调节，默认00为40ns，01为80ns，10为120ns，11为160ns
         self.CtrlRegSerialPortRate = 0B00_00   # 初始化控制寄存器11-8串口速率模式，0000为Debug模式，0001为正常模式，0010\0011保留
         self.CtrlRegTestSignalOutputEnable = 0B00_00 # 初始化控制寄存器保留字段7-5为0, 最后一个0用于设置测试信号使能，0为禁止，1为使能
         self.CtrlRegDataMode = 0B00  # 初始化控制寄存器3-2数据模式，00为短包，01为长包,10\11保留
         self.CtrlRegWorkingMode = 0B00  # 初始化控制寄存器1-0工作模式与触发接收使能，高位控制工作模式，0为正常取数，1为电子学刻度。低位控制触发接收使能，0为禁止，1为使能
-        self.ifdatareceived = 0 # 判断是否接收到指令
-        dac_value = 0   # EXTENSION
-        self.ifSynCtrlTriggerSuccess = 0
+        self.CorrelatorTimer = QTimer(self)  # 定时检查指令应答超时和扫描状态机的等待
+        self.CorrelatorTimer.setInterval(10)
+        self.CorrelatorTimer.timeout.connect(self.Core.poll)
+        self.CorrelatorTimer.start()
+        self.PipelineWindow = 8  # 批量配置时最多同时等待应答的指令数
+        self.TrimTable = None  # 载入的64通道阈值微调表
+        self.AppliedTrims = None  # 上次下发成功的阈值微调表，下发时只发送有变化的通道
+        self.DACPerTrim = 1.0  # 微调值每加1，通道50%点移动的DAC数，由刻度测量得到
+        self.TrimPolarity = 1  # 微调值增大时50%点升高为1，降低为-1
+        self.AutoEqualize = False  # S曲线扫描完成后自动拟合并计算微调值
+        self.AutoPushTrims = False  # 自动拟合后直接下发微调值，否则询问
+        self.AdaptiveSCurve = False  # S曲线自适应扫描：先粗扫，再只在计数变化快的区间加密
+        self.AdaptiveCoarseFactor = 8  # 粗扫步长为采集步长的倍数
+        self.receiverThread = None  # UDP接收线程，绑定后创建
+        self.BatchWindowMs = 10  # 接收线程合并数据包的时间窗口，单位ms，为0时逐包通知
+        self.BatchFrames = 256  # 每批最多合并的数据包数
+        self.ExportInBackground = True  # 周期采集的Excel在后台线程中保存
+        self.exportWorker = None
+        self.ProfileRuns = False  # 剖析S曲线和周期采集，结果与Excel文件放在同一目录
+        self.ProfileMode = PROFILE_CPROFILE  # cProfile 确定性剖析，或开销更小的采样剖析
+        self.ProfileIntervalMs = 5  # 采样剖析的采样间隔
+        self.runProfiler = None  # 正在进行的剖析
+        self.CapturePath = None  # 原始数据包记录文件，绑定UDP时开始记录，可用 Capture.py 离线回放
+        self.JournalEnabled = False  # 绑定UDP时在文件路径下新建运行日志，记录每条指令、应答、数据包和扫描步，可用 RunJournal.py 按时间查询
         
         # 信号槽连接,实现具体功能
         self.FilePathchooseButton.clicked.connect(self.openFolderDialog)  # 打开文件路径
         self.UDPBindButton.clicked.connect(self.UDPBind)  # 绑定UDP
         self.SendInsButton.clicked.connect(self.SendIns)  # 发送指令，只需要输入命令码和命令参数，也就是六位十六进制数
         self.AcquireModeConfigButton.clicked.connect(self.on_AcquireMode_changed)  # 测试模式检测
+        self.AcquireModeBox.currentTextChanged.connect(self.Core.set_mode)  # 按界面选择的采集模式解码数据包
         self.InstrLoopTest.clicked.connect(self.on_InsLoopTest)  # 指令回环测试
         self.AcquireButton.clicked.connect(self.AcquireData)  # 采集数据
         self.CountsRestButton.clicked.connect(self.CountsRest)  # 计数复位
@@ -296,524 +376,216 @@ class DataTransmission(QMainWindow, Ui_DataTransmisson):
         self.StopSCurveButton.clicked.connect(self.SCurveHandler.stop_s_curve)  # 停止测量S曲线
         self.PeriodButton.clicked.connect(self.PeriodCollect)   # 周期同步触发和读数
         self.SingleChannelButton.clicked.connect(self.SingleChannelThresholdTuning)
+        SpectrumMenu = self.menuBar().addMenu("能谱图")
+        SpectrumMenu.addAction("导出能谱图…", self.SpectrumExportSelect)  # matplotlib 高分辨率图片，用于发表
+        RawMenu = self.menuBar().addMenu("原始数据")
+        RawMenu.addAction("记录原始数据包…", self.CaptureSelect)  # 记录的文件可用 Capture.py 离线回放
+        JournalAction = RawMenu.addAction("绑定时记录运行日志")
+        JournalAction.setCheckable(True)
+        JournalAction.setChecked(self.JournalEnabled)
+        JournalAction.toggled.connect(self.JournalToggle)
+        TrimMenu = self.menuBar().addMenu("阈值微调表")   # 64通道阈值微调表的载入、下发与保存
+        TrimMenu.addAction("载入微调表", self.TrimTableLoad)
+        TrimMenu.addAction("下发微调表", self.TrimTableApply)
+        TrimMenu.addAction("保存已下发的微调表", self.TrimTableSave)
+        TrimMenu.addAction("S曲线拟合并计算微调值", self.SCurveEqualize)
+        LogMenu = self.menuBar().addMenu("日志")   # 按类别显示或隐藏日志，数据包原文默认不显示
+        for category, name in CATEGORY_NAMES.items():
+            action = LogMenu.addAction(name)
+            action.setCheckable(True)
+            action.setChecked(self.LogModel.wants(category))
+            action.toggled.connect(partial(self.LogModel.set_enabled, category))
+        LogMenu.addSeparator()
+        LogMenu.addAction("清空日志", self.LogClear)
+        PerfMenu = self.menuBar().addMenu("性能统计")   # 接收、解码、校验、绘图和保存各阶段的耗时直方图与数据包计数
+        PerfAction = PerfMenu.addAction("启用性能统计")
+        PerfAction.setCheckable(True)
+        PerfAction.setChecked(self.Core.instruments.enabled)
+        PerfAction.toggled.connect(self.Core.instruments.set_enabled)
+        PerfMenu.addAction("统计面板", self.PerfStatsShow)
+        PerfMenu.addAction("导出统计 JSON…", self.PerfStatsDump)
+        PerfMenu.addAction("清零", self.PerfStatsReset)
+        self.perfStatsDialog = None
+        ProfileMenu = self.menuBar().addMenu("性能剖析")  # 现场采集慢时记录程序在做什么，结果带有当前配置
+        ProfileAction = ProfileMenu.addAction("剖析S曲线与周期采集")
+        ProfileAction.setCheckable(True)
+        ProfileAction.setChecked(self.ProfileRuns)
+        ProfileAction.toggled.connect(self.ProfileRunsToggle)
+        SampleAction = ProfileMenu.addAction("使用采样剖析（开销小，输出 speedscope）")
+        SampleAction.setCheckable(True)
+        SampleAction.setChecked(self.ProfileMode == PROFILE_SAMPLE)
+        SampleAction.toggled.connect(lambda checked: setattr(self, 'ProfileMode', PROFILE_SAMPLE if checked else PROFILE_CPROFILE))
+        ProfileMenu.addAction("剖析接下来一段时间…", self.ProfileWindow)
+        ProfileMenu.addAction("停止剖析", self.StopRunProfile)
         
     def initUI(self):  # 为能谱图初始化一个场景，建立图窗
         # 创建一个场景,初始化能谱图窗
         self.scene = QGraphicsScene(self)
         self.scene.addWidget(self.plotCanvas)
         self.SpectroscopyView.setScene(self.scene)
+        self.SpectroscopyView.fitInView(self.scene.sceneRect(), Qt.KeepAspectRatio)  # 适应图形到视图
 
-    def send_data(self, data):   # 发送数据
-        self.InsSN += 1  # 指令帧序号加1  
-        # self.CommunicationTextBrowser.append(f"指令帧: {self.InsSN}")
-        # self.SpectroscopyTextBrowser.append(f"指令帧: {self.InsSN}")
-        
-        if self.InsSN > 65535:  # 指令帧序号超出范围，抛出异常
-            self.SpectroscopyTextBrowser.append("指令溢出范围，无法发送")
-            raise ValueError("指令溢出范围，无法发送")
-        self.InstrSN = format(self.InsSN, '04X')  # 将指令帧序号转化为四位十六进制
-        
+    def log(self, message, category=LOG_INFO, targets=LOG_BOTH):  # 写入日志，targets 选择显示在通信和/或能谱文本框
+        self.LogModel.write(message, category, targets)
+
+    def logError(self, message):  # 采集核心和接收线程的错误提示
+        self.log(message, LOG_ERROR, LOG_COMM)
+
+    def LogClear(self):
+        self.LogModel.clear()
+        self.CommunicationLog.clear()
+        self.SpectroscopyLog.clear()
+
+    def send_data(self, data, policy=None, expect_ack=True):   # 发送数据，返回等待应答的 CommandFuture，发送失败或不需要应答时返回None
         if isinstance(data, str):
             # 如果消息是字符串，使用 UTF-8 编码转换为 bytes
             data = data.encode('utf-8')
-        elif isinstance(data, bytes):
-            # 如果消息是 bytes，直接发送
-            data = data
-            
-        try:
-            self.udpSocket.writeDatagram(data, QHostAddress(self.IPAddress), self.UDPPort)  # 发送数据
-        except Exception as e:
-            self.CommunicationTextBrowser.append("套接字未绑定，请检查连接: %s" % e)
-            self.SpectroscopyTextBrowser.append("套接字未绑定，请检查连接: %s" % e)
+        return self.send_command(self.Core.send, data, policy, expect_ack)
 
-        self.Instruction = data.hex()  # 将指令转化为十六进制
-        self.UpperInstruction = ' '.join([self.Instruction[i:i + 2].upper() for i in range(0, len(self.Instruction), 2)])  # 每两个字符之间加一个空格
-        self.CommunicationTextBrowser.append("发送指令：%s" % self.UpperInstruction)
-        # self.SpectroscopyTextBrowser.append("发送指令：%s" % self.UpperInstruction)
-            
-    def onDataReceived(self, data, host, port):  # 接收数据
-        Hex_data = data.hex()
-        
-        self.ifdatareceived += 1    # 接收到信号则+1
-        
-        ls = []  # 用于存储解码后的数据
-        for i in range(len(Hex_data) // 2):  # 对十六进制数据进行byte解码，且转化为大写
-            hex_value = Hex_data[i * 2].upper() + Hex_data[i * 2 + 1].upper()
-            ls.append(hex_value)
-
-        OData = ' '.join(ls)
-        self.CommunicationTextBrowser.append("[%s] : %s" % (self.Currenttimemessage(), OData))  # 在主界面显示解码后的数据
-        self.SpectroscopyTextBrowser.append("[%s] : %s" % (self.Currenttimemessage(), OData))  # 在配置界面显示接收到的数据
-
-        self.DataReceiveVerify(ls)  # 对接收到的数据进行校验并且解码
-        
-    def Currenttimemessage(self):  # 获取当前时间和消息
-        # 获取当前时间
-        current_time = datetime.datetime.now()
-        # 格式化时间为易读的格式
-        formatted_time = current_time.strftime("%H:%M:%S")
-        # 组合时间和消息
-        return formatted_time
-
-    def DataReceiveVerify(self, data):  # 应答包包头与CRC校验
-        ls = data
-        AcquireMode = self.AcquireModeBox.currentText()
-        if len(ls) == 138:
-            if ls[0] == 'EB' and ls[1] == '90':  # 判断数据包头是否为0xEB90，且数据长度是否为138
-                if AcquireMode == "短包":  # 判断是否为短包模式
-                    # EXTENSION    
-                    if all(x == '00' for x in ls[9:]):  # 检查第9位开始是否全为0，判定为短包
-                        self.ShortDatadistinguish(ls)
-                        
-                    elif all(x == ls[9] for x in ls[10:]):    #检查是否为应答包
-                        InstrCRC = ls[8] + ls[9]  # 取出数据包中的CRC码
-    
-                        CRCVerify = ls[2] + ls[3] + ls[4] + ls[5] + ls[6] + ls[7]  # 取出数据包中的CRC校验字段
-                        CRCVerify_bytes = bytes.fromhex(CRCVerify)  # 将CRC校验字段转化为字节
-                        CRCVerify_result = self.InstrCRCverify(CRCVerify_bytes)  # 对数据包进行CRC校验
-                        CRCVerify_result = format(CRCVerify_result, '04X')  # 将CRC校验结果转化为十六进制
-                        self.Insdistinguish(ls)
-                        # EXTENSION
-                        # if InstrCRC == CRCVerify_result:
-                        #     self.Insdistinguish(ls)  # CRC校验无误时，进一步进行指令区分
-                        # else:
-                        #     self.CommunicationTextBrowser.append("CRC校验失败")
-                        #     # raise ValueError("CRC校验失败")
-                            
-                    elif all(x == ls[73] for x in ls[74:]):  # 检查是否为短包，短包数据应答包长度为74  EXTENSION
-                        InstrCRC = ls[72] + ls[73]
-
-                        CRCVerify = ''.join(ls[2:72])  # 取出数据包中的CRC校验字段
-                        CRCVerify_bytes = bytes.fromhex(CRCVerify)  # 将CRC校验字段转化为字节
-                        CRCVerify_result = self.InstrCRCverify(CRCVerify_bytes)  # 对数据包进行CRC校验
-                        CRCVerify_result = format(CRCVerify_result, '04X')  # 将CRC校验结果转化为十六进制
-                        self.ShortDatadistinguish(ls)
-                        # EXTENSION
-                        # if InstrCRC == CRCVerify_result:
-                        #     self.ShortDatadistinguish(ls)  # CRC校验无误时，进一步进行指令区分
-                        # else:
-                        #     self.CommunicationTextBrowser.append("CRC校验失败")
-                        #     # raise ValueError("CRC校验失败")
-                    else:
-                        self.CommunicationTextBrowser.append("短包校验失败")
-                
-                elif AcquireMode == "长包":  # 判断是否为长包模式
-                    # EXTENSION    
-                    if all(x == '00' for x in ls[9:]):  # 检查第9位开始是否全为0，判定为长包
-                        self.LongDatadistinguish(ls)
-                        
-                    elif all(x == ls[9] for x in ls[10:]):    #检查是否为应答包
-                        InstrCRC = ls[8] + ls[9]  # 取出数据包中的CRC码
-    
-                        CRCVerify = ls[2] + ls[3] + ls[4] + ls[5] + ls[6] + ls[7]  # 取出数据包中的CRC校验字段
-                        CRCVerify_bytes = bytes.fromhex(CRCVerify)  # 将CRC校验字段转化为字节
-                        CRCVerify_result = self.InstrCRCverify(CRCVerify_bytes)  # 对数据包进行CRC校验
-                        CRCVerify_result = format(CRCVerify_result, '04X')  # 将CRC校验结果转化为十六进制
-                        self.Insdistinguish(ls)
-                        # EXTENSION
-                        # if InstrCRC == CRCVerify_result:
-                        #     self.Insdistinguish(ls)  # CRC校验无误时，进一步进行指令区分
-                        # else:
-                        #     self.CommunicationTextBrowser.append("CRC校验失败")
-                        #     # raise ValueError("CRC校验失败")
-                                
-                    else:   # 若不是应答包也不是短包，则是长包，长包数据应答包长度为138
-                        InstrCRC = ls[136] + ls[137]
-
-                        CRCVerify = ''.join(ls[2:136])  # 取出数据包中的CRC校验字段
-                        CRCVerify_bytes = bytes.fromhex(CRCVerify)  # 将CRC校验字段转化为字节
-                        CRCVerify_result = self.InstrCRCverify(CRCVerify_bytes)  # 对数据包进行CRC校验
-                        CRCVerify_result = format(CRCVerify_result, '04X')  # 将CRC校验结果转化为十六进制
-                        self.LongDatadistinguish(ls)
-                        # EXTENSION
-                        # if InstrCRC == CRCVerify_result:
-                        #     self.LongDatadistinguish(ls)  # CRC校验无误时，进一步进行指令区分
-                        #     self.CommunicationTextBrowser.append("CRC校验成功")
-                        # else:
-                        #     self.CommunicationTextBrowser.append("CRC校验失败")
-                        #     # raise ValueError("CRC校验失败")
-                elif AcquireMode == "簇团计数":  # 判断是否为长包模式
-                    if all(x == '00' for x in ls[9:]):  # 检查第9位开始是否全为0，判定为长包
-                        self.ClusterDatadistinguish(ls)
-                        
-                    elif all(x == ls[9] for x in ls[10:]):    #检查是否为应答包
-                        InstrCRC = ls[8] + ls[9]  # 取出数据包中的CRC码
-    
-                        CRCVerify = ls[2] + ls[3] + ls[4] + ls[5] + ls[6] + ls[7]  # 取出数据包中的CRC校验字段
-                        CRCVerify_bytes = bytes.fromhex(CRCVerify)  # 将CRC校验字段转化为字节
-                        CRCVerify_result = self.InstrCRCverify(CRCVerify_bytes)  # 对数据包进行CRC校验
-                        CRCVerify_result = format(CRCVerify_result, '04X')  # 将CRC校验结果转化为十六进制
-                        self.Insdistinguish(ls)
-                    else:   # 若不是应答包也不是短包，则是长包，长包数据应答包长度为138
-                        InstrCRC = ls[136] + ls[137]
-
-                        CRCVerify = ''.join(ls[2:136])  # 取出数据包中的CRC校验字段
-                        CRCVerify_bytes = bytes.fromhex(CRCVerify)  # 将CRC校验字段转化为字节
-                        CRCVerify_result = self.InstrCRCverify(CRCVerify_bytes)  # 对数据包进行CRC校验
-                        CRCVerify_result = format(CRCVerify_result, '04X')  # 将CRC校验结果转化为十六进制
-                        self.ClusterDatadistinguish(ls)
-                elif AcquireMode == "事例击中":  # 判断是否为长包模式
-                    if all(x == '00' for x in ls[9:]):  # 检查第9位开始是否全为0，判定为长包
-                        self.HitDatadistinguish(ls)
-                        
-                    elif all(x == ls[9] for x in ls[10:]):    #检查是否为应答包
-                        InstrCRC = ls[8] + ls[9]  # 取出数据包中的CRC码
-    
-                        CRCVerify = ls[2] + ls[3] + ls[4] + ls[5] + ls[6] + ls[7]  # 取出数据包中的CRC校验字段
-                        CRCVerify_bytes = bytes.fromhex(CRCVerify)  # 将CRC校验字段转化为字节
-                        CRCVerify_result = self.InstrCRCverify(CRCVerify_bytes)  # 对数据包进行CRC校验
-                        CRCVerify_result = format(CRCVerify_result, '04X')  # 将CRC校验结果转化为十六进制
-                        self.Insdistinguish(ls)
-                    else:   # 若不是应答包也不是短包，则是长包，长包数据应答包长度为138
-                        InstrCRC = ls[72] + ls[73]
-
-                        CRCVerify = ''.join(ls[2:72])  # 取出数据包中的CRC校验字段
-                        CRCVerify_bytes = bytes.fromhex(CRCVerify)  # 将CRC校验字段转化为字节
-                        CRCVerify_result = self.InstrCRCverify(CRCVerify_bytes)  # 对数据包进行CRC校验
-                        CRCVerify_result = format(CRCVerify_result, '04X')  # 将CRC校验结果转化为十六进制
-                        self.HitDatadistinguish(ls)
-                        
-            elif ls[0] == '11' and ls[1] == '11' and ls[2] == '11' and ls[3] == '11' and ls[4] == '11':
-                self.ifSynCtrlTriggerSuccess = 0
-                self.ifSynCtrlTriggerSuccess = self.SynCtrlTriggerCommandJudge(ls)
-                
-            elif ls[0] == '00' and ls[1] == '00' and ls[2] == '00' and ls[3] == '00' and ls[4] == '00':
-                self.CommunicationTextBrowser.append("中间板未能收到正确的同步触发应答信号，请再次触发或停机检查")
-                
-            else:
-                self.CommunicationTextBrowser.append("应答包头错误")
+    def send_command(self, action, *args):  # 调用采集核心的指令方法，参数超出范围或套接字未绑定时在界面提示，返回 CommandFuture
+        try:
+            return action(*args)
+        except ValueError as e:
+            self.log(str(e), LOG_ERROR)
+        except OSError as e:
+            self.log("套接字未绑定，请检查连接: %s" % e, LOG_ERROR)
+        return None
+
+    def onInstructionSent(self, data):  # 采集核心发出指令后显示
+        self.log("发送指令：%s" % hex_dump(data), LOG_COMMAND, LOG_COMM)  # 每两个字符之间加一个空格
+    def onCommandRetry(self, future):  # 指令超时未应答，已原样重发，指令帧序号不变
+        message = "指令 %d 未接收到应答包，第 %d 次重新发送" % (future.sn, future.attempts - 1)
+        self.log(message, LOG_COMMAND)
+        self.log("重发指令：%s" % hex_dump(future.data), LOG_COMMAND, LOG_COMM)
+    def onCommandFailed(self, future):  # 重发次数用完仍未应答
+        self.log(future.error, LOG_ERROR)
             
-        else:
-            self.CommunicationTextBrowser.append("数据长度不正确")
-
-    def AckCodeVerify(self, data):  # 应答码校验
-        AckCode = data[5]  # 取出应答包中的应答码
-
-        if AckCode == 'F1':
-            self.CommunicationTextBrowser.append("工作正常")
-            self.SpectroscopyTextBrowser.append('工作正常')
+    def onFramesReady(self):  # 从接收线程的环形缓冲区中取出全部数据包并处理
+        if self.receiverThread is None:  # UDPClose 之后才送达的排队信号
+            return
+        self.receiverThread.consume(self.onFramesReceived)
+
+    def onBatchReceived(self, buffer, offsets):  # 一次处理接收线程合并的一批数据包
+        view = memoryview(buffer)
+        self.onFramesReceived([view[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)])
+
+    def onFramesReceived(self, frames):  # 先解码整批数据包并按批校验CRC，再逐个处理
+        decoded = [self.Core.decode(data) for data in frames]
+        for data, frame, crc_ok in zip(frames, decoded, self.Core.verify_batch(frames, decoded)):
+            self.onDataReceived(data, frame, crc_ok)
+
+    def onDataReceived(self, data, frame=None, crc_ok=None):  # 接收数据，数据包原文只在对应日志类别打开时才复制，显示时才转为十六进制
+        frame = self.Core.decode(data) if frame is None else frame
+        category = LOG_RAW_DATA if frame.kind in DATA_KINDS else LOG_RAW_ACK
+        if self.LogModel.wants(category):
+            self.LogModel.write(bytes(data), category)
+        self.DataReceiveVerify(data, frame, crc_ok)  # 对接收到的数据进行校验并且解码
+
+    def DataReceiveVerify(self, data, frame=None, crc_ok=None):  # 交给采集核心校验并解码，按数据包类型回调 Insdistinguish/onDataFrame
+        return self.Core.handle_frame(data, frame, crc_ok)
+    def AckCodeVerify(self, AckCode):  # 应答码校验
+        if AckCode == ACK_OK:
+            self.log("工作正常", LOG_ACK)
             return 0000
-        elif AckCode == 'F2':
-            self.SpectroscopyTextBrowser.append('指令帧序号不连续，疑似出现指令丢失，建议检查')
-            self.CommunicationTextBrowser.append("指令帧序号不连续，疑似出现指令丢失，建议检查")
+        elif AckCode == ACK_SN_GAP:
+            self.log("指令帧序号不连续，疑似出现指令丢失，建议检查", LOG_ACK)
             return 0000
-        elif AckCode == 'F3':
-            self.SpectroscopyTextBrowser.append('探测器正处于Busy状态，不执行指令，建议等待后再试')
-            self.CommunicationTextBrowser.append("探测器正处于Busy状态，不执行指令，建议等待后再试")
+        elif AckCode == ACK_BUSY:
+            self.log("探测器正处于Busy状态，不执行指令，建议等待后再试", LOG_ACK)
             # EXTENSION
             # return 1111
             return 0000
-        elif AckCode == 'F4':
+        elif AckCode == ACK_CRC_ERROR:
             # EXTENSION
             # self.SpectroscopyTextBrowser.append('CRC校验出错，指令包可能已损坏，不执行指令，建议检查')
             # self.CommunicationTextBrowser.append("CRC校验出错，指令包可能已损坏，不执行指令，建议检查")
             # return 1111
             return 0000
-        elif AckCode == 'F5':
-            self.SpectroscopyTextBrowser.append('无效指令：指令包中的指令码无法识别，不执行指令，建议检查')
-            self.CommunicationTextBrowser.append("无效指令：指令包中的指令码无法识别，不执行指令，建议检查")
+        elif AckCode == ACK_INVALID:
+            self.log("无效指令：指令包中的指令码无法识别，不执行指令，建议检查", LOG_ACK)
             return 1111
         else:
-            self.SpectroscopyTextBrowser.append('未定义应答码，建议检查')
-            self.CommunicationTextBrowser.append("未定义应答码，建议检查")
+            self.log("未定义应答码，建议检查", LOG_ACK)
             return 1111
 
-    def Insdistinguish(self, data):  # 应答序号与指令序号匹配，进一步区分指令
-        ls = data
-
-        VerifyCode = self.AckCodeVerify(ls)  # 应答码检测
+    def Insdistinguish(self, frame, instruction):  # 显示应答码，指令已执行时进一步区分指令；应答与指令的匹配由采集核心完成
+        VerifyCode = self.AckCodeVerify(frame.ack_code)  # 应答码检测
         if VerifyCode == 0000:
-            pass
-        else:
+            self.AckInsdistinguish(frame, instruction)
+    def AckInsdistinguish(self, frame, Instr):  # 应答指令区分，Instr 为与应答序号匹配的指令，没有时为上一条发送的指令
+        if Instr is None:
             return
+        AckParam = frame.param  # 应答参数
 
-        self.DeviceID = int(ls[4], 16)  # 取出应答包中的设备ID
-        self.AckSN = int(ls[2]+ls[3], 16)  # 取出应答包中的应答序号
-        self.AckInsdistinguish(ls)
-        # EXTENSION
-        # if self.AckSN == self.InsSN - 1:  # 匹配应答指令序号与指令帧序号（指令帧序号每次发送后会+1）
-        #     self.SpectroscopyTextBrowser.append('应答序号与指令序号匹配')
-        #     self.CommunicationTextBrowser.append('应答序号与指令序号匹配')
-        #     self.AckInsdistinguish(ls)  # 根据应答参数做下一步行为
-        # else:
-        #     self.SpectroscopyTextBrowser.append('应答序号与指令序号不匹配，疑似出现指令丢失，建议检查')
-        #     self.CommunicationTextBrowser.append('应答序号与指令序号不匹配，疑似出现指令丢失，建议检查')
-
-    def AckInsdistinguish(self, data):  # 应答指令区分
-        Ackls = data
-        str_Ackls = " ".join(Ackls)  # 将应答指令组合
-
-        Instrls = []  # 用于存储上一条发送的指令
-        for i in range(len(self.Instruction) // 2):  # 对十六进制数据进行byte解码，且转化为大写
-            hex_value = self.Instruction[i * 2].upper() + self.Instruction[i * 2 + 1].upper()
-            Instrls.append(hex_value)
-
-        if Instrls[5] == '01':  # 命令码为0x01
-            if Instrls[6] == '00':  # 指令回环测试 
-                self.CommunicationTextBrowser.append('回复指令：%s' % Ackls[7])
-
-            elif Instrls[6] + Instrls[7] == '0200':  # 读取控制寄存器的配置
-                CtrlReg = int(Ackls[6] + Ackls[7], 16)  # 取出应答包中的控制寄存器
-                self.CommunicationTextBrowser.append('控制寄存器配置为：%s' % f"{CtrlReg:016b}")
-                CtrlRegls = []
-                for i in range(16):
-                    CtrlRegls.append(f"{CtrlReg:016b}"[i])
-
-                if CtrlRegls[11] == '0':  # 测试信号输出使能
-                    self.CommunicationTextBrowser.append('测试信号设置：输出禁止')
-                elif CtrlRegls[11] == '1':
-                    self.CommunicationTextBrowser.append('测试信号设置：输出使能')
-
-                if CtrlRegls[12] + CtrlRegls[13] == '00':  # 数据输出模式
-                    self.CommunicationTextBrowser.append('数据输出模式：短数据包模式')
-                elif CtrlRegls[12] + CtrlRegls[13] == '01':
-                    self.CommunicationTextBrowser.append('数据输出模式：长数据包模式')
-
-                if CtrlRegls[14] == '0':  # 工作模式设置
-                    self.CommunicationTextBrowser.append('工作模式设置：正常取数模式')
-                elif CtrlRegls[14] == '1':
-                    self.CommunicationTextBrowser.append('工作模式设置：电子学刻度模式')
-
-                if CtrlRegls[15] == '0':  # 触发接收使能
-                    self.CommunicationTextBrowser.append('触发接收使能：禁止')
-                elif CtrlRegls[15] == '1':
-                    self.CommunicationTextBrowser.append('触发接收使能：使能')
-
-            elif Instrls[6] + Instrls[7] == '0400':  # 读取阈值配置
-                Threshold = int(Ackls[6] + Ackls[7], 16)
-                self.CommunicationTextBrowser.append('阈值配置为：%d' % Threshold)
-                self.SpectroscopyTextBrowser.append('阈值配置为：%d' % Threshold)
-                self.ThresholdLineEdit.setText(str(Threshold))
+        if Instr[5] == 0X01:  # 命令码为0x01
+            if Instr[6] == 0X00:  # 指令回环测试 
+                self.log('回复指令：%02X' % (AckParam & 0XFF), LOG_ACK, LOG_COMM)
 
-            elif Instrls[6] + Instrls[7] == '0600':
-                AcquireTime = int(Ackls[6] + Ackls[7], 16)
-                self.CommunicationTextBrowser.append('采集时间配置为：%d' % AcquireTime)
-                self.SpectroscopyTextBrowser.append('采集时间配置为：%d' % AcquireTime)
-                self.AcquireTimeLineEdit.setText(str(AcquireTime))
-
-        else:
-            pass
+            elif Instr[6:8] == b'\x02\x00':  # 读取控制寄存器的配置
+                CtrlReg = AckParam  # 取出应答包中的控制寄存器
+                self.log('控制寄存器配置为：%s' % f"{CtrlReg:016b}", LOG_ACK, LOG_COMM)
 
-    def ShortDatadistinguish(self, data):  # 短包数据区分
-
-        LS_ShortData = data
-
-        self.AckSN = int(LS_ShortData[2]+LS_ShortData[3], 16)  # 取出应答包中的应答序号
-        self.DeviceID = LS_ShortData[4]  # 取出应答包中的设备ID
-
-        VerifyCode = self.AckCodeVerify(LS_ShortData)  # 应答码检测
-        if VerifyCode == 0000:  # 应答码检测通过
-            pass
-        else:
-            return
-        self.ShortAckInsdistinguish(LS_ShortData)
-        # EXTENSION
-        # if self.AckSN == self.InsSN - 1:  # 匹配应答指令序号与指令帧序号（指令帧序号每次发送后会+1）
-        #     self.SpectroscopyTextBrowser.append('应答序号与指令序号匹配')
-        #     self.CommunicationTextBrowser.append('应答序号与指令序号匹配')
-        #     self.ShortAckInsdistinguish(LS_ShortData)
-        # else:
-        #     self.SpectroscopyTextBrowser.append('应答序号与指令序号不匹配，疑似出现指令丢失，建议检查')
-        #     self.CommunicationTextBrowser.append('应答序号与指令序号不匹配，疑似出现指令丢失，建议检查')
-
-    def ShortAckInsdistinguish(self, data):  # 短数据包数据接收，并绘制能谱图
-
-        LS_Shortdata = data  # 获取长包数据
-        self.ChannelLongDATA = {}  # 建立一个空字典，用于存储通道数据
-
-        # TriggerChSN = int(LS_Longdata[6], 16)  # 获取触发通道号
-        # Length_Longdata = int(LS_Longdata[7], 16)  # 获取长包数据长度
-
-        for i in range(32):  # 遍历32个通道
-            start_index = 8 + i * 2  # 计算每个键对应的切片开始索引
-            end_index = start_index + 2  # 切片结束索引不包括在内，所以+4
-            hex_str = ''.join(LS_Shortdata[start_index:end_index])  # 从LS中提取四个元素，并转化为一个字符串
-
-            value = int(hex_str, 16)  # 将合并后的十六进制字符串转化为整数
+                if (CtrlReg >> 4) & 0b1 == 0:  # 测试信号输出使能
+                    self.log('测试信号设置：输出禁止', LOG_ACK, LOG_COMM)
+                else:
+                    self.log('测试信号设置：输出使能', LOG_ACK, LOG_COMM)
 
-            # 将键和转换后的值添加到字典中
-            self.ChannelLongDATA[f'CH{i}'] = value
+                if (CtrlReg >> 2) & 0b11 == 0b00:  # 数据输出模式
+                    self.log('数据输出模式：短数据包模式', LOG_ACK, LOG_COMM)
+                elif (CtrlReg >> 2) & 0b11 == 0b01:
+                    self.log('数据输出模式：长数据包模式', LOG_ACK, LOG_COMM)
 
-        self.spectrum_data_list.append(list(self.ChannelLongDATA.values())) # 将数据添加到列表中
-        
-        self.plotCanvas = MyMatplotlibFigure(width=7.1, height=5.51, dpi=1200)
+                if (CtrlReg >> 1) & 0b1 == 0:  # 工作模式设置
+                    self.log('工作模式设置：正常取数模式', LOG_ACK, LOG_COMM)
+                else:
+                    self.log('工作模式设置：电子学刻度模式', LOG_ACK, LOG_COMM)
 
-        pixmap = self.plotCanvas.draw_bar_chart(self.ChannelLongDATA)  # 绘制能谱图
+                if CtrlReg & 0b1 == 0:  # 触发接收使能
+                    self.log('触发接收使能：禁止', LOG_ACK, LOG_COMM)
+                else:
+                    self.log('触发接收使能：使能', LOG_ACK, LOG_COMM)
 
-        self.scene.clear()  # 清除场景中的所有项
-        self.scene.addPixmap(pixmap)  # 添加新的 QPixmap 到场景
-        self.SpectroscopyView.fitInView(self.scene.sceneRect(), Qt.KeepAspectRatio)  # 适应图形到视图
+            elif Instr[6:8] == b'\x04\x00':  # 读取阈值配置
+                Threshold = AckParam
+                self.log('阈值配置为：%d' % Threshold, LOG_ACK)
+                self.ThresholdLineEdit.setText(str(Threshold))
 
-    def LongDatadistinguish(self, data):  # 长包数据区分
-        LS_LongData = data
+            elif Instr[6:8] == b'\x06\x00':
+                AcquireTime = AckParam
+                self.log('采集时间配置为：%d' % AcquireTime, LOG_ACK)
+                self.AcquireTimeLineEdit.setText(str(AcquireTime))
 
-        VerifyCode = self.AckCodeVerify(LS_LongData)  # 应答码检测
-        if VerifyCode == 0000:  # 应答码检测通过
-            pass
         else:
-            return
-
-        self.AckSN = int(LS_LongData[2]+LS_LongData[3], 16)  # 取出应答包中的应答序号
-        self.DeviceID = LS_LongData[4]  # 取出应答包中的设备ID
-        self.LongAckInsdistinguish(LS_LongData)
-        # EXTENSION
-        # if self.AckSN == self.InsSN - 1:  # 匹配应答指令序号与指令帧序号（指令帧序号每次发送后会+1）
-        #     self.SpectroscopyTextBrowser.append('应答序号与指令序号匹配')
-        #     self.CommunicationTextBrowser.append('应答序号与指令序号匹配')
-        #     self.LongAckInsdistinguish(LS_LongData)
-        # else:
-        #     self.SpectroscopyTextBrowser.append('应答序号与指令序号不匹配，疑似出现指令丢失，建议检查')
-        #     self.CommunicationTextBrowser.append('应答序号与指令序号不匹配，疑似出现指令丢失，建议检查')
-
-    def LongAckInsdistinguish(self, data):  # 长数据包数据接收，并绘制能谱图
-
-        LS_Longdata = data  # 获取长包数据
-        self.ChannelLongDATA = {}  # 建立一个空字典，用于存储通道数据
-
-        # TriggerChSN = int(LS_Longdata[6], 16)  # 获取触发通道号
-        # Length_Longdata = int(LS_Longdata[7], 16)  # 获取长包数据长度
-
-        for i in range(32):  # 遍历32个通道
-            start_index = 8 + i * 4  # 计算每个键对应的切片开始索引
-            end_index = start_index + 4  # 切片结束索引不包括在内，所以+4
-            hex_str = ''.join(LS_Longdata[start_index:end_index])  # 从LS中提取四个元素，并转化为一个字符串
-
-            value = int(hex_str, 16)  # 将合并后的十六进制字符串转化为整数
-
-            # 将键和转换后的值添加到字典中
-            self.ChannelLongDATA[f'CH{i}'] = value
-        
-        self.spectrum_data_list.append(list(self.ChannelLongDATA.values())) # 将数据添加到列表中
-
-        self.plotCanvas = MyMatplotlibFigure(width=7.1, height=5.51, dpi=1200)
-
-        pixmap = self.plotCanvas.draw_bar_chart(self.ChannelLongDATA)  # 绘制能谱图
-
-        self.scene.clear()  # 清除场景中的所有项
-        self.scene.addPixmap(pixmap)  # 添加新的 QPixmap 到场景
-        self.SpectroscopyView.fitInView(self.scene.sceneRect(), Qt.KeepAspectRatio)  # 适应图形到视图
-
-    def ClusterDatadistinguish(self, data):  # 长包数据区分
-        LS_LongData = data
-
-        VerifyCode = self.AckCodeVerify(LS_LongData)  # 应答码检测
-        if VerifyCode == 0000:  # 应答码检测通过
             pass
-        else:
-            return
-
-        self.AckSN = int(LS_LongData[2]+LS_LongData[3], 16)  # 取出应答包中的应答序号
-        self.DeviceID = LS_LongData[4]  # 取出应答包中的设备ID
-        self.ClusterAckInsdistinguish(LS_LongData)
-
-    def ClusterAckInsdistinguish(self, data):  # 长数据包数据接收，并绘制能谱图
-
-        LS_Longdata = data  # 获取长包数据
-        self.ChannelLongDATA = {}  # 建立一个空字典，用于存储通道数据
-
-        for i in range(63):  # 遍历32个通道
-            start_index = 8 + i * 2  # 计算每个键对应的切片开始索引
-            end_index = start_index + 2  # 切片结束索引不包括在内，所以+4
-            hex_str = ''.join(LS_Longdata[start_index:end_index])  # 从LS中提取四个元素，并转化为一个字符串
-
-            value = int(hex_str, 16)  # 将合并后的十六进制字符串转化为整数
-
-            # 将键和转换后的值添加到字典中
-            self.ChannelLongDATA[f'CH{i}'] = value
-        
-        self.spectrum_data_list.append(list(self.ChannelLongDATA.values())) # 将数据添加到列表中
 
-        self.plotCanvas = MyMatplotlibFigure(width=7.1, height=5.51, dpi=1200)
-        self.plotCanvas.axes_channels = 63
-
-        pixmap = self.plotCanvas.draw_bar_chart(self.ChannelLongDATA)  # 绘制能谱图
-
-        self.scene.clear()  # 清除场景中的所有项
-        self.scene.addPixmap(pixmap)  # 添加新的 QPixmap 到场景
-        self.SpectroscopyView.fitInView(self.scene.sceneRect(), Qt.KeepAspectRatio)  # 适应图形到视图
-
-    def HitDatadistinguish(self, data):  # 长包数据区分
-        LS_LongData = data
-
-        VerifyCode = self.AckCodeVerify(LS_LongData)  # 应答码检测
+    def onDataFrame(self, frame):  # 数据包已由采集核心写入能谱存储并更新能谱模型，由渲染定时器刷新能谱图
+        VerifyCode = self.AckCodeVerify(frame.ack_code)  # 应答码检测
         if VerifyCode == 0000:  # 应答码检测通过
-            pass
-        else:
-            return
+            self.ChannelLongDATA = dict(zip(CHANNEL_NAMES, frame.counts))  # 通道名与各通道计数一一对应
 
-        self.AckSN = int(LS_LongData[2]+LS_LongData[3], 16)  # 取出应答包中的应答序号
-        self.DeviceID = LS_LongData[4]  # 取出应答包中的设备ID
-        self.HitAckInsdistinguish(LS_LongData)
-
-    def HitAckInsdistinguish(self, data):  # 长数据包数据接收，并绘制能谱图
-
-        LS_Longdata = data  # 获取长包数据
-        
-        self.ChannelLongDATA = {}  # 建立一个空字典，用于存储通道数据
-
-        for i in range(32):
-            self.ChannelLongDATA[f"CH{i}"] = 0
-        for i in range(16):
-            start_index = 8 + i * 4  # 计算每个键对应的切片开始索引
-            end_index = start_index + 4  # 切片结束索引不包括在内，所以+4
-            #hit_channels_bits = int8toint32(LS_Longdata[start_index:end_index])
-            #print(hex(hit_channels_bits))
-            hex_str = ''.join(LS_Longdata[start_index:end_index])  # 从LS中提取四个元素，并转化为一个字符串
-            value = int(hex_str, 16)  # 将合并后的十六进制字符串转化为整数
-            for j in range(32):
-                bit = (value>>j)&0x1
-                self.ChannelLongDATA[f'CH{j}'] += bit
-        self.spectrum_data_list.append(list(self.ChannelLongDATA.values())) # 将数据添加到列表中
-
-        self.plotCanvas = MyMatplotlibFigure(width=7.1, height=5.51, dpi=1200)
-
-        pixmap = self.plotCanvas.draw_bar_chart(self.ChannelLongDATA)  # 绘制能谱图
-
-        self.scene.clear()  # 清除场景中的所有项
-        self.scene.addPixmap(pixmap)  # 添加新的 QPixmap 到场景
-        self.SpectroscopyView.fitInView(self.scene.sceneRect(), Qt.KeepAspectRatio)  # 适应图形到视图
     def resizeEvent(self, event):  # 当窗口大小改变时，重新适配视图   目前好像没什么用
         super().resizeEvent(event)
         if self.scene.items():  # 检查场景中是否有项目
             self.SpectroscopyView.fitInView(self.scene.sceneRect(), Qt.KeepAspectRatio)  # 重新适配到视图
 
     def on_InsLoopTest(self):  # 指令回环测试
-        InstrLoopTest = 0X0100  # 指令回环测试的默认字段
-        str_InstrLoopTest = f"{InstrLoopTest:04X}"
-
         str_InstrLoop = self.InstrLooplineEdit.text()  # 获取指令回环测试的指令
-        self.send_data(self.InstrCombination(str_InstrLoopTest, str_InstrLoop))  # 发送指令回环测试的指令
-
-    def InstrCombination(self, *args):  # 将指令组合，传入的参数为十六进制字符串
+        try:
+            InstrLoop = int(str_InstrLoop, 16)
+        except ValueError:
+            self.log("无效的十六进制字符串", targets=LOG_COMM)
+            return None
+        return self.send_command(self.Core.loop_test, InstrLoop)  # 发送指令回环测试的指令
 
+    def InstrCombination(self, *args):  # 将指令组合，传入的参数为命令码与命令参数组成的十六进制字符串，使用采集核心当前的指令帧序号
         concatenated_string = "".join(args)  # 将传入的参数先进行组合
-
-        # 先进行CRC校验
-        crc_InstrCombination = self.InstrSN + self.str_InstrReserve + concatenated_string  # 连接需要进行CRC校验的字符串
-        crc_int_InstrCombination = int(crc_InstrCombination, 16)  # 将字符串转化为十六进制整数
-
-        crc_bytes_InstrCombination = crc_int_InstrCombination.to_bytes(6, byteorder='big')  # 将整数转化为字节
-        InsCRC = self.InstrCRCverify(crc_bytes_InstrCombination)  # CRC校验
-        str_InsCRC = f"{InsCRC:04X}"
-
-        # 完整指令组合
-        str_InstrCombination = self.str_InstrPacketStart + self.InstrSN + self.str_InstrReserve + concatenated_string + str_InsCRC
-        InstrCombination = int(str_InstrCombination, 16)
-        InstrCombinationresult = InstrCombination.to_bytes(10, byteorder='big')  # 将字符串转化为字节
-        return InstrCombinationresult
+        value = int(concatenated_string, 16)
+        return self.Core.instruction(value >> 16, value & 0XFFFF)
 
     def InstrCRCverify(self, data_bytes, poly=0x1021, init_val=0xFFFF):  # 指令CRC校验
-
-        crc = init_val
-        for byte in data_bytes:
-            crc ^= byte << 8
-            for _ in range(8):  # 处理每一位
-                if (crc & 0x8000):  # 判断最高位是否为1
-                    crc = (crc << 1) ^ poly
-                else:
-                    crc <<= 1
-                crc &= 0xFFFF  # 保证CRC值为16位
-        return crc
+        if poly == CRC16_POLY:
+            return crc16_ccitt(data_bytes, init_val)  # 查表法
+        return crc16_bitwise(data_bytes, poly, init_val)
 
     def openFolderDialog(self):  # 选择文件路径，并将文件路径填充在文本框中
         options = QFileDialog.Options()
@@ -827,19 +599,136 @@ class DataTransmission(QMainWindow, Ui_DataTransmisson):
             self.FilePathLineEdit.setText(folderPath)
 
     def UDPBind(self):  # 绑定UDP
-        self.udpSocket = QUdpSocket(self)  # 创建一个UDP套接字
+        self.UDPClose()  # 重新绑定前先关闭原来的接收线程
         self.localPort = 8081  # 本地端口
-        self.udpSocket.bind(QHostAddress.Any, self.localPort)  # 绑定本地地址,自动获取本地所有ip地址(IPV4)
-
-        self.receiverThread = ReceiverThread(self.udpSocket)   # 创建子线程，用于监听到来的UDP数据
-        self.receiverThread.dataReceived.connect(self.onDataReceived)
-        self.receiverThread.ReceivedError.connect(self.CommunicationTextBrowser.append)  # 将错误信息显示在通信文本框中
-        self.receiverThread.start()
-
         self.IPAddress = self.IPAddressLineEdit.text()
         self.UDPPort = int(self.UDPServerLineEdit.text())
         self.Server_addr = (self.IPAddress, self.UDPPort)  # 服务端地址
-        self.SpectroscopyTextBrowser.append("UDP 绑定地址为 %s:%d" % (self.IPAddress, self.UDPPort))
+        journal_path = self.JournalPath() if self.JournalEnabled else None
+        try:
+            self.receiverThread = ReceiverThread(self.Core, self.Server_addr, self.localPort, self.BatchWindowMs, self.BatchFrames,
+                                                 self.CapturePath, journal_path)   # 创建子线程，绑定本地所有ip地址(IPV4)并监听到来的UDP数据
+        except OSError as e:
+            self.receiverThread = None
+            self.log("UDP 绑定失败: %s" % e, targets=LOG_COMM)
+            return
+        self.receiverThread.framesReady.connect(self.onFramesReady)
+        self.receiverThread.batchReceived.connect(self.onBatchReceived)
+        self.receiverThread.ReceivedError.connect(self.logError)  # 将错误信息显示在通信文本框中
+        self.receiverThread.start()
+        self.log("UDP 绑定地址为 %s:%d" % (self.IPAddress, self.UDPPort), targets=LOG_SPEC)
+        if journal_path:
+            self.log("运行日志记录到 %s" % journal_path, targets=LOG_COMM)
+
+    def UDPClose(self):  # 停止接收线程并释放套接字，采集核心同时取消等待中的指令和批量配置
+        capture = self.Core.capture
+        journal = self.Core.journal
+        if self.receiverThread is not None:
+            stats = self.receiverThread.stop()
+            self.receiverThread = None
+            self.log("接收线程已停止，共接收 %d 包，丢弃 %d 包，缓冲区最高占用 %d" % (stats["received"], stats["drops"], stats["high_water"]), targets=LOG_COMM)
+            render_stats = self.SpectrumRenderer.stats()
+            self.log("能谱图共绘制 %d 帧，跳过 %d 帧，合并 %d 次更新" % (render_stats["frames_rendered"], render_stats["frames_skipped"], render_stats["updates_coalesced"]), targets=LOG_COMM)
+            self.CommandLatencyReport()
+        self.Core.close()
+        if capture is not None:
+            self.log("原始数据包已记录到 %s，共 %d 包" % (capture.path, capture.frames), targets=LOG_COMM)
+        if journal is not None:
+            stats = journal.stats()
+            self.log("运行日志已记录到 %s，共 %d 条，丢弃 %d 条" % (journal.path, stats["records"], stats["dropped"]), targets=LOG_COMM)
+
+    def CommandLatencyReport(self):  # 显示各命令码的应答延迟统计
+        stats = self.Correlator.stats()
+        self.log("指令共发送 %d 条，应答 %d 条，重发 %d 次，超时 %d 条" % (stats["sent"], stats["acked"], stats["retries"], stats["timeouts"]), targets=LOG_COMM)
+        for command, summary in self.Correlator.latency_summary().items():
+            self.log("命令码 %s：%d 次，平均 %.2f ms，P50 %.2f ms，P99 %.2f ms，最大 %.2f ms" % (command, summary["count"], summary["mean_ms"], summary["p50_ms"], summary["p99_ms"], summary["max_ms"]), targets=LOG_COMM)
+
+    def CaptureSelect(self):    # 选择原始数据包记录文件，下次绑定UDP时开始记录
+        file_path, _ = QFileDialog.getSaveFileName(self, "Capture File", self.FilePathLineEdit.text(), "Capture Files (*.xcap);;All Files (*)")
+        self.CapturePath = file_path or None
+        if self.CapturePath:
+            self.log("绑定UDP后将原始数据包记录到 %s" % self.CapturePath, targets=LOG_COMM)
+        else:
+            self.log("不记录原始数据包", targets=LOG_COMM)
+
+    def JournalToggle(self, enabled):
+        self.JournalEnabled = enabled
+        if enabled:
+            self.log("绑定UDP后在 %s 下新建运行日志" % (self.FilePathLineEdit.text() or os.getcwd()), targets=LOG_COMM)
+
+    def JournalPath(self):  # 运行日志文件名带绑定时间
+        name = "Run_%s.xjrn" % datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        return os.path.join(self.FilePathLineEdit.text() or os.getcwd(), name)
+
+    def ProfileRunsToggle(self, enabled):
+        self.ProfileRuns = enabled
+
+    def StartRunProfile(self, data_path, label, force=False):  # 开启剖析时开始剖析，force 为 True 时不论是否开启
+        if not (self.ProfileRuns or force) or self.runProfiler is not None:
+            return None
+        try:
+            self.runProfiler = RunProfiler(data_path, self.ProfileMode, self.ConfigSnapshot(), label,
+                                           self.ProfileIntervalMs / 1000).start()
+        except ValueError as e:     # 已有其他剖析工具在运行
+            self.log("无法开始剖析：%s" % e, LOG_ERROR)
+            return None
+        self.log("开始剖析%s" % label, LOG_INFO, LOG_COMM)
+        return self.runProfiler
+
+    def StopRunProfile(self):   # 停止剖析并写入结果
+        profiler, self.runProfiler = self.runProfiler, None
+        if profiler is None:
+            return
+        try:
+            outputs = profiler.stop()
+        except OSError as e:
+            self.log("剖析结果保存失败：%s" % e, LOG_ERROR)
+            return
+        self.log("%s剖析 %.1f s，结果保存至 %s" % (profiler.label, profiler.elapsed, "，".join(outputs)), LOG_INFO, LOG_COMM)
+
+    def ProfileWindow(self):    # 剖析接下来指定的秒数，结果保存在文件路径下
+        seconds, ok = QInputDialog.getInt(self, "剖析", "剖析时长 (s)：", 30, 1, 3600)
+        if not ok:
+            return
+        name = "Profile_%s" % datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        data_path = os.path.join(self.FilePathLineEdit.text() or os.getcwd(), name)
+        profiler = self.StartRunProfile(data_path, "%d 秒" % seconds, force=True)
+        if profiler is not None:   # 到时只停止本次剖析，已手动停止时不影响之后开始的剖析
+            QTimer.singleShot(seconds * 1000, lambda: self.runProfiler is profiler and self.StopRunProfile())
+
+    def PerfStats(self):    # 采集核心的性能统计，附带能谱图绘制统计
+        stats = self.Core.perf_stats()
+        stats["render"] = self.SpectrumRenderer.stats()
+        return stats
+
+    def PerfStatsShow(self):
+        if self.perfStatsDialog is None:
+            self.perfStatsDialog = PerfStatsDialog(self)
+        self.perfStatsDialog.show()
+        self.perfStatsDialog.raise_()
+
+    def PerfStatsDump(self):    # 性能统计保存为JSON
+        name = "PerfStats_%s.json" % datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        file_path, _ = QFileDialog.getSaveFileName(self, "Save Stats", os.path.join(self.FilePathLineEdit.text(), name), "JSON Files (*.json);;All Files (*)")
+        if not file_path:
+            return
+        try:
+            with open(file_path, 'w', encoding='utf-8') as file:
+                json.dump(self.PerfStats(), file, ensure_ascii=False, indent=2)
+        except OSError as e:
+            self.log("性能统计保存失败：%s" % e, LOG_ERROR, LOG_COMM)
+            return
+        self.log("性能统计保存至 %s" % file_path, targets=LOG_COMM)
+
+    def PerfStatsReset(self):
+        self.Core.instruments.reset()
+
+    def closeEvent(self, event):  # 关闭窗口时停止接收线程，并等待后台保存完成
+        self.StopRunProfile()
+        self.UDPClose()
+        if self.exportWorker is not None:
+            self.exportWorker.wait()
+        super().closeEvent(event)
 
     def SendIns(self):  # 发送指令，只需要输入命令码和命令参数，也就是六位十六进制数
         message = self.SendInsLineEdit.text()
@@ -850,86 +739,39 @@ class DataTransmission(QMainWindow, Ui_DataTransmisson):
             self.send_data(message_bytes)  # 发送指令
         except ValueError:
             # 如果转换失败，显示错误消息
-            self.CommunicationTextBrowser.append("无效的十六进制字符串")
+            self.log("无效的十六进制字符串", targets=LOG_COMM)
         except Exception as e:
             print("Error: ", e)
 
     def AcquireData(self):  # 采集数据
-        InsAcquireData = 0X020100  # 采集数据的命令码与命令参数
-        str_InsAcquireData = f"{InsAcquireData:06X}"
-        Instruction_AcquireData = self.InstrCombination(str_InsAcquireData)  # 组合指令
-        self.send_data(Instruction_AcquireData)  # 发送指令
+        return self.send_command(self.Core.read_data)
 
     def CountsRest(self):  # 计数复位
-        InsCountsRest = 0X030100  # 采集数据的命令码与命令参数
-        str_InsCountsRest = f"{InsCountsRest:06X}"
-        Instruction_CountsRest = self.InstrCombination(str_InsCountsRest)  # 组合指令
-        self.send_data(Instruction_CountsRest)  # 发送指令
+        return self.send_command(self.Core.reset_counts)
 
-    def ThresholdConfig(self, dac_value):  # 阈值配置
+    def ThresholdConfig(self, dac_value=0):  # 阈值配置，dac_value 为0时使用界面输入的阈值
         if dac_value == 0:
             ThresholdStr = self.ThresholdLineEdit.text()  # 获取阈值
             ThresholdValue = int(ThresholdStr)  # 将阈值转化为整数
         else:
             ThresholdValue = dac_value
-        
-        if ThresholdValue > 4095:
-            self.SpectroscopyTextBrowser.append("阈值超出范围")
-            self.CommunicationTextBrowser.append("阈值超出范围")
-            return
-
-        ThresholdConfigCode = 0X05  # 阈值配置的命令码
-        str_ThresholdConfigCode = f"{ThresholdConfigCode:02X}"
-
-        str_ThresholdValue = f"{ThresholdValue:04X}"
-
-        InsThresholdConfig = self.InstrCombination(str_ThresholdConfigCode, str_ThresholdValue)  # 组合指令
-        self.send_data(InsThresholdConfig)  # 发送指令
+        return self.send_command(self.Core.set_threshold, ThresholdValue)  # 超出范围时提示
 
     def AcquireConfig(self):  # 采集配置
         AcquireTime = self.AcquireTimeLineEdit.text()  # 获取采集时长
         AcquireTimeValue = int(AcquireTime)  # 将阈值转化为整数
-
-        if AcquireTimeValue > 65535:
-            self.SpectroscopyTextBrowser.append("采集时间超出范围")
-            self.CommunicationTextBrowser.append("采集时间超出范围")
-            return
-
-        AcquireTimeConfigCode = 0X06  # 阈值配置的命令码
-        str_AcquireTimeConfigCode = f"{AcquireTimeConfigCode:02X}"
-
-        str_AcquireTime = f"{AcquireTimeValue:04X}"
-        InsAcquireTime = self.InstrCombination(str_AcquireTimeConfigCode, str_AcquireTime)  # 组合指令
-        self.send_data(InsAcquireTime)  # 发送指令
+        return self.send_command(self.Core.set_acquire_time, AcquireTimeValue)  # 超出范围时提示
 
     def on_AcquireMode_changed(self):  # 采集模式改变时，通过配置按钮获取采集模式
         AcquireMode = self.AcquireModeBox.currentText()
-        if AcquireMode == "短包":
-            self.CtrlRegDataMode = 0B00
-        elif AcquireMode == "长包":
-            self.CtrlRegDataMode = 0B01
-        elif AcquireMode == "簇团计数":
-            self.CtrlRegDataMode = 0B10
-        elif AcquireMode == "事例击中":
-            self.CtrlRegDataMode = 0B11    
-
-        ctrl_reg = self.CtrlRegParam_combined()
-
-        Instr_AcquireMode = self.InstrCombination(ctrl_reg)
-
-        self.send_data(Instr_AcquireMode)
+        self.CtrlRegDataMode = DATA_MODES.get(AcquireMode, self.CtrlRegDataMode)
+        return self.send_command(self.Core.configure_ctrl_reg, self.CtrlRegParam_combined())
 
     def CtrlRegRead(self):  # 控制寄存器读取
-        InsCtrlRegRead = 0X010200
-        str_InsCtrlRegRead = f"{InsCtrlRegRead:06X}"
-        Instruction_CtrlRegRead = self.InstrCombination(str_InsCtrlRegRead)
-        self.send_data(Instruction_CtrlRegRead)
+        return self.send_command(self.Core.read_ctrl_reg)
 
     def FPGAReset(self):  # FPGA复位
-        InsFPGAReset = 0X010100
-        str_InsFPGAReset = f"{InsFPGAReset:06X}"
-        Instruction_FPGAReset = self.InstrCombination(str_InsFPGAReset)
-        self.send_data(Instruction_FPGAReset)
+        return self.send_command(self.Core.fpga_reset)
         
     def FileSave(self):  # 文件保存
         FilePath = self.FilePathLineEdit.text()
@@ -944,15 +786,33 @@ class DataTransmission(QMainWindow, Ui_DataTransmisson):
             # 检查并创建文件所在的目录
             os.makedirs(os.path.dirname(full_path), exist_ok=True)
         except Exception as e:
-            self.SpectroscopyTextBrowser.append("文件路径错误,无法创建：%s" % e)
+            self.log("文件路径错误,无法创建：%s" % e, targets=LOG_SPEC)
             return
 
         # 写入文件，如果文件不存在，自动创建
-        with open(full_path, 'w', encoding='utf-8') as file:
+        with self.Core.instruments.span(SPAN_SAVE), open(full_path, 'w', encoding='utf-8') as file:
             for key, value in self.ChannelLongDATA.items():
                 file.write(f"{value}\n")
 
-        self.SpectroscopyTextBrowser.append("文件保存成功")
+        self.log("文件保存成功", targets=LOG_SPEC)
+
+    def SpectrumExport(self, full_path):  # 用matplotlib导出当前能谱图，用于发表的高分辨率图片
+        if not self.SpectrumModel.counts:
+            self.log("当前没有能谱数据", targets=LOG_SPEC)
+            return
+        try:
+            export_bar_chart(self.SpectrumModel.as_dict(CHANNEL_NAMES), full_path)
+        except Exception as e:
+            self.log("能谱图导出失败：%s" % e, targets=LOG_SPEC)
+            return
+        self.log(f"能谱图已导出到 {full_path}", targets=LOG_SPEC)
+
+    def SpectrumExportSelect(self):    # 选择导出文件，格式由扩展名决定
+        name = "Spectrum_%s.png" % datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        file_path, _ = QFileDialog.getSaveFileName(self, "Export Spectrum", os.path.join(self.FilePathLineEdit.text(), name),
+                                                   "PNG Files (*.png);;PDF Files (*.pdf);;SVG Files (*.svg);;All Files (*)")
+        if file_path:
+            self.SpectrumExport(file_path)
 
     def FileDelete(self):  # 文件删除
         FilePath = self.FilePathLineEdit.text()
@@ -964,130 +824,42 @@ class DataTransmission(QMainWindow, Ui_DataTransmisson):
 
         if os.path.exists(full_path):
             os.remove(full_path)
-            self.SpectroscopyTextBrowser.append(f"文件已删除：{full_path}")
+            self.log(f"文件已删除：{full_path}", targets=LOG_SPEC)
         else:
-            self.SpectroscopyTextBrowser.append(f"文件不存在：{full_path}")
+            self.log(f"文件不存在：{full_path}", targets=LOG_SPEC)
 
     def CtrlRegConfig(self):   # 配置控制寄存器，包括触发接收使能，测试信号使能，工作模式选择，修改测试通道和成形时间
-        TestChannel = self.TestChannelBox.currentText()
-        if TestChannel == "ch1":
-            self.CtrlRegTestChannel = 0B00
-        elif TestChannel == "ch9":
-            self.CtrlRegTestChannel = 0B01
-        elif TestChannel == "ch17":
-            self.CtrlRegTestChannel = 0B10
-        elif TestChannel == "ch25":
-            self.CtrlRegTestChannel = 0B11
-        
-        FormingTime = self.FormingTimeBox.currentText()
-        if FormingTime == "40ns":
-            self.CtrlRegFormingTime = 0B00
-        elif FormingTime == "80ns":
-            self.CtrlRegFormingTime = 0B01
-        elif FormingTime == "120ns":
-            self.CtrlRegFormingTime = 0B10
-        elif FormingTime == "160ns":
-            self.CtrlRegFormingTime = 0B11
-        
-        SerialPortRate = self.SerialPortRateBox.currentText()
-        if SerialPortRate == "Debug模式":
-            self.CtrlRegSerialPortRate = 0B00_00
-        elif SerialPortRate == "正常":
-            self.CtrlRegSerialPortRate = 0B00_01
-        
-        TestSignalEnableMode = self.TestSignalEnableBox.currentText()
-        if TestSignalEnableMode == "禁止使能":
-            self.CtrlRegTestSignalOutputEnable = 0B00_00
-        elif TestSignalEnableMode == "使能":
-            self.CtrlRegTestSignalOutputEnable = 0B00_01    
-        
+        self.CtrlRegTestChannel = TEST_CHANNELS.get(self.TestChannelBox.currentText(), self.CtrlRegTestChannel)
+        self.CtrlRegFormingTime = FORMING_TIMES.get(self.FormingTimeBox.currentText(), self.CtrlRegFormingTime)
+        self.CtrlRegSerialPortRate = SERIAL_PORT_RATES.get(self.SerialPortRateBox.currentText(), self.CtrlRegSerialPortRate)
+        self.CtrlRegTestSignalOutputEnable = ENABLE_MODES.get(self.TestSignalEnableBox.currentText(), self.CtrlRegTestSignalOutputEnable)
+
         WorkingMode = self.WorkingModeBox.currentText()
         TriggerReceiveEnable = self.TriggerReceiveEnableBox.currentText()
-        if WorkingMode == "正常取数" and TriggerReceiveEnable == "禁止使能":
-            self.CtrlRegWorkingMode = 0B00
-        elif WorkingMode == "电子学刻度" and TriggerReceiveEnable == "禁止使能":
-            self.CtrlRegWorkingMode = 0B10
-        elif WorkingMode == "正常取数" and TriggerReceiveEnable == "使能":      
-            self.CtrlRegWorkingMode = 0B01
-        elif WorkingMode == "电子学刻度" and TriggerReceiveEnable == "使能":  
-            self.CtrlRegWorkingMode = 0B11
-        
-            
-        ctrl_reg = self.CtrlRegParam_combined()
-        
-        Instr_CtrlRegConfig = self.InstrCombination(ctrl_reg)
-        
-        self.send_data(Instr_CtrlRegConfig)
+        if WorkingMode in WORKING_MODES and TriggerReceiveEnable in ENABLE_MODES:  # 高位为工作模式，低位为触发接收使能
+            self.CtrlRegWorkingMode = (WORKING_MODES[WorkingMode] << 1) | ENABLE_MODES[TriggerReceiveEnable]
+
+        return self.send_command(self.Core.configure_ctrl_reg, self.CtrlRegParam_combined())
     
-    def SynCtrlTrigger(self):   # 同步控制触发，EB 90 00 00 00 0C AE 00 00 00
-        # 两种方式二选一 这个是有指令帧的
-        # InsSynCtrlTrigger = 0X0AAE00  # 采集数据的命令码与命令参数
-        # str_InsSynCtrlTrigger = f"{InsSynCtrlTrigger:06X}"
-        # Instruction_SynCtrlTrigger = self.InstrCombination(str_InsSynCtrlTrigger)  # 组合指令
-        # self.send_data(Instruction_SynCtrlTrigger)  # 发送指令
-        
-        self.InsSN -= 1 # 恢复指令帧序号
-        InsSynCtrlTrigger = 0XEB900000000CAE000000
-        str_InsSynCtrlTrigger = f"{InsSynCtrlTrigger:20X}"
-        Instruction_SynCtrlTrigger = bytes.fromhex(str_InsSynCtrlTrigger)
-        self.send_data(Instruction_SynCtrlTrigger)  # 发送指令
+    def SynCtrlTrigger(self):   # 同步控制触发，EB 90 00 00 00 0C AE 00 00 00，不占用指令帧序号，中间板以同步应答回复
+        self.send_command(self.Core.trigger)
     
-    def SynCtrlTriggerCommandJudge(self, data): # 同步触发指令应答判断
-        ls = data
-        Flag = 0
-        if ls[5] == '00' and ls[6] == '00' and ls[7] == '00' and ls[8] == '00' and ls[9] == '00':
-            Flag = 1
-        elif ls[5] == '22' and ls[6] == '22' and ls[7] == '22' and ls[8] == '22' and ls[9] == '22':
-            Flag = 2
-        else: 
-            self.CommunicationTextBrowser.append("同步触发指令应答异常")
-        
-        return Flag
-        
-    def CtrlRegParam_combined(self):    # 如果需要配置控制寄存器的值, 将控制寄存器的多位二进制字面量进行组合，再与命令码进行组合
-        CtrlRegParam_combined = (self.CtrlRegTestChannel << 14) | (self.CtrlRegFormingTime << 12) | (self.CtrlRegSerialPortRate << 8) | (self.CtrlRegTestSignalOutputEnable << 4) | (self.CtrlRegDataMode << 2) | self.CtrlRegWorkingMode  # 将控制寄存器参数组合
-        str_CtrlRegParam = f"{CtrlRegParam_combined:04X}"  # 将组合后的参数转化为十六进制字符串
-        InstrCode = 0X04  # 配置控制寄存器的命令码
-        str_InstrCode = f"{InstrCode:02X}"
-        str_CtrlReg = str_InstrCode + str_CtrlRegParam  # 三字节的十六进制字符串
-        return str_CtrlReg
+    def CtrlRegParam_combined(self):    # 将控制寄存器的多位二进制字面量组合为命令参数
+        return ctrl_reg_param(self.CtrlRegTestChannel, self.CtrlRegFormingTime, self.CtrlRegSerialPortRate,
+                              self.CtrlRegTestSignalOutputEnable, self.CtrlRegDataMode, self.CtrlRegWorkingMode)
     
     def ScaleThreshold(self):   # 配置刻度阈值，配置刻度DAC
         ScaleThresholdStr = self.ScaleThresholdEdit.text()  
-        ScaleThresholdValue = int(ScaleThresholdStr)  
-
-        if ScaleThresholdValue > 4095:
-            self.SpectroscopyTextBrowser.append("刻度超出范围")
-            self.CommunicationTextBrowser.append("刻度超出范围")
-            return
-
-        ScaleThresholdConfigCode = 0X07  
-        str_ScaleThresholdConfigCode = f"{ScaleThresholdConfigCode:02X}"
-
-        str_ScaleThresholdValue = f"{ScaleThresholdValue:04X}"
-
-        InsScaleThresholdConfig = self.InstrCombination(str_ScaleThresholdConfigCode, str_ScaleThresholdValue)  # 组合指令
-        self.send_data(InsScaleThresholdConfig)  # 发送指令
+        ScaleThresholdValue = int(ScaleThresholdStr)
+        return self.send_command(self.Core.set_scale_threshold, ScaleThresholdValue)
     
     def ScaleTimeInterval(self):    # 配置刻度时间间隔
         ScaleTimeInterval = self.ScaleTimeIntervalEdit.text()  
         ScaleTimeIntervalValue = int(ScaleTimeInterval)  
-
-        if ScaleTimeIntervalValue > 65535:
-            self.SpectroscopyTextBrowser.append("采集时间超出范围")
-            self.CommunicationTextBrowser.append("采集时间超出范围")
-            return
-
-        ScaleTimeIntervalConfigCode = 0X08  
-        str_ScaleTimeIntervalConfigCode = f"{ScaleTimeIntervalConfigCode:02X}"
-
-        str_ScaleTimeInterval = f"{ScaleTimeIntervalValue:04X}"
-
-        InsScaleTimeInterval = self.InstrCombination(str_ScaleTimeIntervalConfigCode, str_ScaleTimeInterval)  # 组合指令
-        self.send_data(InsScaleTimeInterval)  # 发送指令
+        return self.send_command(self.Core.set_scale_interval, ScaleTimeIntervalValue)
     
-    def SaveConfig(self):   # 保存配置至当前文件夹
-        parameters = {
+    def ConfigSnapshot(self):   # 当前界面中的配置参数，SaveConfig 保存的内容，也用于标注剖析结果
+        return {
             "Threshold": self.ThresholdLineEdit.text(),
             "AcquireTime": self.AcquireTimeLineEdit.text(),
             "AcquireMode": self.AcquireModeBox.currentText(),
@@ -1099,9 +871,11 @@ class DataTransmission(QMainWindow, Ui_DataTransmisson):
             "TestSignalEnableMode": self.TestSignalEnableBox.currentText(),
             "WorkingMode": self.WorkingModeBox.currentText(),
             "SerialPortRate": self.SerialPortRateBox.currentText(),
-            "FilePath": self.Data_transmission.FilePathLineEdit.text(),
-            # 要保存的配置参数
+            "FilePath": self.FilePathLineEdit.text(),
         }
+
+    def SaveConfig(self):   # 保存配置至当前文件夹
+        parameters = self.ConfigSnapshot()  # 要保存的配置参数
         
         current_directory = os.getcwd() # 获取当前工作目录
         config_directory = os.path.join(current_directory, "Config")
@@ -1116,7 +890,7 @@ class DataTransmission(QMainWindow, Ui_DataTransmisson):
         if file_path:
             with open(file_path, 'w') as file:
                 json.dump(parameters, file)
-            self.CommunicationTextBrowser.append(f"配置文件保存至 {file_path}")
+            self.log(f"配置文件保存至 {file_path}", targets=LOG_COMM)
             
     def LoadConfig(self):   # 导入配置文件，自动改变参数
         options = QFileDialog.Options()
@@ -1137,75 +911,68 @@ class DataTransmission(QMainWindow, Ui_DataTransmisson):
             self.TestSignalEnableBox.setCurrentText(parameters.get("TestSignalEnableMode", ""))
             self.WorkingModeBox.setCurrentText(parameters.get("WorkingMode", ""))
             self.SerialPortRateBox.setCurrentText(parameters.get("SerialPortRate", ""))
-            self.FilePathLineEdit.setCurrentText(parameters.get("FilePath", ""))
+            self.FilePathLineEdit.setText(parameters.get("FilePath", ""))
             # 设置其他加载的参数
             print(f"从 {file_path} 导入配置文件")
-            self.CommunicationTextBrowser.append(f"从 {file_path} 导入配置文件")
+            self.log(f"从 {file_path} 导入配置文件", targets=LOG_COMM)
         else:
             print("未选中配置文件")
-            self.CommunicationTextBrowser.append("未选中配置文件")        
+            self.log("未选中配置文件", targets=LOG_COMM)        
             
     def ClearSpec(self):    # 清除能谱图
-        self.plotCanvas.clear_plot()  # 清除绘图
-        self.scene.clear()  # 清除场景中的所有项
-        self.scene.addWidget(self.plotCanvas)  # 重新添加绘图组件到场景中
-        self.SpectroscopyView.fitInView(self.scene.sceneRect(), Qt.KeepAspectRatioByExpanding)  # 适应图形到视图
-        self.CommunicationTextBrowser.append("能谱图已清除")
-        self.SpectroscopyTextBrowser.append("能谱图已清除")
+        self.SpectrumModel.clear()  # 清空能谱模型，渲染定时器随后清除绘图，绘图组件一直保留在场景中
+        self.SpectroscopyView.fitInView(self.scene.sceneRect(), Qt.KeepAspectRatio)  # 适应图形到视图
+        self.log("能谱图已清除")
         
     def SampStepTotalLength(self):  # 设置测量S曲线前的采集步长与总长度
         dialog = SampStepTotalLengthDialog()
+        dialog.adaptiveInput.setChecked(self.AdaptiveSCurve)
         if dialog.exec_() == QDialog.Accepted:
             self.sampling_step, self.total_length = dialog.getInputs()  # 得到对话框中的采集步长和总长度
+            self.AdaptiveSCurve = dialog.isAdaptive()
             # 将浮点数转化为整数
             self.sampling_step = int(self.sampling_step)    
             self.total_length = int(self.total_length)
-            self.CommunicationTextBrowser.append(f'采集步长: {self.sampling_step}, 采集总长度: {self.total_length}')
-            self.SpectroscopyTextBrowser.append(f'采集步长: {self.sampling_step}, 采集总长度: {self.total_length}')
+            self.log(f'采集步长: {self.sampling_step}, 采集总长度: {self.total_length}')
             
     def SCurve(self):   # 一键测量S曲线
         self.SCurveHandler.measure_s_curve(self.sampling_step, self.total_length)
 
-    def Loop(self): # 延迟应答判定函数
-        self.ifdatareceived = 0
-        self.loop_result = 0
-        
-        loop = QEventLoop()     # 创建一个循环
-        
-        def check_data_received():
-            if self.ifdatareceived == 1:
-                self.loop_result = 1
-            loop.quit()
-        
-        QTimer.singleShot(1000, check_data_received)  # 设置1s的定时器，触发时退出循环
-        loop.exec_()    # 开始循环并等待直到定时器触发退出循环
-        
-        return self.loop_result
-    
+    def WaitCommand(self, future):  # 等待指令应答，应答到达时立即返回，超时重发由应答关联器处理
+        if future is None:
+            return False
+        if not future.done():
+            loop = QEventLoop()     # 创建一个循环
+            future.add_done_callback(lambda future: loop.quit())  # 指令完成时退出循环
+            loop.exec_()
+        return future.succeeded
+
     def retry_loop(self, action, success_message, fail_message):
-        success = False
-        while not success:
-            action()
-            if self.Loop() == 1:
-                success = True
-                self.SpectroscopyTextBrowser.append(success_message)
-                self.CommunicationTextBrowser.append(success_message)
-            else:
-                self.SpectroscopyTextBrowser.append(fail_message)
-                self.CommunicationTextBrowser.append(fail_message)        
-    
-    def PeriodCollect(self):    # 周期同步触发和读数
+        if self.WaitCommand(action()):
+            self.log(success_message, LOG_SCAN)
+            return True
+        self.log(fail_message, LOG_SCAN)
+        return False
+
+    def PeriodCollect(self):    # 周期同步触发和读数，开启剖析时剖析整个周期采集
+        self.StartRunProfile(self.ExcelFilePath(), "周期采集")
+        try:
+            self.PeriodCollectRun()
+        finally:
+            self.StopRunProfile()
+
+    def PeriodCollectRun(self):
         PeriodCollect = self.PeriodEdit.text()
         PeriodCollectValue = int(PeriodCollect)
         
         all_data = []  # 存储所有周期的数据
                 
         for i in range(PeriodCollectValue):
-            self.retry_loop(self.CountsRest, 
+            if not self.retry_loop(self.CountsRest, 
                     "清零成功", 
-                    "清零信号未接收到应答包，重新发送")
+                    "清零多次未收到应答包，停止周期采集"):
+                break
             
-            self.ifSynCtrlTriggerSuccess = 0
             self.SynCtrlTrigger()
             
             AcquireTime = self.AcquireTimeLineEdit.text()  # 获取采集时长
@@ -1215,27 +982,27 @@ class DataTransmission(QMainWindow, Ui_DataTransmisson):
             QTimer.singleShot(Delay, loop.quit)  # 设置定时器，触发时退出循环
             loop.exec_()    # 开始循环并等待直到定时器触发退出循环
             
-            if self.ifSynCtrlTriggerSuccess == 2:
-                self.retry_loop(self.AcquireData, 
+            if self.Core.sync_flag == 2:
+                if not self.retry_loop(self.AcquireData, 
                     "读数成功", 
-                    "读数信号未接收到应答包，重新发送")
+                    "读数多次未收到应答包，停止周期采集"):
+                    break
                 all_data.append(self.get_channel_data())
-            elif self.ifSynCtrlTriggerSuccess == 1:
-                self.CommunicationTextBrowser.append(f"周期采集中第{i+1}次采集探测器能谱采集工作异常，建议检查")
-                self.SpectroscopyTextBrowser.append(f"周期采集中第{i+1}次采集探测器能谱采集工作异常，建议检查")
+            elif self.Core.sync_flag == 1:
+                self.log(f"周期采集中第{i+1}次采集探测器能谱采集工作异常，建议检查", LOG_SCAN)
                 break
-            elif self.ifSynCtrlTriggerSuccess == 0:
+            elif self.Core.sync_flag == 0:
                 self.SynCtrlTrigger()
                 QTimer.singleShot(Delay, loop.quit)  # 设置1s的定时器，触发时退出循环
                 loop.exec_()    # 开始循环并等待直到定时器触发退出循环
-                if self.ifSynCtrlTriggerSuccess == 0:
-                    self.CommunicationTextBrowser.append(f"周期采集中第{i+1}次采集中间板未能收到正确应答信号，建议检查")
-                    self.SpectroscopyTextBrowser.append(f"周期采集中第{i+1}次采集中间板未能收到正确应答信号，建议检查")
+                if self.Core.sync_flag == 0:
+                    self.log(f"周期采集中第{i+1}次采集中间板未能收到正确应答信号，建议检查", LOG_SCAN)
                     break
-                elif self.ifSynCtrlTriggerSuccess == 2:
-                    self.retry_loop(self.AcquireData, 
+                elif self.Core.sync_flag == 2:
+                    if not self.retry_loop(self.AcquireData, 
                     "读数成功", 
-                    "读数信号未接收到应答包，重新发送")
+                    "读数多次未收到应答包，停止周期采集"):
+                        break
                     all_data.append(self.get_channel_data())
             
             # self.retry_loop(self.AcquireData, 
@@ -1258,46 +1025,56 @@ class DataTransmission(QMainWindow, Ui_DataTransmisson):
         data = list(self.ChannelLongDATA.values())
         return data            
 
-    def FileSaveToExcel(self, all_data):  # 文件保存到Excel
+    def ExcelFilePath(self):    # 界面中文件路径与文件名组成的Excel文件路径
         FilePath = self.FilePathLineEdit.text()
         FileName = self.FileNameLineEdit.text()
 
         if not FileName.endswith('.xlsx'):
             FileName += '.xlsx'
 
-        full_path = os.path.join(FilePath, FileName)
+        return os.path.join(FilePath, FileName)
+
+    def FileSaveToExcel(self, all_data):  # 文件保存到Excel，整块按行写入，可在后台线程中进行
+        full_path = self.ExcelFilePath()
+
+        if not all_data:
+            self.log("没有可保存的周期数据")
+            return
 
-        # 将数据转换为 DataFrame
-        df = pd.DataFrame(all_data).T
+        block, titles = period_block(all_data)  # 每个周期一行，保存时转置为每个周期一列
 
         try:
             # 检查并创建文件所在的目录
             os.makedirs(os.path.dirname(full_path), exist_ok=True)
         except Exception as e:
-            self.SpectroscopyTextBrowser.append("文件路径错误,无法创建：%s" % e)
-            self.CommunicationTextBrowser.append("文件路径错误,无法创建：%s" % e)
+            self.log("文件路径错误,无法创建：%s" % e)
+            return
+
+        if self.ExportInBackground:
+            if self.exportWorker is not None and self.exportWorker.isRunning():
+                self.exportWorker.wait()  # 上一次保存尚未完成，先等待，避免同时写同一个文件
+            self.exportWorker = ExportWorker(full_path, block, titles)
+            self.exportWorker.exportFinished.connect(self.onExportFinished)
+            self.exportWorker.exportFailed.connect(self.onExportFailed)
+            self.exportWorker.start()
+            self.log("正在后台保存：%s" % full_path, targets=LOG_SPEC)
             return
 
-        # 打开或创建一个新的 Excel 文件
-        new_file = False
         try:
-            workbook = load_workbook(full_path)
-            sheet = workbook.active
-        except FileNotFoundError:
-            workbook = openpyxl.Workbook()
-            sheet = workbook.active
-            new_file = True
-
-        # 写入每个周期的数据，并添加周期标签
-        for col_index, col_data in enumerate(df.columns):
-            sheet.cell(row=1, column=col_index + 1, value=f"周期 {col_index + 1}")
-            for row_index, value in enumerate(df[col_data]):
-                sheet.cell(row=row_index + 2, column=col_index + 1, value=value)
-
-        # 保存 Excel 文件
-        workbook.save(full_path)
-        self.SpectroscopyTextBrowser.append("文件保存成功：%s" % full_path)
-        self.CommunicationTextBrowser.append("文件保存成功：%s" % full_path)
+            records, elapsed = export_columns_to_xlsx(full_path, block, titles)
+        except Exception as e:
+            self.onExportFailed("文件保存失败：%s" % e)
+            return
+        self.onExportFinished(full_path, records, elapsed)
+
+    def onExportFinished(self, full_path, periods, elapsed):   # 保存完成，报告写入速度，每个周期为Excel中的一列
+        if self.Core.instruments.enabled:
+            self.Core.instruments.record(SPAN_SAVE, int(elapsed * 1e9))
+        rate = periods / elapsed if elapsed > 0 else 0
+        self.log("文件保存成功：%s（%d 个周期，%.0f 周期/秒）" % (full_path, periods, rate))
+
+    def onExportFailed(self, message):
+        self.log(message, LOG_ERROR)
 
     def SingleChannelThresholdTuning(self): #  单通道阈值微调
         ChannelNumberStr = self.ChannelNumberEdit.text()    # 获取通道号输入框中的文本，转换为整数
@@ -1305,29 +1082,119 @@ class DataTransmission(QMainWindow, Ui_DataTransmisson):
         
         ThresholdStr = self.ThresholdEdit.text()            # 获取阈值输入框中的文本，转换为整数
         ThresholdValue = int(ThresholdStr)                  # 将阈值从字符串转换为整数
-        # 检查通道号是否在有效范围（1-64）
-        if ChannelNumberValue > 64: 
-            self.SpectroscopyTextBrowser.append("通道号超出范围")
-            self.CommunicationTextBrowser.append("通道号超出范围")
-            return
         
-        # 检查阈值是否在有效范围（0-31）
-        if ThresholdValue > 31: 
-            self.SpectroscopyTextBrowser.append("阈值超出范围")
-            self.CommunicationTextBrowser.append("阈值超出范围")
+        future = self.send_command(self.Core.channel_threshold, ChannelNumberValue, ThresholdValue)  # 通道号（1-64）和阈值（0-31）超出范围时提示
+        if future is not None and self.AppliedTrims is not None:  # 下发成功后更新已下发的微调表
+            def record(future):
+                if future.succeeded:
+                    self.AppliedTrims[ChannelNumberValue - 1] = ThresholdValue
+            future.add_done_callback(record)
+        return future
+
+    def ChannelThresholdTableConfig(self, table, channels=None, on_finished=None):    # 批量配置通道阈值，table 为64个通道的阈值微调表，channels 为要下发的通道号，None为全部
+        def finished(pipeline):
+            message = "通道阈值表配置完成：%d 条成功，%d 条失败，耗时 %.1f ms" % (pipeline.succeeded, pipeline.failed, pipeline.elapsed() * 1e3)
+            self.log(message)
+            if on_finished is not None:
+                on_finished(pipeline)
+
+        try:
+            return self.Core.apply_trims(table, channels, self.PipelineWindow, finished)  # 一次算出全部指令参数，滑动窗口下发
+        except (ValueError, RuntimeError) as e:
+            self.log(str(e), LOG_ERROR)
+            return None
+
+    def TrimTableLoad(self):    # 载入阈值微调表，支持 .json/.csv/.npy
+        file_path, _ = QFileDialog.getOpenFileName(self, "Load Trim Table", "", "Trim Table (*.json *.csv *.npy);;All Files (*)")
+        if not file_path:
             return
-        
-        InsSingleChannelThresholdTuningCode = 0X02  # 定义指令码，并将其转换为两位十六进制字符串
-        str_InsSingleChannelThresholdTuningCode = f"{InsSingleChannelThresholdTuningCode:02X}"
-        
-        SingleChannelThresholdTuning_combined = (0b11 << 14) | (ChannelNumberValue-1 << 8) | (0b000 << 5) | ThresholdValue    # 组合指令
-        str_SingleChannelThresholdTuning_combined = f"{SingleChannelThresholdTuning_combined:04X}"  # 将组合后的指令转换为四位十六进制字符串
-        str_SingleChannelThresholdTuning = str_InsSingleChannelThresholdTuningCode + str_SingleChannelThresholdTuning_combined  # 合并指令码和组合的指令数据，构成最终的指令字符串
-        Instr_SingleChannelThresholdTuning = self.InstrCombination(str_SingleChannelThresholdTuning)
-        self.send_data(Instr_SingleChannelThresholdTuning)
+        try:
+            self.TrimTable = load_trim_table(file_path)
+        except (OSError, ValueError) as e:
+            self.log("阈值微调表载入失败：%s" % e, targets=LOG_SPEC)
+            return
+        changed = len(changed_channels(self.TrimTable, self.AppliedTrims))
+        self.log(f"从 {file_path} 载入阈值微调表，{changed} 个通道待下发", targets=LOG_SPEC)
+
+    def TrimTableApply(self, table=None):  # 下发阈值微调表，只发送与上次下发相比有变化的通道
+        table = self.TrimTable if table is None else table
+        if table is None:
+            self.log("请先载入阈值微调表", targets=LOG_SPEC)
+            return None
+        channels = changed_channels(table, self.AppliedTrims)
+        if not len(channels):
+            self.log("阈值微调表没有变化，无需下发", targets=LOG_SPEC)
+            return None
+        applied = np.array(table, dtype=np.uint8)
+
+        def record(pipeline):   # 只记录下发成功的通道
+            if self.AppliedTrims is None:
+                self.AppliedTrims = np.full_like(applied, TRIM_UNKNOWN)  # 未下发成功的通道下次仍会发送
+            for command, future in pipeline.results:
+                if future is not None and future.succeeded:
+                    channel = command_channel(command)
+                    self.AppliedTrims[channel - 1] = applied[channel - 1]
+
+        return self.ChannelThresholdTableConfig(applied, channels, record)
+
+    def SCurveEqualize(self, xlsx_path=None, push=None):  # 拟合S曲线各通道的50%点与噪声宽度，计算使各通道对齐的微调值
+        if not xlsx_path:
+            xlsx_path, _ = QFileDialog.getOpenFileName(self, "Load S-Curve", self.FilePathLineEdit.text(), "Excel Files (*.xlsx);;All Files (*)")
+            if not xlsx_path:
+                return None
+        try:
+            dac, counts = read_scurve_xlsx(xlsx_path)
+        except Exception as e:
+            self.log("S曲线读取失败：%s" % e, targets=LOG_SPEC)
+            return None
+        if len(dac) < 3:
+            self.log("S曲线步数太少，无法拟合", targets=LOG_SPEC)
+            return None
+
+        result = fit_scurves(dac, counts)  # 所有通道同时拟合
+        current = self.AppliedTrims if self.AppliedTrims is not None and not (self.AppliedTrims == TRIM_UNKNOWN).any() else None
+        trims, target = compute_trims(result.mu, result.ok, dac_per_trim=self.DACPerTrim, current=current, polarity=self.TrimPolarity)
+        self.TrimTable = trims_to_table(trims, current)
+        save_fit_report(fit_report_path(xlsx_path), result, trims)
+
+        good = result.ok
+        self.log("S曲线拟合完成：%d/%d 个通道可信，目标50%%点 %.1f，50%%点 %.1f~%.1f，平均噪声宽度 %.2f，结果保存至 %s"
+                 % (good.sum(), len(good), target, result.mu[good].min() if good.any() else 0,
+                    result.mu[good].max() if good.any() else 0, result.sigma[good].mean() if good.any() else 0,
+                    fit_report_path(xlsx_path)), targets=LOG_SPEC)
+        for index in np.flatnonzero(~good).tolist():
+            self.log("通道 %d 拟合不可信（50%%点 %.1f±%.2f，约化χ² %.2f），微调值保持不变"
+                     % (index + 1, result.mu[index], result.mu_error[index], result.chi2[index]), targets=LOG_SPEC)
+
+        if push is None:
+            push = QMessageBox.question(self, "下发微调值", "是否下发拟合得到的阈值微调表？") == QMessageBox.Yes
+        if push:
+            self.TrimTableApply()
+        return result
+
+    def TrimTableSave(self):    # 保存上次下发成功的阈值微调表
+        table = self.TrimTable
+        if self.AppliedTrims is not None and not (self.AppliedTrims == TRIM_UNKNOWN).any():
+            table = self.AppliedTrims
+        if table is None:
+            self.log("没有可保存的阈值微调表", targets=LOG_SPEC)
+            return
+        file_path, _ = QFileDialog.getSaveFileName(self, "Save Trim Table", "trims.json", "JSON Files (*.json);;CSV Files (*.csv);;NumPy Files (*.npy)")
+        if not file_path:
+            return
+        try:
+            save_trim_table(file_path, table)
+        except (OSError, ValueError) as e:
+            self.log("阈值微调表保存失败：%s" % e, targets=LOG_SPEC)
+            return
+        self.log(f"阈值微调表保存至 {file_path}", targets=LOG_SPEC)
         
 if __name__ == "__main__":
     app = QApplication(sys.argv)
-    myWin = DataTransmission()
+    spectrum_backend = None  # 启动参数 --spectrum-backend=qpainter|pyqtgraph|matplotlib
+    for arg in app.arguments()[1:]:
+        if arg.startswith("--spectrum-backend="):
+            spectrum_backend = arg.split("=", 1)[1]
+    myWin = DataTransmission(spectrum_backend=spectrum_backend)
     myWin.show()
     sys.exit(app.exec_())
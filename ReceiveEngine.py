@@ -0,0 +1,245 @@
+import select
+import socket
+import threading
+import time
+from array import array
+from time import perf_counter_ns
+
+from Instrumentation import SPAN_RECEIVE
+from Protocol import FRAME_LENGTH
+
+
+class FrameRingBuffer:  # 单生产者单消费者的固定槽位环形缓冲区，接收线程只写 head，消费者只写 tail
+    def __init__(self, slots=8192, frame_size=FRAME_LENGTH):
+        self.slots = slots
+        self.frame_size = frame_size
+        self.slot_size = frame_size + 1  # 多留一个字节，超长的数据包截断后仍能判断出长度错误
+        self.buffer = bytearray(slots * self.slot_size)  # 预先分配全部槽位
+        self.view = memoryview(self.buffer)
+        self.lengths = array('H', bytes(2 * slots))  # 每个槽位中数据包的实际长度
+        self.scratch = bytearray(self.slot_size)  # 缓冲区满时用于丢弃数据包
+        self.head = 0  # 已写入的数据包总数
+        self.tail = 0  # 已取出的数据包总数
+        self.drops = 0  # 缓冲区满而丢弃的数据包数
+        self.high_water = 0  # 缓冲区占用的最高水位
+        self.last_received = None  # 最近一次接收的数据包视图，用于记录原始数据
+
+    def __len__(self):
+        return self.head - self.tail
+
+    def recv_from(self, sock):  # 从套接字直接读入下一个空闲槽位，没有数据时抛出 BlockingIOError
+        if self.head - self.tail >= self.slots:
+            n = sock.recv_into(self.scratch)
+            self.last_received = memoryview(self.scratch)[:n]
+            self.drops += 1
+            return 0
+
+        slot = self.head % self.slots
+        offset = slot * self.slot_size
+        n = sock.recv_into(self.view[offset:offset + self.slot_size])
+        self.lengths[slot] = n
+        self.last_received = self.view[offset:offset + n]
+        self.head += 1  # 数据写完后才移动 head，消费者看到的槽位总是完整的
+
+        occupancy = self.head - self.tail
+        if occupancy > self.high_water:
+            self.high_water = occupancy
+        return n
+
+    def push(self, data):  # 写入一个数据包，用于回放和测试
+        if self.head - self.tail >= self.slots:
+            self.drops += 1
+            return False
+
+        slot = self.head % self.slots
+        offset = slot * self.slot_size
+        n = min(len(data), self.slot_size)
+        self.view[offset:offset + n] = data[:n]
+        self.lengths[slot] = n
+        self.head += 1
+
+        occupancy = self.head - self.tail
+        if occupancy > self.high_water:
+            self.high_water = occupancy
+        return True
+
+    def consume(self, handler, max_frames=None):  # 依次将槽位的 memoryview 交给 handler 处理，处理完成后释放槽位
+        available = self.head - self.tail
+        if max_frames is not None:
+            available = min(available, max_frames)
+
+        tail = self.tail
+        try:
+            for _ in range(available):
+                slot = tail % self.slots
+                offset = slot * self.slot_size
+                tail += 1
+                handler(self.view[offset:offset + self.lengths[slot]])
+        finally:
+            self.tail = tail  # handler 出错时也释放已处理的槽位
+        return available
+
+    def consume_batch(self, handler, max_frames=None):  # 将一批槽位的 memoryview 列表一次交给 handler，全部处理完成后才释放槽位
+        available = self.head - self.tail
+        if max_frames is not None:
+            available = min(available, max_frames)
+        if not available:
+            return 0
+
+        views = []
+        for i in range(self.tail, self.tail + available):
+            slot = i % self.slots
+            offset = slot * self.slot_size
+            views.append(self.view[offset:offset + self.lengths[slot]])
+        try:
+            handler(views)
+        finally:
+            self.tail += available
+        return available
+
+    def pop_batch(self, max_frames=None):  # 取出一批数据包的副本
+        frames = []
+        self.consume(lambda frame: frames.append(bytes(frame)), max_frames)
+        return frames
+
+    def stats(self):
+        return {
+            "received": self.head,
+            "consumed": self.tail,
+            "occupancy": self.head - self.tail,
+            "high_water": self.high_water,
+            "drops": self.drops,
+            "slots": self.slots,
+        }
+
+
+class UDPReceiveEngine:    # 接收引擎，独占UDP套接字，在接收线程中将数据包读入环形缓冲区
+    def __init__(self, local_port=8081, host='0.0.0.0', ring=None, notify=None, on_error=None, rcvbuf=4 * 1024 * 1024,
+                 on_batch=None, batch_window=0.01, batch_frames=256, capture=None, instruments=None):
+        self.local_port = local_port
+        self.host = host
+        self.ring = ring if ring is not None else FrameRingBuffer()
+        self.notify = notify  # 有新数据包时调用，消费者取走数据前只通知一次
+        self.on_error = on_error  # 接收出错时调用，参数为错误信息
+        self.rcvbuf = rcvbuf
+        self.on_batch = on_batch  # 批量模式：在接收线程中合并数据包后调用 on_batch(buffer, offsets)
+        self.batch_window = batch_window  # 批量合并的时间窗口，单位s
+        self.batch_frames = batch_frames  # 攒够这么多包时立即发送
+        self.capture = capture  # 原始数据包记录，需提供 write(data)，包括因缓冲区满而丢弃的包
+        self.instruments = instruments  # Instrumentation，启用时记录每个数据包的接收耗时
+        self.socket = None
+        self.thread = None
+        self.errors = 0
+        self.batches = 0  # 已发送的批次数
+        self._stop_event = threading.Event()
+        self._notified = False
+
+    def open(self):  # 创建并绑定套接字
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.rcvbuf)  # 加大内核接收缓冲区，应对突发数据
+        except OSError:
+            pass
+        sock.bind((self.host, self.local_port))
+        sock.setblocking(False)
+        self.socket = sock
+        self._stop_event.clear()
+        return sock
+
+    def start(self):  # 在独立线程中运行接收循环
+        if self.socket is None:
+            self.open()
+        self.thread = threading.Thread(target=self.serve_forever, name="UDPReceiveEngine", daemon=True)
+        self.thread.start()
+
+    def serve_forever(self, poll_interval=0.05):   # 接收循环，可直接在 QThread.run 中调用
+        sock = self.socket if self.socket is not None else self.open()
+        ring = self.ring
+        batch_mode = self.on_batch is not None
+        pending_since = None  # 当前批次中第一个数据包的到达时间
+        while not self._stop_event.is_set():
+            timeout = poll_interval
+            if pending_since is not None:
+                timeout = max(0.0, pending_since + self.batch_window - time.monotonic())
+            try:
+                readable, _, _ = select.select([sock], [], [], timeout)
+            except (OSError, ValueError):  # 套接字已关闭
+                break
+
+            started = perf_counter_ns() if self.instruments is not None and self.instruments.enabled else 0
+            received = 0
+            while readable:  # 一次取空内核缓冲区
+                try:
+                    ring.recv_from(sock)
+                    received += 1
+                    if self.capture is not None:
+                        self.capture.write(ring.last_received)
+                except BlockingIOError:
+                    break
+                except OSError as e:  # Windows下对端端口不可达时会收到 ConnectionResetError
+                    self.errors += 1
+                    if self.on_error is not None:
+                        self.on_error('接收数据出错: %s' % e)
+                    break
+                if batch_mode and len(ring) >= self.batch_frames:
+                    break
+            if started and received:    # 一次取空的耗时按包平均
+                self.instruments.record(SPAN_RECEIVE, (perf_counter_ns() - started) // received, received)
+
+            if batch_mode:
+                if pending_since is None and len(ring):
+                    pending_since = time.monotonic()
+                if pending_since is not None and (len(ring) >= self.batch_frames
+                                                  or time.monotonic() - pending_since >= self.batch_window):
+                    self.flush_batch()
+                    pending_since = None
+            elif received and not self._notified and self.notify is not None:
+                self._notified = True
+                self.notify()
+
+        if batch_mode:
+            self.flush_batch()  # 退出前发送剩余的数据包
+
+    def flush_batch(self):  # 将缓冲区中的数据包合并为一段连续内存，offsets[i]:offsets[i+1] 为第i个数据包
+        views = []
+        offsets = [0]
+
+        def take(frame):
+            views.append(frame)
+            offsets.append(offsets[-1] + len(frame))
+
+        if not self.ring.consume(take, self.batch_frames):
+            return 0
+        buffer = b''.join(views)  # 槽位在本线程下次接收前不会被覆盖，合并后再交出
+        self.batches += 1
+        self.on_batch(buffer, offsets)
+        return len(views)
+
+    def consume(self, handler, max_frames=None):  # 消费者取出数据包，先清除通知标志再取，避免漏掉通知
+        self._notified = False
+        return self.ring.consume(handler, max_frames)
+
+    def consume_batch(self, handler, max_frames=None):
+        self._notified = False
+        return self.ring.consume_batch(handler, max_frames)
+
+    def sendto(self, data, addr):  # 通过同一个套接字发送指令，开发板应答到本地端口
+        return self.socket.sendto(data, addr)
+
+    def stop(self, timeout=1.0):   # 停止接收循环并关闭套接字
+        self._stop_event.set()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(timeout)
+        self.thread = None
+
+    def close(self):
+        self.stop()
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+
+    def stats(self):
+        stats = self.ring.stats()
+        stats["errors"] = self.errors
+        stats["batches"] = self.batches
+        return stats
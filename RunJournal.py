@@ -0,0 +1,349 @@
+import argparse
+import os
+import queue
+import struct
+import sys
+import threading
+import time
+from bisect import bisect_right
+from collections import namedtuple
+
+import numpy as np
+
+from Protocol import (decode_frame, FRAME_SHORT, FRAME_LONG, FRAME_CLUSTER, FRAME_HIT, FRAME_SYNC, FRAME_SYNC_ERROR,
+                      MODE_SHORT, MODE_LONG, MODE_CLUSTER, MODE_HIT, INSTRUCTION_LENGTH)
+
+# 运行日志文件：文件头 JOURNAL_MAGIC + 打开时的系统时间(ns) + 单调时钟(ns)，之后每条记录为
+# 单调时钟时间(ns, int64) + 记录类型(uint8) + 载荷长度(uint16) + 载荷，小端，只追加
+# 索引文件 <运行日志>.idx：文件头 INDEX_MAGIC，之后每隔 index_every 条记录写入一项 时间(ns) + 记录在运行日志中的偏移量
+JOURNAL_MAGIC = b'XPSJRN1\n'
+INDEX_MAGIC = b'XPSJIX1\n'
+_FILE_HEAD = struct.Struct('<qq')
+_RECORD = struct.Struct('<qBH')
+_INDEX = struct.Struct('<qQ')
+
+# 记录类型
+REC_SEND = 1  # 发送的指令，载荷：是否重发(uint8) + 指令帧原文
+REC_ACK = 2  # 应答包，载荷：应答序号(uint16) + 设备ID(uint8) + 应答码(uint8) + 应答参数(uint16)
+REC_DATA = 3  # 数据包，载荷：数据包类型(uint8) + CRC是否通过(uint8) + 数据包原文，读取时再解码
+REC_SYNC = 4  # 同步触发应答，载荷：数据包类型(uint8) + 标志(uint8)
+REC_ERROR = 5  # 无法识别的数据包，载荷：错误原因(utf-8)
+REC_STEP = 6  # S曲线扫描的一步，载荷：步序号(uint32) + DAC值(int32) + 各通道计数(uint32...)
+REC_NOTE = 7  # 文本注释，如运行开始时的配置，载荷：utf-8
+
+RECORD_NAMES = {
+    REC_SEND: "send",
+    REC_ACK: "ack",
+    REC_DATA: "data",
+    REC_SYNC: "sync",
+    REC_ERROR: "error",
+    REC_STEP: "step",
+    REC_NOTE: "note",
+}
+
+_SEND = struct.Struct('<?')
+_ACK = struct.Struct('<HBBH')
+_DATA = struct.Struct('<B?')
+_SYNC = struct.Struct('<BB')
+_STEP = struct.Struct('<Ii')
+_INSTRUCTION = struct.Struct('>HHBBH')  # 包头，指令帧序号，保留，命令码，命令参数
+
+# 数据包与同步应答类型在文件中的编号
+KIND_CODES = {FRAME_SHORT: 1, FRAME_LONG: 2, FRAME_CLUSTER: 3, FRAME_HIT: 4, FRAME_SYNC: 5, FRAME_SYNC_ERROR: 6}
+CODE_KINDS = {code: kind for kind, code in KIND_CODES.items()}
+_KIND_MODES = {FRAME_SHORT: MODE_SHORT, FRAME_LONG: MODE_LONG, FRAME_CLUSTER: MODE_CLUSTER, FRAME_HIT: MODE_HIT}
+
+# 读取时各类记录的内容
+SendRecord = namedtuple('SendRecord', 'sn command param resend data')  # 非完整指令帧时 sn/command/param 为None
+AckRecord = namedtuple('AckRecord', 'sn device_id ack_code param')
+DataRecord = namedtuple('DataRecord', 'kind crc_ok sn device_id ack_code counts data')
+SyncRecord = namedtuple('SyncRecord', 'kind flag')
+ErrorRecord = namedtuple('ErrorRecord', 'reason')
+StepRecord = namedtuple('StepRecord', 'step dac counts')
+NoteRecord = namedtuple('NoteRecord', 'text')
+JournalRecord = namedtuple('JournalRecord', 'timestamp_ns type value offset')
+
+
+def index_path(path):
+    return path + '.idx'
+
+
+class RunJournal:   # 运行日志写入器：调用线程只打包记录并放入队列，由后台线程批量写入文件，从不阻塞接收处理
+    def __init__(self, path, index_every=1024, max_pending=1 << 20, flush_interval=0.5, clock=time.monotonic_ns):
+        self.path = path
+        self.index_every = index_every  # 每隔多少条记录写入一项索引
+        self.max_pending = max_pending  # 队列中最多等待写入的记录数，超出时丢弃新记录并计数
+        self.flush_interval = flush_interval  # 后台线程最长等待这么久就刷新一次文件缓冲，单位s
+        self.clock = clock
+        self.records = 0  # 已写入文件的记录数
+        self.bytes = 0
+        self.dropped = 0
+        self.file = None
+        self.index = None
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+
+    def open(self):  # 新建运行日志，文件已存在时抛出 FileExistsError，不覆盖已有记录
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.file = open(self.path, 'xb')
+        self.file.write(JOURNAL_MAGIC + _FILE_HEAD.pack(time.time_ns(), self.clock()))
+        self.bytes = self.file.tell()
+        self.index = open(index_path(self.path), 'wb')
+        self.index.write(INDEX_MAGIC)
+        self._thread = threading.Thread(target=self._run, name="RunJournal", daemon=True)
+        self._thread.start()
+        return self
+
+    @property
+    def closed(self):
+        return self._thread is None
+
+    def write(self, rec_type, payload, timestamp_ns=None):  # 记录一条，时间默认为调用时刻
+        if self._thread is None:
+            return
+        if self._queue.qsize() >= self.max_pending:
+            self.dropped += 1
+            return
+        self._queue.put(_RECORD.pack(self.clock() if timestamp_ns is None else timestamp_ns, rec_type, len(payload)) + payload)
+
+    def send(self, data, resend=False):  # 发送的指令帧
+        self.write(REC_SEND, _SEND.pack(resend) + bytes(data))
+
+    def ack(self, frame):   # 解码后的应答包
+        self.write(REC_ACK, _ACK.pack(frame.sn, frame.device_id, frame.ack_code, frame.param))
+
+    def data(self, data, kind, crc_ok=True):   # 数据包原文，读取时按类型解码
+        self.write(REC_DATA, _DATA.pack(KIND_CODES[kind], crc_ok) + bytes(data))
+
+    def sync(self, frame):
+        self.write(REC_SYNC, _SYNC.pack(KIND_CODES[frame.kind], frame.flag))
+
+    def error(self, reason):
+        self.write(REC_ERROR, str(reason).encode('utf-8'))
+
+    def step(self, step, dac_value, counts):   # S曲线扫描的一步
+        self.write(REC_STEP, _STEP.pack(step, dac_value) + np.asarray(counts, dtype='<u4').tobytes())
+
+    def note(self, text):
+        self.write(REC_NOTE, text.encode('utf-8'))
+
+    def close(self):    # 写完队列中的全部记录后关闭文件
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+        self.file.close()
+        self.index.close()
+
+    def stats(self):
+        return {"records": self.records, "bytes": self.bytes, "dropped": self.dropped, "pending": self._queue.qsize()}
+
+    def _run(self):
+        running = True
+        while running:
+            try:
+                batch = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            while len(batch) < 4096:    # 取出队列中已有的记录一起写入
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if batch[-1] is None:
+                batch.pop()
+                running = False
+            self._write_batch(batch)
+
+    def _write_batch(self, batch):
+        entries = []
+        offset = self.bytes
+        for record in batch:
+            if self.records % self.index_every == 0:
+                entries.append(_INDEX.pack(_RECORD.unpack_from(record)[0], offset))
+            self.records += 1
+            offset += len(record)
+        self.file.write(b''.join(batch))
+        self.file.flush()
+        self.bytes = offset
+        if entries:     # 索引在记录写入文件之后再写，索引项指向的记录总是完整的
+            self.index.write(b''.join(entries))
+            self.index.flush()
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def parse_record(rec_type, payload):    # 载荷转为对应的记录内容
+    if rec_type == REC_SEND:
+        resend, = _SEND.unpack_from(payload)
+        data = bytes(payload[_SEND.size:])
+        if len(data) == INSTRUCTION_LENGTH:
+            _, sn, _, command, param = _INSTRUCTION.unpack_from(data)
+            return SendRecord(sn, command, param, resend, data)
+        return SendRecord(None, None, None, resend, data)
+    if rec_type == REC_ACK:
+        return AckRecord(*_ACK.unpack_from(payload))
+    if rec_type == REC_DATA:
+        code, crc_ok = _DATA.unpack_from(payload)
+        kind = CODE_KINDS.get(code)
+        data = bytes(payload[_DATA.size:])
+        frame = decode_frame(data, _KIND_MODES.get(kind))
+        if frame.kind != kind:  # 全零数据包等仍按数据包解码，其余情况保留原文
+            return DataRecord(kind, crc_ok, None, None, None, None, data)
+        return DataRecord(kind, crc_ok, frame.sn, frame.device_id, frame.ack_code, frame.counts, data)
+    if rec_type == REC_SYNC:
+        code, flag = _SYNC.unpack_from(payload)
+        return SyncRecord(CODE_KINDS.get(code), flag)
+    if rec_type == REC_ERROR:
+        return ErrorRecord(bytes(payload).decode('utf-8'))
+    if rec_type == REC_STEP:
+        step, dac_value = _STEP.unpack_from(payload)
+        return StepRecord(step, dac_value, np.frombuffer(payload, dtype='<u4', offset=_STEP.size))
+    if rec_type == REC_NOTE:
+        return NoteRecord(bytes(payload).decode('utf-8'))
+    return bytes(payload)   # 未知类型保留载荷
+
+
+class JournalReader:    # 按时间范围读取运行日志，先用索引定位到起始时间附近，再顺序读取
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as file:
+            head = file.read(len(JOURNAL_MAGIC) + _FILE_HEAD.size)
+        if head[:len(JOURNAL_MAGIC)] != JOURNAL_MAGIC or len(head) < len(JOURNAL_MAGIC) + _FILE_HEAD.size:
+            raise ValueError("不是运行日志文件：%s" % path)
+        self.wall_ns, self.start_ns = _FILE_HEAD.unpack_from(head, len(JOURNAL_MAGIC))  # 打开时的系统时间和单调时钟
+        self.data_offset = len(head)
+        self.index_times, self.index_offsets = self._load_index()
+
+    def _load_index(self):  # 读取索引文件，没有或损坏时扫描记录头重建
+        times, offsets = [], []
+        size = os.path.getsize(self.path)
+        try:
+            with open(index_path(self.path), 'rb') as file:
+                if file.read(len(INDEX_MAGIC)) == INDEX_MAGIC:
+                    raw = file.read()
+                    for timestamp_ns, offset in _INDEX.iter_unpack(raw[:len(raw) - len(raw) % _INDEX.size]):
+                        if offset >= size:
+                            break
+                        times.append(timestamp_ns)
+                        offsets.append(offset)
+        except OSError:
+            pass
+        if times:
+            return times, offsets
+        return self.build_index()
+
+    def build_index(self, every=1024):  # 扫描全部记录头，每隔 every 条记录取一项
+        times, offsets = [], []
+        with open(self.path, 'rb') as file:
+            offset = self.data_offset
+            file.seek(offset)
+            n = 0
+            while True:
+                head = file.read(_RECORD.size)
+                if len(head) < _RECORD.size:
+                    break
+                timestamp_ns, _, length = _RECORD.unpack(head)
+                if n % every == 0:
+                    times.append(timestamp_ns)
+                    offsets.append(offset)
+                offset += _RECORD.size + length
+                file.seek(offset)
+                n += 1
+        return times, offsets
+
+    def wall_time(self, timestamp_ns):  # 单调时钟时间转为系统时间，单位s
+        return (self.wall_ns + timestamp_ns - self.start_ns) / 1e9
+
+    def records(self, start_ns=None, stop_ns=None, types=None):
+        # 依次返回时间在 [start_ns, stop_ns) 内的 JournalRecord，types 为要读取的记录类型，None为全部；最后一条不完整时忽略
+        offset = self.data_offset
+        if start_ns is not None and self.index_times:
+            i = bisect_right(self.index_times, start_ns) - 1    # 不晚于起始时间的最后一项索引
+            if i >= 0:
+                offset = self.index_offsets[i]
+        with open(self.path, 'rb') as file:
+            file.seek(offset)
+            while True:
+                head = file.read(_RECORD.size)
+                if len(head) < _RECORD.size:
+                    return
+                timestamp_ns, rec_type, length = _RECORD.unpack(head)
+                if stop_ns is not None and timestamp_ns >= stop_ns:
+                    return
+                if (start_ns is not None and timestamp_ns < start_ns) or (types is not None and rec_type not in types):
+                    file.seek(length, os.SEEK_CUR)  # 跳过载荷，不解析
+                    offset += _RECORD.size + length
+                    continue
+                payload = file.read(length)
+                if len(payload) < length:   # 记录中断
+                    return
+                yield JournalRecord(timestamp_ns, rec_type, parse_record(rec_type, payload), offset)
+                offset += _RECORD.size + length
+
+    def between(self, start_s=None, stop_s=None, types=None):   # 按相对运行日志开始的秒数读取
+        start_ns = None if start_s is None else self.start_ns + int(start_s * 1e9)
+        stop_ns = None if stop_s is None else self.start_ns + int(stop_s * 1e9)
+        return self.records(start_ns, stop_ns, types)
+
+    def __iter__(self):
+        return self.records()
+
+
+def format_journal_record(record, start_ns=0):  # 一行文本，时间为相对运行日志开始的秒数
+    value = record.value
+    name = RECORD_NAMES.get(record.type, str(record.type))
+    if record.type == REC_SEND:
+        if value.sn is None:
+            text = value.data.hex(' ').upper()
+        else:
+            text = "SN %d 命令码 %02X 参数 %04X" % (value.sn, value.command, value.param)
+        if value.resend:
+            text += " 重发"
+    elif record.type == REC_ACK:
+        text = "SN %d 设备ID %d 应答码 %02X 参数 %04X" % (value.sn, value.device_id, value.ack_code, value.param)
+    elif record.type == REC_DATA:
+        text = "%s SN %s 应答码 %s CRC%s" % (value.kind, value.sn, "%02X" % value.ack_code if value.ack_code is not None else "-",
+                                           "通过" if value.crc_ok else "错误")
+        if value.counts is not None:
+            text += " 总计数 %d" % sum(value.counts)
+    elif record.type == REC_SYNC:
+        text = "%s 标志 %d" % (value.kind, value.flag)
+    elif record.type == REC_STEP:
+        text = "第 %d 步 DAC %d 总计数 %d" % (value.step, value.dac, int(value.counts.sum()))
+    elif record.type in (REC_ERROR, REC_NOTE):
+        text = value[0]
+    else:
+        text = repr(value)
+    return "%12.6f %-5s %s" % ((record.timestamp_ns - start_ns) / 1e9, name, text)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="按时间范围和记录类型查看运行日志")
+    parser.add_argument("path", help="运行日志文件")
+    parser.add_argument("--from", dest="start_s", type=float, default=None, help="起始时间，相对运行日志开始的秒数")
+    parser.add_argument("--to", dest="stop_s", type=float, default=None, help="结束时间，相对运行日志开始的秒数")
+    parser.add_argument("--type", nargs="+", choices=list(RECORD_NAMES.values()), default=None, help="只显示这些类型的记录")
+    parser.add_argument("--count", action="store_true", help="只统计各类记录的条数")
+    args = parser.parse_args(argv)
+    names = {name: rec_type for rec_type, name in RECORD_NAMES.items()}
+    types = None if args.type is None else {names[name] for name in args.type}
+
+    reader = JournalReader(args.path)
+    print("运行日志开始于 %s" % time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(reader.wall_ns / 1e9)))
+    counts = {}
+    for record in reader.between(args.start_s, args.stop_s, types):
+        counts[record.type] = counts.get(record.type, 0) + 1
+        if not args.count:
+            print(format_journal_record(record, reader.start_ns))
+    print("，".join("%s %d 条" % (RECORD_NAMES.get(rec_type, rec_type), n) for rec_type, n in sorted(counts.items())) or "没有记录")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
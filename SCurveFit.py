@@ -0,0 +1,188 @@
+import csv
+import os
+import warnings
+from collections import namedtuple
+
+import numpy as np
+
+from Protocol import THRESHOLD_CHANNELS, CHANNEL_THRESHOLD_MAX
+
+# 各通道S曲线的拟合结果，均为长度为通道数的数组
+# mu 为50%点（DAC），sigma 为噪声宽度（DAC），amplitude 为平台计数，ok 为拟合是否可信
+# chi2 为按泊松方差计算的约化χ²，mu_error 为由残差估计的50%点标准误差（DAC）
+SCurveFitResult = namedtuple('SCurveFitResult', 'mu sigma amplitude falling ok chi2 mu_error')
+
+TRIM_CENTER = (CHANNEL_THRESHOLD_MAX + 1) // 2  # 没有已下发微调值时以中间值为起点
+
+MAX_CHI2 = 4.0  # 约化χ²超过此值时曲线形状与S曲线不符，拟合不可信
+MAX_MU_ERROR = 1.0  # 50%点标准误差超过此值（DAC）时不可信，下发的微调值可能偏差一个以上
+MIN_AMPLITUDE = 20.0  # 平台计数太少时泊松噪声可以拟合成任意陡的台阶，不可信
+
+_SQRT2 = np.sqrt(2.0)
+
+
+def erf(x):  # 误差函数，Abramowitz-Stegun 7.1.26，最大误差1.5e-7，避免依赖scipy
+    x = np.asarray(x, dtype=np.float64)
+    sign = np.sign(x)
+    x = np.abs(x)
+    t = 1.0 / (1.0 + 0.3275911 * x)
+    poly = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    return sign * (1.0 - poly * np.exp(-x * x))
+
+
+def scurve_model(dac, amplitude, mu, sigma, falling=True):  # amplitude/2 * (1 ∓ erf((dac-mu)/(√2·sigma)))
+    s = np.where(falling, -1.0, 1.0)
+    return amplitude / 2 * (1 + s * erf((dac - mu) / (_SQRT2 * sigma)))
+
+
+def _crossing(dac, above):  # 曲线从 above 为真变为假的位置：逐段累加 above 为真的宽度，50%点附近噪声引起的多次穿越相互抵消
+    widths = np.diff(dac)[:, None]
+    return dac[0] + (widths * (above[1:] + above[:-1].astype(np.float64)) / 2).sum(axis=0)
+
+
+def _crossing_near(dac, fraction, level, mu):   # 从50%点向外最近一次越过 level 的位置，线性插值，远处平台上的噪声不影响
+    n = len(dac)
+    index = np.arange(n)[:, None]
+    if level > 0.5:     # fraction 为下降沿，高于50%的一侧在前
+        i = np.where((dac[:, None] <= mu) & (fraction >= level), index, -1).max(axis=0)
+        j = i + 1
+    else:
+        j = np.where((dac[:, None] >= mu) & (fraction <= level), index, n).min(axis=0)
+        i = j - 1
+    inside = (i >= 0) & (j < n)
+    i, j = np.clip(i, 0, n - 1), np.clip(j, 0, n - 1)
+    columns = np.arange(fraction.shape[1])
+    fi, fj = fraction[i, columns], fraction[j, columns]
+    drop = np.where(fi > fj, fi - fj, 1.0)
+    t = np.where(fi > fj, np.clip((fi - level) / drop, 0.0, 1.0), 0.5)
+    return np.where(inside, dac[i] + t * (dac[j] - dac[i]), np.where(i < 0, dac[0], dac[-1]))
+
+
+def _initial_guess(dac, counts):    # 50%点与16%/84%点由归一化曲线的穿越位置得到，所有通道一次计算
+    first = counts[:2].mean(axis=0)
+    last = counts[-2:].mean(axis=0)
+    falling = first >= last
+    window = min(5, len(dac))
+    cumulative = np.cumsum(np.vstack([np.zeros((1, counts.shape[1])), counts]), axis=0)
+    amplitude = np.maximum(((cumulative[window:] - cumulative[:-window]) / window).max(axis=0), 1.0)  # 先取滑动平均的最大值
+    for _ in range(2):  # 再取远离下降沿的一半平台的中位数，噪声大时滑动平均的最大值偏高
+        fraction = np.where(falling, counts / amplitude, 1.0 - counts / amplitude)  # 转为下降沿
+        mu = _crossing(dac, fraction >= 0.5)
+        plateau = np.where(falling, dac[:, None] < (dac[0] + mu) / 2, dac[:, None] > (mu + dac[-1]) / 2)
+        enough = plateau.sum(axis=0) >= 3
+        with warnings.catch_warnings():     # 没有平台的通道全为NaN
+            warnings.simplefilter('ignore', RuntimeWarning)
+            median = np.nanmedian(np.where(plateau, counts, np.nan), axis=0)
+        amplitude = np.where(enough, np.maximum(median, 1.0), amplitude)
+    fraction = np.where(falling, counts / amplitude, 1.0 - counts / amplitude)
+    mu = _crossing(dac, fraction >= 0.5)
+    x84 = _crossing_near(dac, fraction, 0.8413, mu)
+    x16 = _crossing_near(dac, fraction, 0.1587, mu)
+    min_sigma = np.median(np.diff(dac)) / 2 if len(dac) > 1 else 1.0  # 初值不宜过小，否则下降沿落在两步之间时梯度为零
+    sigma = np.maximum((x16 - x84) / 2, min_sigma)
+    has_edge = (counts.max(axis=0) > 0) & (fraction[:2].mean(axis=0) > 0.5) & (fraction[-2:].mean(axis=0) < 0.5)
+    return amplitude, mu, sigma, falling, has_edge
+
+
+def _residual_jacobian(x, counts, amplitude, mu, sigma, s):
+    z = (x - mu) / (_SQRT2 * sigma)
+    g = 2 / np.sqrt(np.pi) * np.exp(-z * z)
+    model = amplitude / 2 * (1 + s * erf(z))
+    jacobian = np.stack([                       # (步数, 通道数, 3)
+        (1 + s * erf(z)) / 2,                   # d/d amplitude
+        -amplitude / 2 * s * g / (_SQRT2 * sigma),  # d/d mu
+        -amplitude / 2 * s * g * z / sigma,     # d/d sigma
+    ], axis=-1)
+    return counts - model, model, jacobian
+
+
+def fit_scurves(dac, counts, iterations=100, max_chi2=MAX_CHI2, max_mu_error=MAX_MU_ERROR, min_amplitude=MIN_AMPLITUDE):
+    # counts 为 (DAC步数, 通道数)，所有通道同时做 Levenberg-Marquardt 拟合，残差平方和增大的步被拒绝并加大阻尼
+    order = np.argsort(dac)
+    dac = np.asarray(dac, dtype=np.float64)[order]
+    counts = np.asarray(counts, dtype=np.float64)[order]
+    amplitude, mu, sigma, falling, has_edge = _initial_guess(dac, counts)
+    s = np.where(falling, -1.0, 1.0)
+    x = dac[:, None]
+    min_sigma = np.min(np.diff(dac)) / 10 if len(dac) > 1 else 0.1
+    max_sigma = max(dac[-1] - dac[0], min_sigma)
+    channels = counts.shape[1]
+    damping = np.full(channels, 1e-3)
+    active = np.ones(channels, dtype=bool)  # 尚未收敛的通道
+
+    residual, model, jacobian = _residual_jacobian(x, counts, amplitude, mu, sigma, s)
+    cost = (residual ** 2).sum(axis=0)
+    for _ in range(iterations):
+        jtj = np.einsum('kci,kcj->cij', jacobian, jacobian)
+        jtj += damping[:, None, None] * np.eye(3) * np.maximum(np.einsum('cii->ci', jtj), 1e-12)[:, :, None]
+        jtr = np.einsum('kci,kc->ci', jacobian, residual)
+        delta = (np.linalg.pinv(jtj) @ jtr[:, :, None])[:, :, 0]   # 下降沿落在两步之间时矩阵奇异，按通道用伪逆，不影响其他通道
+        trial_amplitude = np.maximum(amplitude + delta[:, 0], 1e-9)
+        trial_mu = np.clip(mu + delta[:, 1], dac[0], dac[-1])  # 50%点限制在扫描范围内
+        trial_sigma = np.clip(sigma + delta[:, 2], min_sigma, max_sigma)
+        trial_residual, trial_model, trial_jacobian = _residual_jacobian(x, counts, trial_amplitude, trial_mu, trial_sigma, s)
+        trial_cost = (trial_residual ** 2).sum(axis=0)
+
+        accept = active & np.isfinite(trial_cost) & (trial_cost < cost)
+        converged = accept & (cost - trial_cost <= 1e-10 * cost)
+        amplitude = np.where(accept, trial_amplitude, amplitude)
+        mu = np.where(accept, trial_mu, mu)
+        sigma = np.where(accept, trial_sigma, sigma)
+        residual = np.where(accept, trial_residual, residual)
+        model = np.where(accept, trial_model, model)
+        jacobian = np.where(accept[:, None], trial_jacobian, jacobian)
+        cost = np.where(accept, trial_cost, cost)
+        damping = np.where(accept, np.maximum(damping / 10, 1e-9), damping * 10)
+        active &= ~converged & (damping < 1e9)  # 阻尼增大到仍无法下降时视为已在极小点
+        if not active.any():
+            break
+
+    variance = np.maximum(model, 1.0)  # 泊松方差，零计数处按1计
+    informative = (model >= 0.5) | (counts > 0)  # 全零的一侧不计入自由度
+    dof = np.maximum(informative.sum(axis=0) - 3, 1)
+    chi2 = (np.where(informative, residual ** 2 / variance, 0.0)).sum(axis=0) / dof
+    # 50%点误差：未加权最小二乘在泊松方差下的协方差 (JᵀJ)⁻¹ JᵀVJ (JᵀJ)⁻¹，约化χ²大于1时按其放大
+    jtj = np.einsum('kci,kcj->cij', jacobian, jacobian)
+    jtvj = np.einsum('kci,kc,kcj->cij', jacobian, variance, jacobian)
+    inverse = np.linalg.pinv(jtj)
+    covariance = inverse @ jtvj @ inverse
+    mu_error = np.sqrt(np.abs(covariance[:, 1, 1]) * np.maximum(chi2, 1.0))
+    step = np.diff(dac)[np.clip(np.searchsorted(dac, mu) - 1, 0, len(dac) - 2)] if len(dac) > 1 else np.ones(channels)
+    mu_error = np.where(sigma < step / 4, np.hypot(mu_error, step / np.sqrt(12)), mu_error)  # 下降沿窄到落在两步之间时只能确定到一步之内
+
+    covered = (mu - 2 * sigma > dac[0]) & (mu + 2 * sigma < dac[-1])  # 扫描范围包括两侧平台，否则平台计数与50%点无法同时确定
+    ok = (has_edge & np.isfinite(mu) & np.isfinite(sigma) & covered & (sigma < max_sigma) & (amplitude >= min_amplitude)
+          & (chi2 <= max_chi2) & (mu_error <= max_mu_error))
+    return SCurveFitResult(mu, sigma, amplitude, falling, ok, chi2, mu_error)
+
+
+def compute_trims(mu, ok=None, target=None, dac_per_trim=1.0, current=None, polarity=1):    # 计算使各通道50%点对齐到 target 的5位微调值
+    # 微调值每加1，通道的50%点移动 polarity * dac_per_trim 个DAC；target 默认为可信通道的中位数
+    mu = np.asarray(mu, dtype=np.float64)
+    ok = np.isfinite(mu) if ok is None else np.asarray(ok)
+    current = np.full(len(mu), TRIM_CENTER) if current is None else np.asarray(current, dtype=np.int64)[:len(mu)]
+    if target is None:
+        target = np.median(mu[ok]) if ok.any() else 0.0
+    shift = np.rint((target - mu) / (dac_per_trim * polarity)).astype(np.int64)
+    trims = np.clip(current + np.where(ok, shift, 0), 0, CHANNEL_THRESHOLD_MAX)
+    return trims.astype(np.uint8), target
+
+
+def trims_to_table(trims, base=None):   # 拟合的通道依次对应通道1开始的阈值微调表，其余通道保持 base
+    table = np.full(THRESHOLD_CHANNELS, TRIM_CENTER, dtype=np.uint8) if base is None else np.array(base, dtype=np.uint8)
+    n = min(len(trims), THRESHOLD_CHANNELS)
+    table[:n] = trims[:n]
+    return table
+
+
+def fit_report_path(xlsx_path):  # 拟合结果与S曲线Excel放在同一目录
+    return os.path.splitext(xlsx_path)[0] + '.fit.csv'
+
+
+def save_fit_report(path, result, trims):
+    with open(path, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(["channel", "mu", "sigma", "amplitude", "ok", "chi2", "mu_error", "trim"])
+        for i, row in enumerate(zip(result.mu.tolist(), result.sigma.tolist(), result.amplitude.tolist(),
+                                    result.ok.tolist(), result.chi2.tolist(), result.mu_error.tolist(), trims.tolist())):
+            writer.writerow([i + 1, *row])
@@ -0,0 +1,251 @@
+import time
+
+import numpy as np
+
+# S曲线扫描的状态
+STATE_IDLE = 'idle'
+STATE_CONFIGURE = 'configure'  # 配置阈值，等待应答
+STATE_RESET = 'reset'  # 计数清零，等待应答
+STATE_TRIGGER = 'trigger'  # 同步触发，等待中间板应答并等待采集完成
+STATE_READ = 'read'  # 读数，等待数据包
+STATE_PERSIST = 'persist'  # 保存当前DAC步
+STATE_DONE = 'done'
+STATE_FAILED = 'failed'
+STATE_STOPPED = 'stopped'
+
+FINISHED_STATES = (STATE_DONE, STATE_FAILED, STATE_STOPPED)
+
+# 各状态成功、超时重发和重试次数用完时的提示
+STATE_MESSAGES = {
+    STATE_CONFIGURE: ("阈值配置成功", "阈值配置信号未接收到应答包，重新发送", "阈值配置多次未收到应答包，停止扫描"),
+    STATE_RESET: ("清零成功", "清零信号未接收到应答包，重新发送", "清零多次未收到应答包，停止扫描"),
+    STATE_TRIGGER: ("同步触发成功", "中间板未应答同步触发，重新触发", "中间板未能收到正确应答信号，建议检查"),
+    STATE_READ: ("读数成功", "读数信号未接收到应答包，重新发送", "读数多次未收到应答包，停止扫描"),
+}
+
+
+class SCurveScanEngine:  # 事件驱动的S曲线扫描状态机，收到对应应答后立即进入下一状态，不依赖界面和Qt
+    # actions 需要提供 configure_threshold(dac)、reset_counts()、trigger()、read_data()、persist(dac)
+    # 配置、清零、读数返回 CommandFuture 时由其完成驱动状态，超时重发交给应答关联器；
+    # 返回None时由接收端调用 on_ack/on_data，状态机自行超时重发。同步触发应答调用 on_sync，定时调用 poll 处理超时
+    def __init__(self, actions, steps, acquire_ms, ack_timeout_ms=1000, max_retries=5, trigger_slack_ms=2000,
+                 max_trigger_retries=1, log=None, on_finished=None, clock=time.monotonic):
+        self.actions = actions
+        self.steps = iter(steps)  # 依次给出每一步的DAC值，可以是生成器
+        self.acquire_s = acquire_ms / 1000  # 硬件采集所需的时间
+        self.ack_timeout_s = ack_timeout_ms / 1000  # 配置、清零、读数的应答超时
+        self.max_retries = max_retries  # 每个状态最多重发的次数
+        self.trigger_timeout_s = (acquire_ms + trigger_slack_ms) / 1000  # 同步触发的超时，与原来的固定等待时长一致
+        self.max_trigger_retries = max_trigger_retries
+        self.log = log if log is not None else (lambda message: None)
+        self.on_finished = on_finished
+        self.clock = clock
+
+        self.state = STATE_IDLE
+        self.dac = None  # 当前DAC值
+        self.pending = None  # 当前状态等待的指令
+        self.pending_sn = None  # 当前状态等待的指令帧序号，其他序号的应答不推进状态
+        self.attempts = 0  # 当前状态已发送的次数
+        self.deadline = None
+        self.entered_at = None
+        self.trigger_ok = False  # 已收到同步触发成功应答
+        self.steps_done = 0
+        self.started_at = None
+        self.finished_at = None
+        self.message = None  # 结束时的提示，失败时为失败原因
+        self.state_times = {}  # 每个状态累计耗时，单位s
+        self.stop_requested = False
+
+    @property
+    def running(self):
+        return self.state not in FINISHED_STATES and self.state != STATE_IDLE
+
+    def start(self):
+        self.started_at = self.clock()
+        self._next_step()
+
+    def stop(self):  # 立即停止，正在读数时等当前DAC步保存后停止
+        self.stop_requested = True
+        if self.running and self.state != STATE_READ:
+            self._cancel_pending()
+            self._finish(STATE_STOPPED, "S曲线生成已停止")
+
+    def on_ack(self, sn=None):  # 收到配置或清零的应答
+        if not self._matches(sn):
+            return
+        if self.state == STATE_CONFIGURE:
+            self._succeed()
+            self._enter(STATE_RESET)
+        elif self.state == STATE_RESET:
+            self._succeed()
+            self.trigger_ok = False
+            self._enter(STATE_TRIGGER)
+
+    def on_sync(self, flag):  # 收到同步触发应答，2 为成功，1 为探测器采集异常
+        if self.state != STATE_TRIGGER:
+            return
+        if flag == 2:
+            self.trigger_ok = True
+            self.poll()  # 采集时间已到则立即读数
+        elif flag == 1:
+            self._finish(STATE_FAILED, "探测器能谱采集工作异常，建议检查")
+
+    def on_data(self, sn=None):  # 收到读数的数据包
+        if self.state != STATE_READ or not self._matches(sn):
+            return
+        self._succeed()
+        self._enter(STATE_PERSIST)
+        self.actions.persist(self.dac)
+        self.steps_done += 1
+        self._next_step()
+
+    def poll(self, now=None):   # 定时调用，处理触发后的采集等待和各状态的超时
+        if not self.running:
+            return
+        now = self.clock() if now is None else now
+
+        if self.state == STATE_TRIGGER and self.trigger_ok:
+            if now - self.entered_at >= self.acquire_s:  # 采集完成后立即读数
+                self._succeed()
+                self._enter(STATE_READ)
+            return
+
+        if self.deadline is None or now < self.deadline:  # 等待指令完成，超时由应答关联器处理
+            return
+
+        retries = self.max_trigger_retries if self.state == STATE_TRIGGER else self.max_retries
+        if self.attempts > retries:
+            self._finish(STATE_FAILED, STATE_MESSAGES[self.state][2])
+            return
+        self.log(STATE_MESSAGES[self.state][1])
+        self._send()
+
+    def _next_step(self):
+        if self.stop_requested:
+            self._finish(STATE_STOPPED, "S曲线生成已停止")
+            return
+        dac = next(self.steps, None)
+        if dac is None:
+            self._finish(STATE_DONE, "S曲线生成完成")
+            return
+        self.dac = dac
+        self._enter(STATE_CONFIGURE)
+
+    def _enter(self, state):
+        self.state = state
+        self.attempts = 0
+        self.entered_at = self.clock()
+        if state != STATE_PERSIST:
+            self._send()
+
+    def _send(self):  # 发送当前状态的指令，并设置超时时间
+        self.attempts += 1
+        self._cancel_pending()
+        now = self.clock()
+        if self.state == STATE_CONFIGURE:
+            self._expect(self.actions.configure_threshold(self.dac), now)
+        elif self.state == STATE_RESET:
+            self._expect(self.actions.reset_counts(), now)
+        elif self.state == STATE_TRIGGER:
+            self.entered_at = now  # 重新触发后重新计算采集时间
+            self.trigger_ok = False
+            self.actions.trigger()
+            self.deadline = now + self.trigger_timeout_s
+        elif self.state == STATE_READ:
+            self._expect(self.actions.read_data(), now)
+
+    def _expect(self, future, now):  # 等待指令的应答
+        self.pending = future
+        self.pending_sn = getattr(future, 'sn', None)
+        if hasattr(future, 'add_done_callback'):
+            self.deadline = None
+            future.add_done_callback(self._on_command_done)  # 已完成时立即回调
+        else:
+            self.deadline = now + self.ack_timeout_s
+
+    def _on_command_done(self, future):
+        if future is not self.pending:  # 已重发或已取消的指令
+            return
+        self.pending = None
+        if not future.succeeded:
+            self._finish(STATE_FAILED, STATE_MESSAGES[self.state][2])
+        elif self.state == STATE_READ:
+            self.on_data()
+        else:
+            self.on_ack()
+
+    def _matches(self, sn):
+        return sn is None or self.pending_sn is None or sn == self.pending_sn
+
+    def _cancel_pending(self):
+        if self.pending is not None and hasattr(self.pending, 'cancel'):
+            pending, self.pending = self.pending, None
+            pending.cancel()
+        self.pending = None
+        self.pending_sn = None
+
+    def _succeed(self):  # 记录状态耗时并提示成功
+        elapsed = self.clock() - self.entered_at
+        self.state_times[self.state] = self.state_times.get(self.state, 0.0) + elapsed
+        if self.state != STATE_TRIGGER:
+            self.log(STATE_MESSAGES[self.state][0])
+
+    def _finish(self, state, message):
+        self.state = state
+        self.deadline = None
+        self._cancel_pending()
+        self.finished_at = self.clock()
+        self.message = message
+        self.log(message)
+        if self.on_finished is not None:
+            self.on_finished(state)
+
+    def elapsed(self):  # 扫描总耗时，单位s
+        if self.started_at is None:
+            return 0.0
+        end = self.finished_at if self.finished_at is not None else self.clock()
+        return end - self.started_at
+
+
+class AdaptiveSteps:    # 先粗扫，再只在计数变化快的DAC区间逐次二分加密，直到 fine_step
+    # 每一步的计数由 record(dac, counts) 告知，迭代时根据已有数据决定下一步
+    def __init__(self, start, stop, fine_step, coarse_step=None, threshold=0.05):
+        self.start = start
+        self.stop = stop  # 不包含
+        self.fine_step = fine_step
+        self.coarse_step = coarse_step if coarse_step is not None else fine_step * 8
+        self.threshold = threshold  # 相邻两步任一通道的计数变化超过该通道最大计数的这个比例时加密
+        self.points = {}  # DAC -> 各通道计数
+
+    def record(self, dac, counts):
+        self.points[dac] = np.asarray(counts, dtype=np.float64)
+
+    def __iter__(self):
+        yield from range(self.start, self.stop, self.coarse_step)
+        last = self.start + (self.stop - 1 - self.start) // self.fine_step * self.fine_step  # 均匀扫描的最后一步，保证覆盖范围一致
+        if last not in self.points and last >= self.start:
+            yield last
+        while True:
+            refine = self._refine()
+            if not refine:
+                return
+            yield from refine
+
+    def _refine(self):  # 在变化快的相邻两步之间取中点，对齐到 fine_step 的网格
+        dacs = sorted(self.points)
+        if len(dacs) < 2:
+            return []
+        counts = np.array([self.points[dac] for dac in dacs])
+        scale = np.maximum(counts.max(axis=0), 1.0)
+        steep = (np.abs(np.diff(counts, axis=0)) / scale > self.threshold).any(axis=1)
+        refine = []
+        for (a, b), is_steep in zip(zip(dacs, dacs[1:]), steep):
+            if not is_steep:
+                continue
+            mid = self.start + round(((a + b) / 2 - self.start) / self.fine_step) * self.fine_step
+            if a < mid < b:
+                refine.append(mid)
+        return refine
+
+    def uniform_steps(self):    # 均匀扫描需要的步数，用于比较
+        return len(range(self.start, self.stop, self.fine_step))
@@ -0,0 +1,20 @@
+class HistogramModel:   # 能谱直方图模型，数据处理函数只更新模型，由渲染定时器按固定帧率绘制
+    def __init__(self):
+        self.counts = ()  # 最新一次的各通道计数
+        self.version = 0  # 每次更新加1，渲染器据此判断是否需要重绘
+        self.updates = 0  # 累计更新次数
+
+    def update(self, counts):   # 用一个数据包的各通道计数替换当前能谱
+        self.counts = tuple(counts)
+        self.version += 1
+        self.updates += 1
+
+    def clear(self):    # 清空能谱
+        self.counts = ()
+        self.version += 1
+
+    def total(self):
+        return sum(self.counts)
+
+    def as_dict(self, names):   # 转为 {通道名: 计数}，与 draw_bar_chart 的输入格式一致
+        return dict(zip(names, self.counts))
@@ -0,0 +1,123 @@
+import os
+import time
+
+import numpy as np
+
+from Protocol import FRAME_SHORT, FRAME_LONG, FRAME_CLUSTER, FRAME_HIT
+
+STORE_MODES = (FRAME_SHORT, FRAME_LONG, FRAME_CLUSTER, FRAME_HIT)  # 元数据中 mode 字段为该元组的下标
+
+# 每一行的元数据
+META_DTYPE = np.dtype([
+    ('timestamp', '<f8'),  # 接收时间，time.time()
+    ('dac', '<i4'),  # 当前DAC阈值，未知时为-1
+    ('mode', 'u1'),  # 采集模式
+    ('channels', 'u1'),  # 该行有效通道数
+    ('ack_sn', '<u2'),  # 应答序号
+])
+
+
+class SpectrumStore:    # 按块预分配的能谱存储，每行为一次采集，每列为一个通道
+    def __init__(self, channels=63, chunk_rows=1024, max_rows=None, spill_path=None):
+        self.channels = channels
+        self.chunk_rows = chunk_rows
+        self.max_rows = max_rows  # 内存中最多保留的行数，None为不限制
+        self.spill_path = spill_path  # 超出保留行数时将最早的块追加到磁盘，None则直接丢弃
+        self.counts_chunks = []
+        self.meta_chunks = []
+        self.fill = chunk_rows  # 最后一块已使用的行数，初始时没有块
+        self.first_row = 0  # 内存中第一行的全局行号，之前的行已溢出或丢弃
+        self.spilled_rows = 0
+        self.dropped_rows = 0
+        self.on_drop = None  # 开始丢弃最早的数据时调用一次 on_drop(保留行数)，clear 后重新计
+
+    def __len__(self):  # 内存中保留的行数
+        if not self.counts_chunks:
+            return 0
+        return (len(self.counts_chunks) - 1) * self.chunk_rows + self.fill
+
+    @property
+    def total_rows(self):   # 累计写入的行数
+        return self.first_row + len(self)
+
+    def append(self, counts, dac=-1, mode=FRAME_SHORT, ack_sn=0, timestamp=None):   # 追加一行，均摊O(1)
+        if self.fill == self.chunk_rows:
+            self.counts_chunks.append(np.zeros((self.chunk_rows, self.channels), dtype=np.uint32))
+            self.meta_chunks.append(np.zeros(self.chunk_rows, dtype=META_DTYPE))
+            self.fill = 0
+            self._enforce_retention()
+
+        n = len(counts)
+        row = self.fill
+        self.counts_chunks[-1][row, :n] = counts
+        self.meta_chunks[-1][row] = (time.time() if timestamp is None else timestamp, dac,
+                                     STORE_MODES.index(mode), n, ack_sn)
+        self.fill += 1
+
+    def last(self):  # 最后一行有效通道的视图，没有数据时返回None，O(1)
+        if not len(self):
+            return None
+        row = self.fill - 1
+        return self.counts_chunks[-1][row, :self.meta_chunks[-1][row]['channels']]
+
+    def last_meta(self):
+        if not len(self):
+            return None
+        return self.meta_chunks[-1][self.fill - 1]
+
+    def blocks(self):   # 依次返回每块已使用部分的 (计数, 元数据) 视图，不复制
+        for i, (counts, meta) in enumerate(zip(self.counts_chunks, self.meta_chunks)):
+            used = self.fill if i == len(self.counts_chunks) - 1 else self.chunk_rows
+            yield counts[:used], meta[:used]
+
+    def to_array(self):  # 合并为一个 (行, 通道) 数组，会复制
+        blocks = list(self.blocks())
+        if not blocks:
+            return np.zeros((0, self.channels), dtype=np.uint32), np.zeros(0, dtype=META_DTYPE)
+        return np.concatenate([b[0] for b in blocks]), np.concatenate([b[1] for b in blocks])
+
+    def clear(self):
+        self.counts_chunks = []
+        self.meta_chunks = []
+        self.fill = self.chunk_rows
+        self.first_row = 0
+        self.spilled_rows = 0
+        self.dropped_rows = 0
+
+    def _enforce_retention(self):   # 新建块后检查保留行数，超出时移出最早的完整块
+        if self.max_rows is None:
+            return
+        while len(self.counts_chunks) > 1 and (len(self.counts_chunks) - 1) * self.chunk_rows > self.max_rows:
+            counts = self.counts_chunks.pop(0)
+            meta = self.meta_chunks.pop(0)
+            if self.spill_path is not None:
+                self._spill(counts, meta)
+                self.spilled_rows += self.chunk_rows
+            else:
+                if not self.dropped_rows and self.on_drop is not None:
+                    self.on_drop(self.max_rows)
+                self.dropped_rows += self.chunk_rows
+            self.first_row += self.chunk_rows
+
+    def _spill(self, counts, meta):  # 以原始二进制追加到 <spill_path>.counts 和 <spill_path>.meta
+        os.makedirs(os.path.dirname(os.path.abspath(self.spill_path)), exist_ok=True)
+        with open(self.spill_path + '.counts', 'ab') as file:
+            file.write(counts.tobytes())
+        with open(self.spill_path + '.meta', 'ab') as file:
+            file.write(meta.tobytes())
+
+    def stats(self):
+        return {
+            "rows": len(self),
+            "total_rows": self.total_rows,
+            "chunks": len(self.counts_chunks),
+            "bytes": sum(c.nbytes + m.nbytes for c, m in zip(self.counts_chunks, self.meta_chunks)),
+            "spilled_rows": self.spilled_rows,
+            "dropped_rows": self.dropped_rows,
+        }
+
+
+def load_spill(spill_path, channels=63):    # 读取溢出到磁盘的数据，返回内存映射的 (计数, 元数据)
+    counts = np.memmap(spill_path + '.counts', dtype=np.uint32, mode='r').reshape(-1, channels)
+    meta = np.memmap(spill_path + '.meta', dtype=META_DTYPE, mode='r')
+    return counts, meta
@@ -0,0 +1,149 @@
+import os
+
+from PyQt5.QtCore import Qt, QRectF, QPointF
+from PyQt5.QtGui import QPainter, QColor, QFont, QPen
+from PyQt5.QtWidgets import QApplication, QWidget, QVBoxLayout
+
+CHANNEL_NAMES = [f'CH{i}' for i in range(63)]  # 能谱图通道名
+
+# 能谱图绘制后端，都实现 draw_bar_chart(data) 和 clear_plot()
+BACKEND_QPAINTER = 'qpainter'  # QPainter直接绘制，默认后端
+BACKEND_PYQTGRAPH = 'pyqtgraph'  # pyqtgraph BarGraphItem，需要安装 pyqtgraph
+BACKEND_MATPLOTLIB = 'matplotlib'  # matplotlib，绘制较慢，用于导出图片
+SPECTRUM_BACKENDS = (BACKEND_QPAINTER, BACKEND_PYQTGRAPH, BACKEND_MATPLOTLIB)
+DEFAULT_BACKEND = BACKEND_QPAINTER
+
+BAR_COLOR = (29, 100, 87)  # 与matplotlib能谱图的柱子颜色一致
+
+
+def screen_dpi():   # 屏幕分辨率，没有QApplication时按100计算
+    screen = QApplication.primaryScreen() if QApplication.instance() is not None else None
+    return screen.logicalDotsPerInch() if screen is not None else 100
+
+
+class QPainterBarChart(QWidget):    # 用QPainter直接绘制柱状图，更新时只保存数据并请求重绘
+    def __init__(self, width=7.1, height=5.51, parent=None):
+        super().__init__(parent)
+        dpi = screen_dpi()
+        self.resize(int(width * dpi), int(height * dpi))
+        self.axes_channels = 32
+        self.values = []
+        self.bar_color = QColor(*BAR_COLOR)
+        self.font_small = QFont('SimHei', 6)
+        self.font_label = QFont('SimHei', 8)
+        self.font_total = QFont('SimHei', 12)
+
+    def draw_bar_chart(self, data):
+        self.values = list(data.values())
+        self.axes_channels = len(self.values)
+        self.update()   # 由Qt在下一次绘制时合并重绘
+
+    def clear_plot(self):
+        self.values = []
+        self.update()
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), Qt.white)
+        if not self.values:
+            painter.end()
+            return
+
+        w, h = self.width(), self.height()
+        left, right, top, bottom = 0.07 * w, 0.99 * w, 0.04 * h, 0.88 * h  # 绘图区，下方留出通道号和计数标签
+        channels = len(self.values)
+        y_max = max(self.values) if max(self.values) > 0 else 1
+        y_scale = (bottom - top) / (y_max * 1.1)
+        slot = (right - left) / channels
+
+        painter.setPen(QPen(Qt.black, 1))
+        painter.setBrush(self.bar_color)
+        painter.drawRects([QRectF(left + slot * (i + 0.1), bottom - value * y_scale, slot * 0.8, value * y_scale)
+                           for i, value in enumerate(self.values)])
+
+        painter.drawLine(int(left), int(bottom), int(right), int(bottom))  # x轴
+        painter.drawLine(int(left), int(top), int(left), int(bottom))  # y轴
+
+        painter.setFont(self.font_label)
+        for i in range(5):  # y轴刻度
+            value = y_max * 1.1 * i / 4
+            y = bottom - value * y_scale
+            painter.drawLine(int(left) - 3, int(y), int(left), int(y))
+            painter.drawText(QRectF(0, y - 8, left - 5, 16), Qt.AlignRight | Qt.AlignVCenter, f'{value:.0f}')
+
+        label_height = (h - bottom) / 2
+        for i, value in enumerate(self.values):  # x轴通道号，下方为计数
+            x = left + slot * i
+            painter.setFont(self.font_label)
+            painter.drawText(QRectF(x, bottom, slot, label_height), Qt.AlignCenter, str(i))
+            painter.setFont(self.font_small)
+            painter.drawText(QRectF(x, bottom + label_height, slot, label_height), Qt.AlignHCenter | Qt.AlignTop, str(value))
+
+        painter.setFont(self.font_total)  # 显示总计数
+        text = f'总计数: {sum(self.values)}'
+        box = painter.boundingRect(QRectF(0, 0, w, h), Qt.AlignRight | Qt.AlignTop, text).adjusted(-4, -2, 4, 2)
+        box.moveTopRight(QPointF(0.98 * w, 0.02 * h))
+        painter.setBrush(QColor(255, 255, 255, 204))
+        painter.drawRect(box)
+        painter.drawText(box, Qt.AlignCenter, text)
+        painter.end()
+
+
+class PyQtGraphBarChart(QWidget):   # pyqtgraph后端，BarGraphItem 原地更新柱高
+    def __init__(self, width=7.1, height=5.51, parent=None):
+        super().__init__(parent)
+        import pyqtgraph as pg  # 可选依赖，只在选择该后端时导入
+        self.pg = pg
+        dpi = screen_dpi()
+        self.resize(int(width * dpi), int(height * dpi))
+        self.plot = pg.PlotWidget(background='w')
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(self.plot)
+        self.axes_channels = 32
+        self.bars = None
+
+    def draw_bar_chart(self, data):
+        values = list(data.values())
+        channels = len(values)
+        if self.bars is None or channels != self.axes_channels:
+            self.plot.clear()
+            self.axes_channels = channels
+            self.bars = self.pg.BarGraphItem(x=list(range(channels)), height=values, width=0.8,
+                                             brush=self.pg.mkBrush(*BAR_COLOR), pen=self.pg.mkPen('k'))
+            self.plot.addItem(self.bars)
+            self.plot.getAxis('bottom').setTicks([[(i, str(i)) for i in range(channels)]])
+        else:
+            self.bars.setOpts(height=values)
+        self.plot.setTitle(f'总计数: {sum(values)}', color='k')
+
+    def clear_plot(self):
+        self.plot.clear()
+        self.plot.setTitle('')
+        self.bars = None
+
+
+def create_spectrum_canvas(backend=None, width=7.1, height=5.51):   # 按名称创建能谱图后端，未指定时读取环境变量 XPS_SPECTRUM_BACKEND
+    if backend is None:
+        backend = os.environ.get('XPS_SPECTRUM_BACKEND', DEFAULT_BACKEND)
+    backend = backend.lower()
+    if backend not in SPECTRUM_BACKENDS:
+        raise ValueError("未知的能谱图后端: %s，可选 %s" % (backend, ', '.join(SPECTRUM_BACKENDS)))
+
+    if backend == BACKEND_PYQTGRAPH:
+        try:
+            return PyQtGraphBarChart(width, height)
+        except ImportError:  # 没有安装pyqtgraph时退回QPainter
+            backend = BACKEND_QPAINTER
+    if backend == BACKEND_MATPLOTLIB:
+        from MatplotlibView import MyMatplotlibFigure
+        return MyMatplotlibFigure(width=width, height=height)
+    return QPainterBarChart(width, height)
+
+
+def export_bar_chart(data, path, dpi=600, width=7.1, height=5.51):  # 用matplotlib导出高分辨率能谱图
+    from MatplotlibView import MyMatplotlibFigure
+    canvas = MyMatplotlibFigure(width=width, height=height, dpi=dpi)
+    canvas.draw_bar_chart(data)
+    canvas.save_figure(path, dpi)
+    return path
@@ -0,0 +1,93 @@
+import csv
+import json
+import os
+
+import numpy as np
+
+from Protocol import CMD_CHANNEL_THRESHOLD, THRESHOLD_CHANNELS, CHANNEL_THRESHOLD_MAX
+
+# 64个通道的5位阈值微调表，下标为通道号-1
+TRIM_UNKNOWN = 0XFF  # 已下发表中尚未下发成功的通道
+
+
+def as_trim_table(values):  # 转为长度64的uint8数组，并检查范围
+    table = np.asarray(values)
+    if table.shape != (THRESHOLD_CHANNELS,):
+        raise ValueError("阈值微调表应为 %d 个通道，实际为 %s" % (THRESHOLD_CHANNELS, table.shape))
+    if table.min() < 0 or table.max() > CHANNEL_THRESHOLD_MAX:
+        raise ValueError("阈值超出范围")
+    return table.astype(np.uint8)
+
+
+def _channel_index(channel):  # 通道号1-64转为下标，超出范围时抛出 ValueError
+    index = int(channel) - 1
+    if not 0 <= index < THRESHOLD_CHANNELS:
+        raise ValueError("通道号 %s 超出范围 1-%d" % (channel, THRESHOLD_CHANNELS))
+    return index
+
+
+def load_trim_table(path):  # 按扩展名读取 .json/.csv/.npy
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.npy':
+        return as_trim_table(np.load(path))
+    if ext == '.json':
+        with open(path, encoding='utf-8') as file:
+            data = json.load(file)
+        if isinstance(data, dict):
+            data = data.get("trims", data)
+        if isinstance(data, dict):  # {"通道号": 阈值}，未给出的通道为0
+            table = np.zeros(THRESHOLD_CHANNELS, dtype=np.int64)
+            for channel, value in data.items():
+                table[_channel_index(channel)] = value
+            data = table
+        return as_trim_table(data)
+    if ext == '.csv':   # 每行一个阈值，或 通道号,阈值
+        table = np.zeros(THRESHOLD_CHANNELS, dtype=np.int64)
+        with open(path, newline='', encoding='utf-8') as file:
+            rows = [row for row in csv.reader(file) if row and row[0].strip().lstrip('-').isdigit()]  # 跳过标题行
+        if rows and len(rows[0]) >= 2:
+            for row in rows:
+                table[_channel_index(row[0])] = int(row[1])
+        else:
+            table[:len(rows)] = [int(row[0]) for row in rows]
+        return as_trim_table(table)
+    raise ValueError("不支持的阈值微调表格式：%s" % ext)
+
+
+def save_trim_table(path, table):
+    table = as_trim_table(table)
+    ext = os.path.splitext(path)[1].lower()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    if ext == '.npy':
+        np.save(path, table)
+    elif ext == '.json':
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump({"trims": table.tolist()}, file, indent=4)
+    elif ext == '.csv':
+        with open(path, 'w', newline='', encoding='utf-8') as file:
+            writer = csv.writer(file)
+            writer.writerow(["channel", "trim"])
+            writer.writerows(zip(range(1, THRESHOLD_CHANNELS + 1), table.tolist()))
+    else:
+        raise ValueError("不支持的阈值微调表格式：%s" % ext)
+
+
+def changed_channels(table, applied=None):  # 与上次下发的表相比有变化的通道号，applied 为None时全部下发
+    table = as_trim_table(table)
+    if applied is None:
+        return np.arange(1, THRESHOLD_CHANNELS + 1)
+    return np.flatnonzero(table != np.asarray(applied)) + 1  # TRIM_UNKNOWN 的通道总会下发
+
+
+def trim_params(table, channels=None):  # 一次算出各通道的命令参数 (0b11 << 14) | (通道号-1 << 8) | 阈值
+    table = as_trim_table(table)
+    channels = np.arange(1, THRESHOLD_CHANNELS + 1) if channels is None else np.asarray(channels)
+    return (0b11 << 14) | ((channels.astype(np.uint16) - 1) << 8) | table[channels - 1]
+
+
+def trim_commands(table, channels=None):  # 命令码与命令参数组成的六位十六进制字符串，用于 InstrCombination
+    return ["%02X%04X" % (CMD_CHANNEL_THRESHOLD, param) for param in trim_params(table, channels).tolist()]
+
+
+def command_channel(command):   # 从阈值微调指令中取出通道号
+    return (int(command[2:], 16) >> 8 & 0X3F) + 1
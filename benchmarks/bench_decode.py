@@ -0,0 +1,90 @@
+import os
+import sys
+import random
+import struct
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Protocol import decode_frame, MODE_SHORT, MODE_LONG, MODE_CLUSTER, MODE_HIT  # noqa: E402
+
+
+def legacy_crc(data_bytes, poly=0x1021, init_val=0xFFFF):  # 原 InstrCRCverify 的逐位实现
+    crc = init_val
+    for byte in data_bytes:
+        crc ^= byte << 8
+        for _ in range(8):
+            if (crc & 0x8000):
+                crc = (crc << 1) ^ poly
+            else:
+                crc <<= 1
+            crc &= 0xFFFF
+    return crc
+
+
+def legacy_decode(data, mode):  # 原 onDataReceived/DataReceiveVerify/*AckInsdistinguish 的十六进制字符串流程
+    Hex_data = data.hex()
+    ls = []
+    for i in range(len(Hex_data) // 2):
+        ls.append(Hex_data[i * 2].upper() + Hex_data[i * 2 + 1].upper())
+    ' '.join(ls)
+
+    if mode == MODE_SHORT:
+        if all(x == ls[9] for x in ls[10:]):
+            return None
+        format(legacy_crc(bytes.fromhex(''.join(ls[2:72]))), '04X')
+        return {f'CH{i}': int(''.join(ls[8 + i * 2:10 + i * 2]), 16) for i in range(32)}
+    if mode == MODE_LONG:
+        format(legacy_crc(bytes.fromhex(''.join(ls[2:136]))), '04X')
+        return {f'CH{i}': int(''.join(ls[8 + i * 4:12 + i * 4]), 16) for i in range(32)}
+    if mode == MODE_CLUSTER:
+        format(legacy_crc(bytes.fromhex(''.join(ls[2:136]))), '04X')
+        return {f'CH{i}': int(''.join(ls[8 + i * 2:10 + i * 2]), 16) for i in range(63)}
+    format(legacy_crc(bytes.fromhex(''.join(ls[2:72]))), '04X')
+    counts = {f'CH{i}': 0 for i in range(32)}
+    for i in range(16):
+        value = int(''.join(ls[8 + i * 4:12 + i * 4]), 16)
+        for j in range(32):
+            counts[f'CH{j}'] += (value >> j) & 0x1
+    return counts
+
+
+def make_frame(mode, rng):  # 构造一个合成数据包
+    head = struct.pack('>HHBBH', 0XEB90, rng.randrange(65536), 1, 0XF1, 0)
+    if mode == MODE_SHORT:
+        body = struct.pack('>32H', *(rng.randrange(65536) for _ in range(32))) + b'\x12\x34'
+        return head + body + b'\x34' * 64
+    if mode == MODE_LONG:
+        return head + struct.pack('>32I', *(rng.randrange(1 << 32) for _ in range(32))) + b'\x12\x34'
+    if mode == MODE_CLUSTER:
+        return head + struct.pack('>63H', *(rng.randrange(65536) for _ in range(63))) + b'\x00\x00\x12\x34'
+    body = struct.pack('>16I', *(rng.randrange(1 << 32) for _ in range(16))) + b'\x12\x34'
+    return head + body + b'\x34' * 64
+
+
+def rate(func, frames, mode, min_time=0.5):  # 返回每秒解码的数据包数
+    n = 0
+    start = time.perf_counter()
+    while True:
+        for frame in frames:
+            func(frame, mode)
+        n += len(frames)
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return n / elapsed
+
+
+def main():
+    rng = random.Random(0)
+    print(f"{'模式':<8}{'原流程 pkt/s':>16}{'新解码 pkt/s':>16}{'加速比':>10}")
+    for mode in (MODE_SHORT, MODE_LONG, MODE_CLUSTER, MODE_HIT):
+        frames = [make_frame(mode, rng) for _ in range(256)]
+        for frame in frames:  # 两种流程解码结果一致
+            assert tuple(legacy_decode(frame, mode).values()) == decode_frame(frame, mode).counts
+        before = rate(legacy_decode, frames, mode)
+        after = rate(decode_frame, frames, mode)
+        print(f"{mode:<8}{before:>16,.0f}{after:>16,.0f}{after / before:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
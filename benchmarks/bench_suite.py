@@ -0,0 +1,384 @@
+import argparse
+import datetime
+import importlib
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")  # 不需要显示器
+
+import numpy as np  # noqa: E402
+
+from bench_decode import make_frame  # noqa: E402
+from AcquisitionCore import AcquisitionCore  # noqa: E402
+from CRC16 import crc16_ccitt, crc16_check_batch  # noqa: E402
+from DataExport import SCurveStreamWriter, PeriodStreamWriter, export_columns_to_xlsx  # noqa: E402
+from Protocol import (decode_frame, build_instruction, CRC_OFFSET, FRAME_LENGTH, FRAME_SHORT, FRAME_LONG, FRAME_CLUSTER,  # noqa: E402
+                      FRAME_HIT, MODE_SHORT, MODE_LONG, MODE_CLUSTER, MODE_HIT)
+from SpectrumModel import HistogramModel  # noqa: E402
+from SpectrumStore import SpectrumStore  # noqa: E402
+
+# 可重复的采集流程基准测试：合成数据包，不需要硬件和显示器，结果保存为JSON，可与之前的结果比较
+# python benchmarks/bench_suite.py                          运行全部，结果保存到 benchmarks/results/
+# python benchmarks/bench_suite.py --filter decode --quick   只运行名称包含 decode 的基准，缩短测量时间
+# python benchmarks/bench_suite.py --compare benchmarks/results/旧结果.json --threshold 10
+
+MODES = {"short": MODE_SHORT, "long": MODE_LONG, "cluster": MODE_CLUSTER, "hit": MODE_HIT}  # 与 AcquireModeBox 的四种模式对应
+KINDS = {MODE_SHORT: FRAME_SHORT, MODE_LONG: FRAME_LONG, MODE_CLUSTER: FRAME_CLUSTER, MODE_HIT: FRAME_HIT}
+PERIOD_SIZES = (100, 1000)  # 周期采集的周期数
+SCURVE_SIZES = (200, 2000)  # S曲线扫描的步数
+CHANNELS = 32
+
+BENCHMARKS = []  # (名称, 建立函数, 单位)，建立函数返回 (run, cleanup)，run() 返回本次处理的数量
+
+
+def benchmark(name, unit):
+    def register(setup):
+        BENCHMARKS.append((name, setup, unit))
+        return setup
+    return register
+
+
+def frames_for(mode, n=256, seed=0):   # 带正确CRC的数据包，走完整的写入能谱存储流程
+    rng = random.Random(seed)
+    offset = CRC_OFFSET[KINDS[mode]]
+    frames = []
+    for _ in range(n):
+        frame = bytearray(make_frame(mode, rng))
+        frame[offset:offset + 2] = crc16_ccitt(frame[2:offset]).to_bytes(2, 'big')
+        if offset < FRAME_LENGTH - 2:  # 短包与事例击中CRC之后的字节与CRC最后一个字节相同
+            frame[offset + 2:] = frame[offset + 1:offset + 2] * (FRAME_LENGTH - offset - 2)
+        frames.append(bytes(frame))
+    return frames
+
+
+def _register_decode(key, mode):
+    @benchmark("decode.%s" % key, "pkt/s")
+    def decode():    # Protocol.decode_frame
+        frames = frames_for(mode)
+
+        def run():
+            for frame in frames:
+                decode_frame(frame, mode)
+            return len(frames)
+        return run, None
+
+    @benchmark("handle_frame.%s" % key, "pkt/s")
+    def handle_frame():  # 完整的 DataReceiveVerify：解码、CRC校验、写入能谱存储并更新能谱模型
+        frames = frames_for(mode)
+        core = AcquisitionCore(mode, retain_rows=100_000)
+
+        def run():
+            for frame in frames:
+                core.handle_frame(frame)
+            if core.store.total_rows > 50_000:  # 保留行数固定，避免测量受存储增长影响
+                core.store.clear()
+            return len(frames)
+        return run, None
+
+    @benchmark("handle_batch.%s" % key, "pkt/s")
+    def handle_batch():  # 接收线程合并的一批数据包：逐个解码，CRC按批校验后逐个分发
+        frames = frames_for(mode)
+        core = AcquisitionCore(mode, retain_rows=100_000)
+
+        def run():
+            core.handle_frames(frames)
+            if core.store.total_rows > 50_000:
+                core.store.clear()
+            return len(frames)
+        return run, None
+
+
+for _key, _mode in MODES.items():
+    _register_decode(_key, _mode)
+
+
+@benchmark("crc.instruction", "instr/s")
+def crc_instruction():  # InstrCRCverify：指令帧 [2:8] 的CRC
+    heads = [build_instruction(sn, 0X05, sn & 0XFFF)[:8] for sn in range(1, 257)]
+
+    def run():
+        for head in heads:
+            crc16_ccitt(head[2:8])
+        return len(heads)
+    return run, None
+
+
+@benchmark("crc.frame", "pkt/s")
+def crc_frame():    # 长包数据包 [2:136] 的CRC，每包134字节
+    frames = frames_for(MODE_LONG)
+
+    def run():
+        for frame in frames:
+            crc16_ccitt(frame[2:136])
+        return len(frames)
+    return run, None
+
+
+@benchmark("crc.frame_batch", "pkt/s")
+def crc_frame_batch():  # 同上，一批256个数据包向量化校验
+    frames = frames_for(MODE_LONG)
+
+    def run():
+        crc16_check_batch(frames, 136)
+        return len(frames)
+    return run, None
+
+
+@benchmark("encode.instruction", "instr/s")
+def encode_instruction():   # InstrCombination：命令码与命令参数的十六进制字符串组合为指令帧
+    core = AcquisitionCore()
+    commands = ["05%04X" % value for value in range(256)]
+
+    def run():
+        for command in commands:
+            value = int(command, 16)
+            core.instruction(value >> 16, value & 0XFFFF)
+        return len(commands)
+    return run, None
+
+
+@benchmark("histogram.update", "updates/s")
+def histogram_update():     # 能谱模型与能谱存储的更新
+    counts = [decode_frame(frame, MODE_SHORT).counts for frame in frames_for(MODE_SHORT)]
+    model = HistogramModel()
+    store = SpectrumStore(max_rows=100_000)
+
+    def run():
+        for row in counts:
+            store.append(row)
+            model.update(row)
+        if store.total_rows > 50_000:
+            store.clear()
+        return len(counts)
+    return run, None
+
+
+def _qt_app():
+    from PyQt5.QtWidgets import QApplication
+    return QApplication.instance() or QApplication(["bench_suite"])
+
+
+def _register_render(backend):
+    @benchmark("render.%s" % backend, "frames/s")
+    def render():   # 绘制一帧能谱图，数据每帧都变化
+        app = _qt_app()
+        if backend == 'pyqtgraph':
+            importlib.import_module('pyqtgraph')  # 没有安装时 create_spectrum_canvas 会退回QPainter，这里直接跳过
+        from SpectrumView import create_spectrum_canvas, CHANNEL_NAMES
+        canvas = create_spectrum_canvas(backend)
+        rng = np.random.default_rng(0)
+        spectra = [dict(zip(CHANNEL_NAMES, rng.integers(0, 65536, CHANNELS).tolist())) for _ in range(16)]
+        canvas.draw_bar_chart(spectra[0])
+        canvas.grab()   # 第一次绘制包括建立坐标轴
+
+        def run():
+            for spectrum in spectra:
+                canvas.draw_bar_chart(spectrum)
+                canvas.grab()   # 绘制到离屏图像，包括 paintEvent
+                app.processEvents()
+            return len(spectra)
+        return run, canvas.deleteLater
+
+
+for _backend in ('qpainter', 'pyqtgraph', 'matplotlib'):
+    _register_render(_backend)
+
+
+def _counts_block(rows, seed=0):
+    return np.random.default_rng(seed).integers(0, 65536, (rows, CHANNELS), dtype=np.uint32)
+
+
+def _register_export(periods, steps):
+    @benchmark("export.period_xlsx.%d" % periods, "periods/s")
+    def period_xlsx():  # 周期采集保存Excel，每个周期一列
+        directory = tempfile.mkdtemp(prefix="bench_")
+        path = os.path.join(directory, "period.xlsx")
+        block = _counts_block(periods)
+        titles = ["周期 %d" % (i + 1) for i in range(periods)]
+
+        def run():
+            if os.path.exists(path):
+                os.remove(path)
+            return export_columns_to_xlsx(path, block, titles)[0]
+        return run, lambda: shutil.rmtree(directory, ignore_errors=True)
+
+    @benchmark("export.period_csv.%d" % periods, "periods/s")
+    def period_csv():   # 周期采集逐周期追加到中间文件
+        directory = tempfile.mkdtemp(prefix="bench_")
+        path = os.path.join(directory, "period.xlsx")
+        block = _counts_block(periods).tolist()
+
+        def run():
+            writer = PeriodStreamWriter(path).open()
+            for i, row in enumerate(block):
+                writer.append_step(i + 1, row)
+            writer.close()
+            os.remove(writer.stream_path)
+            return len(block)
+        return run, lambda: shutil.rmtree(directory, ignore_errors=True)
+
+    @benchmark("export.scurve.%d" % steps, "steps/s")
+    def scurve():   # S曲线：逐步追加到中间文件，结束后转为Excel
+        directory = tempfile.mkdtemp(prefix="bench_")
+        path = os.path.join(directory, "scurve.xlsx")
+        block = _counts_block(steps).tolist()
+
+        def run():
+            if os.path.exists(path):
+                os.remove(path)
+            writer = SCurveStreamWriter(path).open()
+            for dac_value, row in enumerate(block):
+                writer.append_step(dac_value, row)
+            return writer.finalize()
+        return run, lambda: shutil.rmtree(directory, ignore_errors=True)
+
+
+for _periods, _steps in zip(PERIOD_SIZES, SCURVE_SIZES):
+    _register_export(_periods, _steps)
+
+
+def measure(run, min_time, repeats):    # 每轮至少运行 min_time 秒，返回每轮的速率
+    run()   # 预热
+    rates = []
+    for _ in range(repeats):
+        n = 0
+        start = time.perf_counter()
+        while True:
+            n += run()
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_time:
+                break
+        rates.append(n / elapsed)
+    return rates
+
+
+def git_revision():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True,
+                                timeout=10).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT, capture_output=True,
+                               text=True, timeout=30).stdout.strip() != ""
+    except (OSError, subprocess.SubprocessError):
+        return None, None
+    return commit or None, dirty
+
+
+def machine_info():
+    commit, dirty = git_revision()
+    return {
+        "timestamp": datetime.datetime.now().isoformat(timespec='seconds'),
+        "commit": commit,
+        "dirty": dirty,
+        "python": sys.version,
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "hostname": platform.node(),
+        "numpy": np.__version__,
+    }
+
+
+def run_suite(names=None, min_time=0.5, repeats=5, stream=sys.stdout):
+    results = {}
+    for name, setup, unit in BENCHMARKS:
+        if names is not None and not any(pattern in name for pattern in names):
+            continue
+        try:
+            run, cleanup = setup()
+        except ImportError as e:    # 缺少 PyQt5/pyqtgraph 等可选依赖时跳过
+            results[name] = {"unit": unit, "skipped": str(e)}
+            print("%-28s 跳过：%s" % (name, e), file=stream, flush=True)
+            continue
+        try:
+            rates = measure(run, min_time, repeats)
+        finally:
+            if cleanup is not None:
+                cleanup()
+        best = max(rates)
+        results[name] = {
+            "unit": unit,
+            "best": best,
+            "median": statistics.median(rates),
+            "stdev": statistics.stdev(rates) if len(rates) > 1 else 0.0,
+            "us_per_op": 1e6 / best,
+            "rates": rates,
+        }
+        print("%-28s %14.1f %-10s %10.2f us/op  (中位数 %.1f)" % (name, best, unit, 1e6 / best, statistics.median(rates)),
+              file=stream, flush=True)
+    return results
+
+
+def compare(current, baseline, threshold=10.0, stream=sys.stdout):  # 与之前的结果比较，返回变慢超过 threshold% 的基准
+    regressions = []
+    print("\n%-28s %14s %14s %9s" % ("基准", "之前", "现在", "变化"), file=stream)
+    for name, result in current["results"].items():
+        old = baseline.get("results", {}).get(name)
+        if old is None or "best" not in old or "best" not in result:
+            continue
+        change = (result["best"] / old["best"] - 1) * 100
+        flag = ""
+        if change < -threshold:
+            flag = "  变慢"
+            regressions.append(name)
+        print("%-28s %14.1f %14.1f %+8.1f%%%s" % (name, old["best"], result["best"], change, flag), file=stream)
+    old_machine, machine = baseline.get("machine", {}), current["machine"]
+    if (old_machine.get("hostname"), old_machine.get("python")) != (machine["hostname"], machine["python"]):
+        print("注意：两次结果不是在同一台机器或同一Python版本上测得", file=stream)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="采集流程基准测试，结果保存为JSON")
+    parser.add_argument("--filter", action="append", default=None, help="只运行名称包含该字符串的基准，可重复")
+    parser.add_argument("--min-time", type=float, default=0.5, help="每轮最短测量时间，s")
+    parser.add_argument("--repeats", type=int, default=5, help="测量轮数，取最好的一轮")
+    parser.add_argument("--quick", action="store_true", help="快速运行：每轮0.1s，3轮")
+    parser.add_argument("--output", default=None, help="结果JSON，默认 benchmarks/results/bench_<提交>_<时间>.json")
+    parser.add_argument("--compare", default=None, help="与之前保存的结果JSON比较")
+    parser.add_argument("--threshold", type=float, default=10.0, help="比较时变慢超过该百分比记为退化")
+    parser.add_argument("--list", action="store_true", help="只列出全部基准")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for name, _, unit in BENCHMARKS:
+            print("%-28s %s" % (name, unit))
+        return 0
+    if args.quick:
+        args.min_time, args.repeats = 0.1, 3
+
+    machine = machine_info()
+    results = run_suite(args.filter, args.min_time, args.repeats)
+    current = {"machine": machine, "settings": {"min_time": args.min_time, "repeats": args.repeats}, "results": results}
+
+    output = args.output
+    if output is None:
+        name = "bench_%s_%s.json" % (machine["commit"] or "unknown", datetime.datetime.now().strftime("%Y%m%d_%H%M%S"))
+        output = os.path.join(ROOT, "benchmarks", "results", name)
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as file:
+        json.dump(current, file, ensure_ascii=False, indent=2)
+    print("结果已保存到 %s" % output)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as file:
+            baseline = json.load(file)
+        if compare(current, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,42 @@
+import random
+
+import pytest
+
+from AcquisitionCore import AcquisitionCore, CRC_BATCH_MIN
+from CRC16 import crc16_ccitt
+from Protocol import CRC_OFFSET, FRAME_LENGTH, FRAME_SHORT, FRAME_LONG, FRAME_CLUSTER, FRAME_HIT, MODE_SHORT, MODE_LONG, MODE_CLUSTER, MODE_HIT
+
+KINDS = {MODE_SHORT: FRAME_SHORT, MODE_LONG: FRAME_LONG, MODE_CLUSTER: FRAME_CLUSTER, MODE_HIT: FRAME_HIT}
+
+
+def data_frame(mode, rng, crc_ok=True, sn=1, ack_code=0XF1):   # 随机计数的数据包，crc_ok 为 False 时CRC错误
+    offset = CRC_OFFSET[KINDS[mode]]
+    frame = bytearray(FRAME_LENGTH)
+    frame[0:6] = bytes([0XEB, 0X90, sn >> 8, sn & 0XFF, 1, ack_code])
+    frame[8:offset] = bytes(rng.randrange(1, 256) for _ in range(offset - 8))
+    crc = crc16_ccitt(frame[2:offset]) ^ (0 if crc_ok else 1)
+    frame[offset:offset + 2] = crc.to_bytes(2, 'big')
+    frame[offset + 2:] = frame[offset + 1:offset + 2] * (FRAME_LENGTH - offset - 2)  # 短包校验：CRC之后与CRC最后一个字节相同
+    return bytes(frame)
+
+
+@pytest.mark.parametrize("mode", list(KINDS))
+@pytest.mark.parametrize("n", [CRC_BATCH_MIN - 1, CRC_BATCH_MIN, 100])
+def test_handle_frames_matches_handle_frame(mode, n):
+    rng = random.Random(n)
+    frames = [data_frame(mode, rng, crc_ok=i % 4 != 0) for i in range(n)]
+    batch, single = AcquisitionCore(mode), AcquisitionCore(mode)
+    assert batch.handle_frames(frames) == n
+    for frame in frames:
+        single.handle_frame(frame)
+    assert batch.crc_errors == single.crc_errors == (n + 3) // 4
+    assert len(batch.store) == len(single.store) == n - (n + 3) // 4
+    assert (batch.store.last() == single.store.last()).all()
+
+
+def test_handle_frames_without_crc_check():
+    rng = random.Random(0)
+    core = AcquisitionCore(MODE_LONG, crc_check=False)
+    core.handle_frames([data_frame(MODE_LONG, rng, crc_ok=False) for _ in range(CRC_BATCH_MIN)])
+    assert core.crc_errors == 0
+    assert len(core.store) == CRC_BATCH_MIN
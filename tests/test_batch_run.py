@@ -0,0 +1,20 @@
+import json
+
+from BatchRun import main
+from BoardSimulator import BoardModel, SimulatorServer
+
+
+def test_scan_failure_is_reported_without_verbose(tmp_path, capsys):   # 不加 --verbose 时失败原因也打印到标准错误
+    config = tmp_path / "config.json"
+    config.write_text(json.dumps({"AcquireTime": "20", "AcquireMode": "短包"}), encoding='utf-8')
+    server = SimulatorServer(BoardModel(seed=1, sync_fail_rate=1.0), port=0, host='127.0.0.1').start()
+    try:
+        status = main([str(config), "--board", "127.0.0.1:%d" % server.socket.getsockname()[1], "--local-port", "0",
+                       "--no-configure", "--output", str(tmp_path / "scan.xlsx"),
+                       "scan", "--start", "200", "--step", "10", "--length", "50"])
+    finally:
+        server.stop()
+    out, err = capsys.readouterr()
+    assert status == 1
+    assert "S曲线扫描结束（failed）：探测器能谱采集工作异常，建议检查，停在第 1 步 DAC 200" in err
+    assert "探测器能谱采集工作异常" not in out
@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+
+from AcquisitionCore import AcquisitionCore, ack_accepted
+from BoardSimulator import BoardModel, SimulatorServer, build_data_frame
+from Correlator import RetryPolicy
+from DataExport import read_scurve_xlsx
+from Protocol import (build_instruction, ACK_OK, ACK_SN_GAP, ACK_BUSY, ACK_CRC_ERROR, ACK_INVALID, FRAME_SHORT,
+                      THRESHOLD_CHANNELS, CHANNEL_THRESHOLD_MAX)
+from ScanEngine import STATE_DONE
+
+FAST_RETRY = RetryPolicy(50, 20)  # 回环上的应答在1ms以内，丢包时尽快重发
+
+
+@pytest.fixture
+def simulator():    # simulator(board, **server_options) 在回环地址上启动模拟器，返回已连接的采集核心
+    started = []
+
+    def start(board=None, **options):
+        board = board if board is not None else BoardModel(seed=1)
+        server = SimulatorServer(board, port=0, host='127.0.0.1', seed=1, **options).start()
+        core = AcquisitionCore(policy=FAST_RETRY)
+        core.connect(('127.0.0.1', server.socket.getsockname()[1]), local_port=0, host='127.0.0.1')
+        started.append((server, core))
+        return core, board, server
+
+    yield start
+    for server, core in started:
+        core.close()
+        server.stop()
+
+
+def test_apply_trims_with_loss_and_reorder(simulator):
+    core, board, server = simulator(loss=0.1, reorder=0.2, latency_ms=1, jitter_ms=2)
+    table = np.random.default_rng(0).integers(0, CHANNEL_THRESHOLD_MAX + 1, THRESHOLD_CHANNELS, dtype=np.uint8)
+    finished = []
+    pipeline = core.apply_trims(table, on_finished=finished.append)
+    deadline = core.clock() + 20
+    while not finished and core.clock() < deadline:
+        core.process(0.005)
+    assert finished, "阈值微调表未在20s内下发完成"
+    assert (pipeline.succeeded, pipeline.failed) == (THRESHOLD_CHANNELS, 0)
+    assert board.trims == table.tolist()
+    assert server.dropped > 0     # 确实发生了丢包和重发
+    assert core.correlator.stats()["retries"] > 0
+
+
+def test_run_scan_xlsx_layout(simulator, tmp_path):
+    core, board, _ = simulator(BoardModel(seed=2, mu=300, mu_spread=5, sigma=5))
+    path = str(tmp_path / "scan.xlsx")
+    steps = range(250, 350, 10)
+    state, session = core.run_scan(steps, acquire_ms=2, xlsx_path=path)
+    assert state == STATE_DONE
+    assert session.error is None and session.steps == len(steps)
+    dac, counts = read_scurve_xlsx(path)    # 每一步一列，第一行为DAC值，其余每行一个通道
+    assert dac.tolist() == list(steps)
+    assert counts.shape == (len(steps), 32)
+    mean = board.pulse_rate * board.acquire_time / 10 / 1000
+    assert np.all(counts[0] > 0.9 * mean) and np.all(counts[-1] < 0.1 * mean)  # 下降的S曲线
+    total = counts.sum(axis=1)
+    assert total[0] > total[len(steps) // 2] > total[-1]
+
+
+def test_ack_accepted_codes():
+    assert [ack_accepted(code) for code in (ACK_OK, ACK_SN_GAP, ACK_BUSY, ACK_CRC_ERROR, ACK_INVALID)] == \
+        [True, True, True, True, False]
+
+
+def test_sn_gap_and_busy_replies_complete_the_command(simulator):
+    core, board, _ = simulator(BoardModel(seed=3, busy_rate=0.0))
+    assert core.wait(core.set_threshold(100), timeout=2)
+    core.sn += 5    # 指令帧序号不连续，应答 F2
+    assert core.wait(core.set_threshold(101), timeout=2)
+    assert board.acks[ACK_SN_GAP] == 1 and board.threshold == 101
+    board.busy_rate = 1.0   # 应答 F3
+    assert core.wait(core.set_threshold(102), timeout=2)
+    assert board.acks[ACK_BUSY] == 1
+
+
+def test_crc_error_and_invalid_replies(simulator):
+    core, board, _ = simulator()
+    data = bytearray(build_instruction(core.sn, 0X05, 200))
+    data[9] ^= 0XFF     # CRC错误，应答 F4
+    assert core.wait(core.send(bytes(data)), timeout=2)
+    assert board.acks[ACK_CRC_ERROR] == 1 and board.threshold != 200
+
+    future = core.command(0X09, 0)  # 无效指令，应答 F5，判为失败且不重发
+    assert not core.wait(future, timeout=2)
+    assert board.acks[ACK_INVALID] == 1
+    assert "F5" in future.error
+
+
+def test_data_frames_with_rejected_ack_code_are_not_stored():
+    core = AcquisitionCore()
+    core.handle_frame(build_data_frame(FRAME_SHORT, 1, [10] * 32, ack_code=ACK_BUSY))
+    core.handle_frame(build_data_frame(FRAME_SHORT, 2, [20] * 32, ack_code=ACK_INVALID))
+    assert len(core.store) == 1
+    assert core.store.last().tolist() == [10] * 32
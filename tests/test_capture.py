@@ -0,0 +1,28 @@
+import random
+
+from Capture import CaptureWriter, CaptureReplay, main
+from AcquisitionCore import AcquisitionCore
+from Protocol import MODE_LONG
+from test_acquisition_core import data_frame
+
+
+def write_capture(path, frames):
+    with CaptureWriter(str(path)) as writer:
+        for i, data in enumerate(frames):
+            writer.write(data, timestamp_ns=i * 1000)
+
+
+def test_replay_drops_rejected_ack_codes_and_crc_errors(tmp_path):   # 回放与在线接收相同：应答码未接受或CRC错误的数据包不写入能谱
+    rng = random.Random(3)
+    frames = [data_frame(MODE_LONG, rng, sn=i + 1) for i in range(10)]
+    frames += [data_frame(MODE_LONG, rng, sn=11, ack_code=0XF5), data_frame(MODE_LONG, rng, sn=12, crc_ok=False)]
+    path = tmp_path / "run.xcap"
+    write_capture(path, frames)
+
+    core = AcquisitionCore(MODE_LONG, retain_rows=None)
+    stats = CaptureReplay(str(path), core.handle_frame).run()
+    assert stats["frames"] == 12
+    assert core.store.total_rows == 10
+    assert core.crc_errors == 1
+
+    assert main([str(path), "--mode=" + MODE_LONG]) == 0
@@ -0,0 +1,63 @@
+import binascii
+import random
+
+import pytest
+
+from CRC16 import crc16_bitwise, crc16_ccitt, crc16_batch, crc16_check_batch
+from Protocol import build_instruction
+
+GOLDEN_VECTORS = (  # 标准向量及协议中常见的数据，期望值与 binascii.crc_hqx(data, 0XFFFF) 一致
+    (b'', 0XFFFF),
+    (b'123456789', 0X29B1),
+    (b'A', 0XB915),
+    (bytes(6), 0X0E10),
+    (bytes.fromhex('000100020100'), 0XF910),  # 指令帧 [2:8]
+    (bytes.fromhex('0001000502000400'), 0X8BA4),
+    (bytes(range(256)), 0X3FBD),
+    (b'\xFF' * 134, 0X07AE),  # 长包数据包 [2:136]
+)
+
+
+@pytest.mark.parametrize("data, expected", GOLDEN_VECTORS)
+def test_golden_vectors(data, expected):
+    assert crc16_bitwise(data) == expected  # 原 InstrCRCverify 的逐位实现
+    assert crc16_ccitt(data) == expected
+    assert binascii.crc_hqx(data, 0XFFFF) == expected  # 标准库中独立的 CRC-16/CCITT-FALSE 实现
+
+
+def test_table_matches_bitwise_on_random_data():
+    rng = random.Random(0)
+    for _ in range(500):
+        data = bytes(rng.randrange(256) for _ in range(rng.randrange(1, 200)))
+        assert crc16_ccitt(data) == crc16_bitwise(data), data.hex()
+
+
+def test_instruction_crc():  # 指令帧最后两个字节为 [2:8] 的CRC
+    instruction = build_instruction(1, 0X02, 0X0100)
+    assert instruction[8:] == crc16_bitwise(instruction[2:8]).to_bytes(2, 'big')
+
+
+def _frames(n, seed=0):  # 每三个数据包中一个CRC错误
+    rng = random.Random(seed)
+    frames = []
+    for i in range(n):
+        frame = bytes(rng.randrange(256) for _ in range(138))
+        if i % 3:
+            frame = frame[:136] + crc16_bitwise(frame[2:136]).to_bytes(2, 'big')
+        frames.append(frame)
+    return frames
+
+
+@pytest.mark.parametrize("start, end", [(2, 136), (2, 72), (2, 8), (3, 136)])   # 包括奇数个字节
+def test_batch_matches_bitwise(start, end):
+    frames = _frames(64)
+    assert [int(crc) for crc in crc16_batch(frames, start, end)] == [crc16_bitwise(f[start:end]) for f in frames]
+    assert [int(crc) for crc in crc16_batch(b''.join(frames), start, end)] == [crc16_bitwise(f[start:end]) for f in frames]
+
+
+def test_check_batch():
+    frames = _frames(64)
+    expected = [crc16_bitwise(f[2:136]) == int.from_bytes(f[136:138], 'big') for f in frames]
+    assert [bool(ok) for ok in crc16_check_batch(frames, 136)] == expected
+    assert [bool(ok) for ok in crc16_check_batch([memoryview(f) for f in frames], 136)] == expected
+    assert expected.count(False) == 22
@@ -0,0 +1,53 @@
+import pytest
+
+from DataExport import SCurveStreamWriter, PeriodStreamWriter, read_scurve_stream, read_scurve_xlsx, finalize_period_stream
+
+pytest.importorskip("openpyxl")
+
+
+def write_steps(path, steps):
+    with SCurveStreamWriter(str(path)) as writer:
+        for step in steps:
+            writer.append_step(step[0], step[1:])
+    return writer.stream_path
+
+
+STEPS = [[100, 5, 6, 13, 7], [102, 5, 6, 12, 8], [104, 4, 6, 11, 9]]
+
+
+@pytest.mark.parametrize("tail", ["102,5,6,12,", "102,5,6,1", "102,5,6,12,8", "1"])
+def test_truncated_last_line_is_dropped(tmp_path, tail):
+    stream_path = write_steps(tmp_path / "scan.xlsx", STEPS[:1])
+    with open(stream_path, 'a', encoding='utf-8') as file:
+        file.write(tail)
+    assert read_scurve_stream(stream_path) == STEPS[:1]
+
+
+def test_short_row_is_skipped(tmp_path):
+    stream_path = write_steps(tmp_path / "scan.xlsx", STEPS[:1])
+    with open(stream_path, 'a', encoding='utf-8', newline='') as file:
+        file.write("102,5,6\r\n")
+    with SCurveStreamWriter(str(tmp_path / "scan.xlsx")) as writer:
+        writer.append_step(STEPS[2][0], STEPS[2][1:])
+    assert read_scurve_stream(stream_path) == [STEPS[0], STEPS[2]]
+
+
+def test_finalize_keeps_finished_steps(tmp_path):
+    path = tmp_path / "scan.xlsx"
+    stream_path = write_steps(path, STEPS)
+    with open(stream_path, 'a', encoding='utf-8') as file:
+        file.write("106,3,5,1")
+    writer = SCurveStreamWriter(str(path))
+    assert writer.finalize() == 3
+    dac, counts = read_scurve_xlsx(str(path))
+    assert dac.tolist() == [100, 102, 104]
+    assert counts.tolist() == [step[1:] for step in STEPS]
+
+
+def test_period_stream(tmp_path):
+    path = tmp_path / "period.xlsx"
+    with PeriodStreamWriter(str(path)) as writer:
+        for i, step in enumerate(STEPS):
+            writer.append_step(i + 1, step[1:])
+    assert finalize_period_stream(str(path)) == 3
+    assert not (tmp_path / "period.period.csv").exists()
@@ -0,0 +1,59 @@
+import math
+import random
+
+import pytest
+
+from Instrumentation import HdrHistogram
+
+
+def boundary_values(histogram):   # 各段起点、段内桶边界及其两侧的数值
+    values = set(range(0, 2 * histogram.sub_bucket_count + 2))
+    for bits in range(histogram.sub_bucket_bits, histogram.max_value.bit_length() + 1):
+        for sub in (0, 1, histogram.half_count - 1):
+            edge = (histogram.half_count + sub) << (bits - histogram.sub_bucket_bits + 1)
+            values.update((edge - 1, edge, edge + 1))
+    return sorted(v for v in values if v <= histogram.max_value)
+
+
+@pytest.mark.parametrize("sub_bucket_bits", [3, 7])
+def test_bucket_bounds_contain_value(sub_bucket_bits):
+    histogram = HdrHistogram(sub_bucket_bits)
+    relative_error = 2.0 ** -(sub_bucket_bits - 1)
+    previous = -1
+    for value in boundary_values(histogram):
+        index = histogram._index(value)
+        low, high = histogram._bounds(index)
+        assert low <= value < high, (value, index, low, high)
+        assert index >= previous    # 桶序号随数值单调不减
+        previous = index
+        if value >= histogram.sub_bucket_count:
+            assert (high - low) / low <= relative_error
+    assert histogram._index(histogram.max_value) == len(histogram.buckets) - 1
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_percentiles_within_relative_error(seed):
+    rng = random.Random(seed)
+    values = [int(rng.lognormvariate(10, 2)) for _ in range(20000)] + [rng.randrange(200) for _ in range(2000)]
+    histogram = HdrHistogram()
+    for value in values:
+        histogram.record(value)
+    values.sort()
+    ps = (1, 10, 50, 90, 99, 99.9, 100)
+    result = histogram.percentiles(ps)
+    relative_error = 2.0 ** -(histogram.sub_bucket_bits - 1)
+    for p in ps:
+        exact = values[max(1, math.ceil(p / 100 * len(values))) - 1]
+        assert exact <= result[p] <= exact * (1 + relative_error), (p, exact, result[p])
+        assert histogram.percentile(p) == result[p]
+    assert histogram.min == values[0] and histogram.max == values[-1] and histogram.count == len(values)
+
+
+def test_small_values_are_exact_and_large_values_are_clamped():
+    histogram = HdrHistogram()
+    for value in (3, 3, 5, 100):
+        histogram.record(value)
+    assert histogram.percentiles((25, 50, 75, 100)) == {25: 3, 50: 3, 75: 5, 100: 100}
+    histogram.record(1 << 60)
+    assert histogram.max == histogram.max_value
+    assert histogram.percentile(100) == histogram.max_value
@@ -0,0 +1,66 @@
+from LogModel import LogModel, format_record, LOG_COMM, LOG_SPEC, LOG_INFO, LOG_ERROR, LOG_RAW_DATA
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        self.now += 1.0
+        return self.now
+
+
+def test_consecutive_duplicates_are_collapsed():
+    log = LogModel(clock=FakeClock())
+    first = log.write("CRC校验失败", LOG_ERROR)
+    assert log.write("CRC校验失败", LOG_ERROR) is first
+    assert log.write("CRC校验失败", LOG_ERROR) is first
+    assert first.count == 3 and first.timestamp == 1003.0  # 时间为最近一次出现
+    assert format_record(first) == "CRC校验失败 ×3"
+
+    log.write("CRC校验失败", LOG_ERROR, LOG_COMM)   # 显示位置不同，不合并
+    log.write("阈值配置成功")
+    log.write("CRC校验失败", LOG_ERROR)  # 不连续，不合并
+    records, lost = log.since(0)
+    assert [(r.message, r.count) for r in records] == [("CRC校验失败", 3), ("CRC校验失败", 1), ("阈值配置成功", 1), ("CRC校验失败", 1)]
+    assert lost == 0
+    assert log.stats()["written"] == 4 and log.stats()["collapsed"] == 2
+
+
+def test_since_reports_records_lost_to_capacity():
+    log = LogModel(capacity=10)
+    for i in range(25):
+        log.write("消息 %d" % i)
+    records, lost = log.since(0)
+    assert [r.message for r in records] == ["消息 %d" % i for i in range(15, 25)]
+    assert lost == 15
+
+    records, lost = log.since(12)   # 视图已显示到第12条，13-15已被丢弃
+    assert records[0].seq == 16 and lost == 3
+    records, lost = log.since(20)
+    assert [r.seq for r in records] == [21, 22, 23, 24, 25] and lost == 0
+    assert log.since(25) == ([], 0)
+
+
+def test_since_filters_by_target():
+    log = LogModel()
+    log.write("通信", targets=LOG_COMM)
+    log.write("能谱", targets=LOG_SPEC)
+    log.write("两处")
+    assert [r.message for r in log.since(0, LOG_SPEC)[0]] == ["能谱", "两处"]
+
+
+def test_disabled_category_is_suppressed():
+    log = LogModel()
+    assert not log.wants(LOG_RAW_DATA)  # 数据包原文默认不显示
+    assert log.write(b'\xEB\x90', LOG_RAW_DATA) is None
+    log.set_enabled(LOG_INFO, False)
+    assert log.write("提示") is None
+    assert log.write("提示") is None
+    log.write("错误", LOG_ERROR)
+    assert [r.message for r in log.since(0)[0]] == ["错误"]
+    assert log.stats()["suppressed"][LOG_INFO] == 2 and log.stats()["suppressed"][LOG_RAW_DATA] == 1
+
+    log.set_enabled(LOG_INFO, True)
+    log.write("提示")
+    assert [r.message for r in log.since(0)[0]] == ["错误", "提示"]
@@ -0,0 +1,101 @@
+import os
+import random
+from itertools import count
+
+import numpy as np
+import pytest
+
+from Protocol import build_instruction, decode_frame, AckFrame, ACK_OK, FRAME_ACK, FRAME_SHORT, MODE_SHORT
+from RunJournal import (RunJournal, JournalReader, index_path, main, REC_SEND, REC_ACK, REC_DATA, REC_STEP, REC_NOTE,
+                        _INDEX, INDEX_MAGIC)
+from test_acquisition_core import data_frame
+
+START_NS = 1_000_000_000
+STEP_NS = 1_000_000  # 每条记录间隔1ms
+
+
+def write_journal(path, n=100, index_every=8):    # 依次写入指令、应答、数据包、扫描步，第 i 条记录的时间为 START_NS + (i+1)*STEP_NS
+    ticks = count(START_NS, STEP_NS)   # 第一个值为打开时的时间
+    frame = data_frame(MODE_SHORT, random.Random(0))
+    with RunJournal(str(path), index_every=index_every, clock=lambda: next(ticks)) as journal:
+        journal.note("配置")
+        for i in range(n - 1):
+            kind = i % 4
+            if kind == 0:
+                journal.send(build_instruction(i + 1, 0X02, i), resend=i % 8 == 0)
+            elif kind == 1:
+                journal.ack(AckFrame(FRAME_ACK, i, 1, ACK_OK, 5, 0))
+            elif kind == 2:
+                journal.data(frame, FRAME_SHORT, True)
+            else:
+                journal.step(i, 200 + i, np.arange(32))
+    return frame
+
+
+def test_round_trip(tmp_path):
+    path = tmp_path / "run.xjrn"
+    frame = write_journal(path)
+    reader = JournalReader(str(path))
+    records = list(reader)
+    assert len(records) == 100
+    assert [r.timestamp_ns for r in records] == [START_NS + (i + 1) * STEP_NS for i in range(100)]
+    assert records[0].type == REC_NOTE and records[0].value.text == "配置"
+    send, ack, data, step = records[1:5]
+    assert send.type == REC_SEND and send.value.sn == 1 and send.value.command == 0X02 and send.value.resend
+    assert ack.type == REC_ACK and ack.value.sn == 1 and ack.value.ack_code == 0XF1
+    assert data.type == REC_DATA and data.value.kind == FRAME_SHORT and data.value.crc_ok and data.value.data == frame
+    assert data.value.counts == decode_frame(frame, MODE_SHORT).counts
+    assert step.type == REC_STEP and step.value.dac == 203 and step.value.counts.tolist() == list(range(32))
+    assert len(reader.index_times) == 100 // 8 + 1
+
+
+def test_time_range_query_uses_index(tmp_path):
+    path = tmp_path / "run.xjrn"
+    write_journal(path)
+    reader = JournalReader(str(path))
+    records = list(reader.between(0.0505, 0.0605))  # 第50-59条
+    assert [r.timestamp_ns for r in records] == [START_NS + i * STEP_NS for i in range(51, 61)]
+    assert reader.index_times[6] <= records[0].timestamp_ns < reader.index_times[7]  # 从第7项索引开始读取，而不是从头读
+    steps = list(reader.between(0.0505, 0.0605, {REC_STEP}))
+    assert [r.value.step for r in steps] == [51, 55]
+    assert all(r.type == REC_STEP for r in steps)
+
+
+def test_truncated_last_record_is_ignored(tmp_path):
+    path = tmp_path / "run.xjrn"
+    write_journal(path)
+    size = os.path.getsize(path)
+    with open(path, 'r+b') as file:
+        file.truncate(size - 10)    # 最后一条是扫描步，载荷被截断
+    records = list(JournalReader(str(path)))
+    assert len(records) == 99
+    with open(path, 'r+b') as file:
+        file.truncate(records[-1].offset + 5)   # 记录头被截断
+    assert len(list(JournalReader(str(path)))) == 98
+
+
+@pytest.mark.parametrize("damage", ["missing", "bad_magic", "past_end"])
+def test_missing_or_damaged_index_is_rebuilt(tmp_path, damage):
+    path = tmp_path / "run.xjrn"
+    write_journal(path)
+    expected = [(r.timestamp_ns, r.offset) for r in JournalReader(str(path)).between(0.0305, 0.0405)]
+    if damage == "missing":
+        os.remove(index_path(str(path)))
+    elif damage == "bad_magic":
+        with open(index_path(str(path)), 'r+b') as file:
+            file.write(b'?')
+    else:   # 索引项全部指向文件之外
+        with open(index_path(str(path)), 'wb') as file:
+            file.write(INDEX_MAGIC + _INDEX.pack(START_NS, 1 << 40))
+    reader = JournalReader(str(path))
+    assert reader.index_offsets[0] == reader.data_offset and len(reader.index_offsets) == 1  # 重建时每1024条取一项
+    assert [(r.timestamp_ns, r.offset) for r in reader.between(0.0305, 0.0405)] == expected
+
+
+def test_cli(tmp_path, capsys):
+    path = tmp_path / "run.xjrn"
+    write_journal(path)
+    assert main([str(path), "--type", "step", "note", "--count"]) == 0
+    assert "step 24 条，note 1 条" in capsys.readouterr().out
+    with pytest.raises(SystemExit):
+        main([str(path), "--type", "acks"])
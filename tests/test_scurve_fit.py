@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from SCurveFit import fit_scurves, scurve_model, compute_trims
+
+
+def noisy_scan(seed, amplitude=1000, sigma=8.0, falling=True, dac=None, mu_range=(0, 500), channels=32):
+    rng = np.random.default_rng(seed)
+    dac = np.arange(0, 501, 2, dtype=np.float64) if dac is None else dac
+    mu = rng.uniform(*mu_range, channels)
+    clean = np.stack([scurve_model(dac, amplitude, m, sigma, falling) for m in mu], axis=1)
+    return dac, rng.poisson(clean), mu
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_poisson_noise_trusted_channels_are_accurate(seed):  # 1000计数、σ=8、DAC 0~500 步长2
+    dac, counts, mu = noisy_scan(seed)
+    result = fit_scurves(dac, counts)
+    error = np.abs(result.mu - mu)
+    assert not (result.ok & (error > 2)).any()
+    inner = (mu > dac[0] + 30) & (mu < dac[-1] - 30)   # 两侧平台都在扫描范围内的通道应当全部可信
+    assert result.ok[inner].all()
+    assert np.all(np.abs(result.sigma[result.ok] - 8) < 2)
+    assert np.all((result.mu >= dac[0]) & (result.mu <= dac[-1]))
+
+
+@pytest.mark.parametrize("falling", [True, False])
+@pytest.mark.parametrize("amplitude, sigma", [(50, 8.0), (1000, 1.0), (1000, 30.0)])
+def test_poisson_noise_other_shapes(falling, amplitude, sigma):
+    for seed in range(3):
+        dac, counts, mu = noisy_scan(seed, amplitude, sigma, falling)
+        result = fit_scurves(dac, counts)
+        error = np.abs(result.mu - mu)
+        assert not (result.ok & (error > 3)).any()
+        assert result.ok.mean() > 0.6
+
+
+def test_nonuniform_steps():    # 自适应扫描的步长不均匀
+    rng = np.random.default_rng(1)
+    dac = np.unique(np.concatenate([np.arange(0, 501, 20.0), rng.uniform(0, 500, 80).round()]))
+    dac, counts, mu = noisy_scan(1, dac=dac, mu_range=(60, 440))
+    result = fit_scurves(dac, counts)
+    assert result.ok.mean() > 0.8
+    assert np.all(np.abs(result.mu - mu)[result.ok] <= 2)
+
+
+def test_degenerate_channels_are_not_trusted():
+    dac, counts, _ = noisy_scan(0, mu_range=(200, 300), channels=4)
+    counts[:, 0] = 0                                    # 死通道
+    counts[:, 1] = np.random.default_rng(0).poisson(1000, len(dac))  # 没有下降沿
+    counts[:, 2] = np.random.default_rng(1).poisson(3, len(dac))     # 只有噪声
+    result = fit_scurves(dac, counts)
+    assert result.ok.tolist() == [False, False, False, True]
+    assert np.all(np.isfinite(result.mu))
+
+
+def test_untrusted_channels_keep_their_trims():
+    dac, counts, _ = noisy_scan(2, mu_range=(100, 400), channels=8)
+    counts[:, 3] = 0
+    result = fit_scurves(dac, counts)
+    current = np.arange(8) + 10
+    trims, _ = compute_trims(result.mu, result.ok, current=current)
+    assert not result.ok[3]
+    assert trims[3] == current[3]
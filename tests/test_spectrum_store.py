@@ -0,0 +1,28 @@
+from SpectrumStore import SpectrumStore
+
+
+def test_drop_reported_once_and_clear_resets_counters():
+    drops = []
+    store = SpectrumStore(channels=4, chunk_rows=8, max_rows=16)
+    store.on_drop = drops.append
+    for i in range(100):
+        store.append([i, 0, 0, 0])
+    assert drops == [16]
+    assert store.dropped_rows == store.total_rows - len(store) > 0
+    assert store.last()[0] == 99
+
+    store.clear()
+    assert (store.spilled_rows, store.dropped_rows, store.total_rows) == (0, 0, 0)
+    for i in range(100):
+        store.append([i, 0, 0, 0])
+    assert drops == [16, 16]
+
+
+def test_spill_instead_of_drop(tmp_path):
+    drops = []
+    store = SpectrumStore(channels=4, chunk_rows=8, max_rows=16, spill_path=str(tmp_path / "spill"))
+    store.on_drop = drops.append
+    for i in range(100):
+        store.append([i, 0, 0, 0])
+    assert drops == []
+    assert store.spilled_rows == store.total_rows - len(store) > 0
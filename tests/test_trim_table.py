@@ -0,0 +1,49 @@
+import json
+
+import numpy as np
+import pytest
+
+from Protocol import THRESHOLD_CHANNELS, CHANNEL_THRESHOLD_MAX
+from TrimTable import load_trim_table, save_trim_table
+
+
+@pytest.mark.parametrize("ext", [".json", ".csv", ".npy"])
+def test_round_trip(tmp_path, ext):
+    table = np.random.default_rng(0).integers(0, CHANNEL_THRESHOLD_MAX + 1, THRESHOLD_CHANNELS, dtype=np.uint8)
+    path = str(tmp_path / ("trims" + ext))
+    save_trim_table(path, table)
+    loaded = load_trim_table(path)
+    assert loaded.dtype == np.uint8
+    assert np.array_equal(loaded, table)
+
+
+def test_json_channel_dict(tmp_path):  # 未给出的通道为0
+    path = tmp_path / "trims.json"
+    path.write_text(json.dumps({"1": 3, "64": 7}), encoding='utf-8')
+    table = load_trim_table(str(path))
+    assert table[0] == 3 and table[63] == 7 and table[1:63].sum() == 0
+
+
+def test_csv_single_column(tmp_path):  # 每行一个阈值，按通道号顺序
+    path = tmp_path / "trims.csv"
+    path.write_text("trim\n" + "\n".join(str(i % 32) for i in range(THRESHOLD_CHANNELS)) + "\n", encoding='utf-8')
+    assert load_trim_table(str(path)).tolist() == [i % 32 for i in range(THRESHOLD_CHANNELS)]
+
+
+@pytest.mark.parametrize("channel", [0, 65, -1])
+def test_bad_channel_numbers(tmp_path, channel):
+    json_path = tmp_path / "trims.json"
+    json_path.write_text(json.dumps({str(channel): 5}), encoding='utf-8')
+    with pytest.raises(ValueError, match="通道号 %d" % channel):
+        load_trim_table(str(json_path))
+    csv_path = tmp_path / "trims.csv"
+    csv_path.write_text("channel,trim\n1,2\n%d,5\n" % channel, encoding='utf-8')
+    with pytest.raises(ValueError, match="通道号 %d" % channel):
+        load_trim_table(str(csv_path))
+
+
+def test_trim_out_of_range(tmp_path):
+    path = tmp_path / "trims.json"
+    path.write_text(json.dumps({"3": CHANNEL_THRESHOLD_MAX + 1}), encoding='utf-8')
+    with pytest.raises(ValueError):
+        load_trim_table(str(path))